@@ -21,6 +21,7 @@ def check_env_vars():
         'DATABASE_URL',
         'WEBSITE_URL',
         'BOT_API_KEY',
+        'STATE_BACKEND',
     ]
 
     missing_required = []
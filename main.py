@@ -1,11 +1,20 @@
 import os
 import json
 import time
+import abc
 import asyncio
+import bisect
 import datetime
+import heapq
 import random
 import string
 import sys
+import sqlite3
+import threading
+import concurrent.futures
+import contextlib
+from collections import OrderedDict, deque
+from queue import SimpleQueue
 from typing import Dict, Any, Optional, List
 
 
@@ -93,6 +102,20 @@ async def init_db():
             """)
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_linked_discord ON linked_accounts(discord_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_linked_minecraft ON linked_accounts(minecraft_name)")
+            # Case-insensitive reverse lookups: a stored lowercase column where the server
+            # supports generated columns (PG 12+), otherwise an expression index on LOWER()
+            global LINK_LOWER_COLUMN
+            try:
+                await conn.execute(
+                    "ALTER TABLE linked_accounts ADD COLUMN IF NOT EXISTS minecraft_name_lower TEXT "
+                    "GENERATED ALWAYS AS (LOWER(minecraft_name)) STORED"
+                )
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_linked_minecraft_lower ON linked_accounts(minecraft_name_lower)")
+                LINK_LOWER_COLUMN = True
+            except Exception as e:
+                print(f"minecraft_name_lower column unavailable, using expression index: {e}")
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_linked_minecraft_lower_expr ON linked_accounts(LOWER(minecraft_name))")
+                LINK_LOWER_COLUMN = False
 
             # Create discord_notifications table for bot notifications
             await conn.execute("""
@@ -111,6 +134,31 @@ async def init_db():
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_discord_notifications_processed ON discord_notifications(processed)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_discord_notifications_created ON discord_notifications(created_at)")
 
+            # Pending link codes; the expiry index keeps the janitor's purge a range scan
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_codes (
+                    id BIGSERIAL PRIMARY KEY,
+                    discord_id BIGINT NOT NULL,
+                    code TEXT NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    used BOOLEAN DEFAULT FALSE
+                )
+            """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_codes_expires ON pending_codes(expires_at)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_codes_discord ON pending_codes(discord_id)")
+
+            # Upserts on tests merge on (username_lower, gamemode)
+            try:
+                with open(TESTS_MIGRATION_FILE, "r", encoding="utf-8") as f:
+                    migration = f.read()
+                async with conn.transaction():
+                    await conn.execute(migration)
+                TESTS_KEYED_UPSERT["postgres"] = True
+            except Exception as e:
+                print(f"ERROR: applying {TESTS_MIGRATION_FILE} failed: {e}")
+                print("ERROR: tests has no (username_lower, gamemode) key; test results are written with lookup + update/insert")
+
         print("Database initialized successfully!")
     except Exception as e:
         print(f"Failed to initialize database: {e}")
@@ -122,12 +170,193 @@ async def close_db():
     if db_pool:
         await db_pool.close()
 
+# =========================
+# CIRCUIT BREAKERS
+# =========================
+
+BREAKER_WINDOW_SECONDS = 60  # rolling window for the error rate
+BREAKER_MIN_CALLS = 5  # calls in the window before the error rate counts
+BREAKER_ERROR_RATE = 0.5  # open when at least this share of calls failed
+BREAKER_OPEN_SECONDS = 10  # first cool-off; doubles after each failed probe
+BREAKER_MAX_OPEN_SECONDS = 300
+BREAKER_PROBE_TIMEOUT = 30  # a half-open probe that never reports back is given up after this
+
+
+class CircuitBreaker:
+    """
+    Per-backend breaker. Closed: calls pass and outcomes go into a rolling window.
+    Open: allow() is False so fallback chains skip the backend immediately.
+    After a jittered, exponentially growing cool-off one probe call is let
+    through (half-open); its outcome closes the breaker or reopens it for longer.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self._window = deque()  # (timestamp, ok)
+        self._failures = 0
+        self._open_count = 0
+        self._retry_at = 0.0
+        self._probe_started = 0.0
+        self.skipped = 0
+
+    def _trim(self, now: float) -> None:
+        while self._window and self._window[0][0] < now - BREAKER_WINDOW_SECONDS:
+            _, ok = self._window.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now >= self._retry_at:
+            self.state = "half_open"
+            self._probe_started = now
+            print(f"[Breaker] {self.name} half-open, probing")
+            return True
+        if self.state == "half_open" and now - self._probe_started > BREAKER_PROBE_TIMEOUT:
+            self._probe_started = now
+            return True
+        self.skipped += 1
+        return False
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        if self.state != "closed":
+            print(f"[Breaker] {self.name} closed")
+            self.state = "closed"
+            self._open_count = 0
+            self._window.clear()
+            self._failures = 0
+        self._window.append((now, True))
+        self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        self._window.append((now, False))
+        self._failures += 1
+        self._trim(now)
+        if self.state == "half_open":
+            self._open(now)
+        elif self.state == "closed" and len(self._window) >= BREAKER_MIN_CALLS \
+                and self._failures / len(self._window) >= BREAKER_ERROR_RATE:
+            self._open(now)
+
+    def record_status(self, status: int) -> None:
+        """HTTP outcome: 5xx means the backend is unhealthy, anything else means it answered."""
+        if status >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def _open(self, now: float) -> None:
+        delay = min(BREAKER_OPEN_SECONDS * (2 ** self._open_count), BREAKER_MAX_OPEN_SECONDS)
+        delay *= random.uniform(0.5, 1.0)  # jitter so probes from restarts don't line up
+        self._open_count += 1
+        self._retry_at = now + delay
+        self.state = "open"
+        print(f"[Breaker] {self.name} open for {delay:.1f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "state": self.state,
+            "window_calls": len(self._window),
+            "window_failures": self._failures,
+            "skipped": self.skipped,
+            "retry_in": max(0.0, round(self._retry_at - time.monotonic(), 1)) if self.state == "open" else 0.0,
+        }
+
+
+POSTGRES_BREAKER = CircuitBreaker("postgres")
+SUPABASE_BREAKER = CircuitBreaker("supabase")
+WEBSITE_BREAKER = CircuitBreaker("website")
+MINECRAFT_BREAKER = CircuitBreaker("minecraft")
+BREAKERS = [POSTGRES_BREAKER, SUPABASE_BREAKER, WEBSITE_BREAKER, MINECRAFT_BREAKER]
+
+POSTGRES_RETRY_ATTEMPTS = 3  # tries per call when the connection (not the query) fails
+POSTGRES_RETRY_BASE_SECONDS = 0.2  # backoff cap before the first retry; doubles each time, full jitter
+
+
+def _pg_transient(e: BaseException) -> bool:
+    """Connection-level failures say the database is unhealthy; errors in the query itself don't."""
+    if isinstance(e, (OSError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    return asyncpg is not None and isinstance(
+        e, (asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError, asyncpg.TooManyConnectionsError)
+    )
+
+
+async def pg_call(op):
+    """
+    Run await op(conn) on a pooled connection under POSTGRES_BREAKER. Transient failures
+    count against the breaker and are retried with jittered exponential backoff; any other
+    error (constraint violation, bad SQL) means the server answered, so it is re-raised
+    without tripping the breaker. Callers check POSTGRES_BREAKER.allow() first.
+    """
+    for attempt in range(POSTGRES_RETRY_ATTEMPTS):
+        try:
+            async with db_pool.acquire() as conn:
+                result = await op(conn)
+        except Exception as e:
+            if not _pg_transient(e):
+                POSTGRES_BREAKER.record_success()
+                raise
+            POSTGRES_BREAKER.record_failure()
+            if attempt + 1 >= POSTGRES_RETRY_ATTEMPTS or not POSTGRES_BREAKER.allow():
+                raise
+            await asyncio.sleep(random.uniform(0, POSTGRES_RETRY_BASE_SECONDS * (2 ** attempt)))
+            continue
+        POSTGRES_BREAKER.record_success()
+        return result
+
+
+# =========================
+# SHARED HTTP CLIENT
+# =========================
+
+HTTP_POOL_LIMIT = 100  # total pooled connections
+HTTP_POOL_LIMIT_PER_HOST = 20  # per host (Supabase, website, notifications API)
+HTTP_KEEPALIVE_SECONDS = 60  # idle connections stay open this long for reuse
+HTTP_DNS_CACHE_SECONDS = 300
+
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Create the long-lived client session (call once from main, inside the bot's loop)."""
+    global _http_session_loop
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+    )
+    _http_session_loop = asyncio.get_running_loop()
+    return aiohttp.ClientSession(connector=connector)
+
+
+@contextlib.asynccontextmanager
+async def pooled_session():
+    """
+    Yield the shared session so requests reuse pooled keep-alive connections.
+    Callers on a different event loop (the sync wrappers) get a throwaway session,
+    since a session is bound to the loop it was created in.
+    """
+    if http_session is not None and not http_session.closed and asyncio.get_running_loop() is _http_session_loop:
+        yield http_session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+
 # =========================
 # Supabase REST API Helpers
 # =========================
 
-async def supabase_select(table: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-    """Select rows from a table using Supabase REST API"""
+async def supabase_select(table: str, filters: Dict[str, Any] = None, raw_params: Dict[str, str] = None) -> List[Dict[str, Any]]:
+    """Select rows from a table using Supabase REST API (raw_params are passed through, e.g. select/limit/offset)"""
     if not USE_SUPABASE_API:
         return []
 
@@ -136,20 +365,28 @@ async def supabase_select(table: str, filters: Dict[str, Any] = None) -> List[Di
     if filters:
         for key, value in filters.items():
             params[key] = f"eq.{value}"
+    if raw_params:
+        params.update(raw_params)
+
+    if not SUPABASE_BREAKER.allow():
+        return []
 
     try:
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=supabase_headers, params=params) as resp:
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+        async with pooled_session() as session:
+            async with session.get(url, headers=supabase_headers, params=params, timeout=timeout) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
                 if resp.status == 200:
                     return await resp.json()
                 else:
                     print(f"Supabase select error: {resp.status} - {await resp.text()}")
                     return []
     except asyncio.TimeoutError:
+        SUPABASE_BREAKER.record_failure()
         print("Supabase select timeout")
         return []
     except Exception as e:
+        SUPABASE_BREAKER.record_failure()
         print(f"Supabase select exception: {e}")
         return []
 
@@ -160,9 +397,13 @@ async def supabase_insert(table: str, data: Dict[str, Any]) -> bool:
 
     url = f"{SUPABASE_URL}/rest/v1/{table}"
 
+    if not SUPABASE_BREAKER.allow():
+        return False
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=supabase_headers, json=data) as resp:
+        async with pooled_session() as session:
+            async with session.post(url, headers=supabase_headers, json=data, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
                 if resp.status in (200, 201):
                     return True
                 else:
@@ -172,27 +413,46 @@ async def supabase_insert(table: str, data: Dict[str, Any]) -> bool:
                         return await supabase_upsert(table, data)
                     return False
     except Exception as e:
+        SUPABASE_BREAKER.record_failure()
         print(f"Supabase insert exception: {e}")
         return False
 
-async def supabase_upsert(table: str, data: Dict[str, Any]) -> bool:
-    """Upsert a row into a table using Supabase REST API"""
+# (table, on_conflict) pairs PostgREST rejected for lack of a matching unique index
+SUPABASE_MISSING_CONFLICT_KEYS: set = set()
+
+
+async def supabase_upsert(table: str, data: Any, on_conflict: Optional[str] = None) -> bool:
+    """
+    Upsert one row (dict) or many (list) using Supabase REST API.
+    on_conflict names the unique columns to merge on (e.g. "username,gamemode");
+    without it PostgREST merges on the primary key.
+    """
     if not USE_SUPABASE_API:
         return False
 
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     headers = supabase_headers.copy()
-    headers["Prefer"] = "resolution=merge-duplicates"
+    headers["Prefer"] = "resolution=merge-duplicates,return=minimal"
+    params = {"on_conflict": on_conflict} if on_conflict else None
+
+    if not SUPABASE_BREAKER.allow():
+        return False
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=data) as resp:
+        async with pooled_session() as session:
+            async with session.post(url, headers=headers, json=data, params=params, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
                 if resp.status in (200, 201):
                     return True
-                else:
-                    print(f"Supabase upsert error: {resp.status} - {await resp.text()}")
-                    return False
+                body = await resp.text()
+                print(f"Supabase upsert error: {resp.status} - {body}")
+                if on_conflict and ("42P10" in body or "42703" in body):
+                    # 42P10: no unique index on the conflict columns; 42703: a conflict column doesn't exist
+                    SUPABASE_MISSING_CONFLICT_KEYS.add((table, on_conflict))
+                    print(f"ERROR: [Supabase] {table} has no unique key on ({on_conflict})")
+                return False
     except Exception as e:
+        SUPABASE_BREAKER.record_failure()
         print(f"Supabase upsert exception: {e}")
         return False
 
@@ -206,69 +466,108 @@ async def supabase_update(table: str, data: Dict[str, Any], filters: Dict[str, A
     for key, value in filters.items():
         params[key] = f"eq.{value}"
 
+    if not SUPABASE_BREAKER.allow():
+        return False
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=supabase_headers, json=data, params=params) as resp:
+        async with pooled_session() as session:
+            async with session.patch(url, headers=supabase_headers, json=data, params=params, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
                 if resp.status in (200, 204):
                     return True
                 else:
                     print(f"Supabase update error: {resp.status} - {await resp.text()}")
                     return False
     except Exception as e:
+        SUPABASE_BREAKER.record_failure()
         print(f"Supabase update exception: {e}")
         return False
 
-async def supabase_delete(table: str, filters: Dict[str, Any]) -> bool:
-    """Delete rows from a table using Supabase REST API"""
+async def supabase_delete(table: str, filters: Dict[str, Any] = None, raw_params: Dict[str, str] = None) -> bool:
+    """Delete rows from a table using Supabase REST API (raw_params are passed through as PostgREST filters)"""
     if not USE_SUPABASE_API:
         return False
 
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     params = {}
-    for key, value in filters.items():
+    for key, value in (filters or {}).items():
         params[key] = f"eq.{value}"
+    if raw_params:
+        params.update(raw_params)
+    if not params:
+        print(f"Supabase delete on {table} refused: no filters")
+        return False
+
+    if not SUPABASE_BREAKER.allow():
+        return False
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=supabase_headers, params=params) as resp:
+        async with pooled_session() as session:
+            async with session.delete(url, headers=supabase_headers, params=params, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
                 if resp.status in (200, 204):
                     return True
                 else:
                     print(f"Supabase delete error: {resp.status} - {await resp.text()}")
                     return False
     except Exception as e:
+        SUPABASE_BREAKER.record_failure()
         print(f"Supabase delete exception: {e}")
         return False
 
-def supabase_select_sync(table: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-    """Synchronous wrapper for select"""
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, supabase_select(table, filters))
-                return future.result()
+def _ilike_literal(value: str) -> str:
+    """Escape LIKE wildcards so a PostgREST ilike filter matches value exactly (case-insensitively)."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+async def supabase_upsert_tests(rows: Any) -> bool:
+    """
+    Upsert one tests row (dict) or many (list) on (username_lower, gamemode). If the table
+    doesn't have that key yet (migration not run), each row is looked up case-insensitively
+    and PATCHed or POSTed instead.
+    """
+    missing_key = (TESTS_TABLE, TESTS_CONFLICT_COLUMNS)
+    if TESTS_KEYED_UPSERT["supabase"]:
+        if await supabase_upsert(TESTS_TABLE, rows, on_conflict=TESTS_CONFLICT_COLUMNS):
+            return True
+        if missing_key not in SUPABASE_MISSING_CONFLICT_KEYS:
+            return False
+        TESTS_KEYED_UPSERT["supabase"] = False
+        print(f"ERROR: [Supabase] run {TESTS_MIGRATION_FILE} in the SQL editor; writing tests with lookup + update/insert")
+
+    ok = True
+    for row in rows if isinstance(rows, list) else [rows]:
+        existing = await supabase_select(TESTS_TABLE, raw_params={
+            "select": "id,username",
+            "username": f"ilike.{_ilike_literal(row['username'])}",
+            "gamemode": f"eq.{row['gamemode']}",
+        })
+        match = next((r for r in existing if str(r.get("username", "")).casefold() == row["username"].casefold()), None)
+        if match and match.get("id") is not None:
+            ok = await supabase_update(TESTS_TABLE, row, {"id": match["id"]}) and ok
         else:
-            return asyncio.run(supabase_select(table, filters))
-    except Exception as e:
-        print(f"supabase_select_sync error: {e}")
-        return []
+            ok = await supabase_insert(TESTS_TABLE, row) and ok
+    return ok
 
-def supabase_insert_sync(table: str, data: Dict[str, Any]) -> bool:
-    """Synchronous wrapper for insert"""
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code (scripts, startup tooling).
+    Refuses to run inside an event loop: blocking there would stall the gateway
+    heartbeat and every other interaction, so async code must await the coroutine.
+    """
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, supabase_insert(table, data))
-                return future.result()
-        else:
-            return asyncio.run(supabase_insert(table, data))
-    except Exception as e:
-        print(f"supabase_insert_sync error: {e}")
-        return False
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("sync wrapper called from a running event loop; await the async version instead")
+
+def supabase_select_sync(table: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """Synchronous wrapper for select (not usable inside the event loop)"""
+    return run_sync(supabase_select(table, filters))
+
+def supabase_insert_sync(table: str, data: Dict[str, Any]) -> bool:
+    """Synchronous wrapper for insert (not usable inside the event loop)"""
+    return run_sync(supabase_insert(table, data))
 
 # =========================
 # NORMALIZED PLAYER/GAMEMODE CACHE (REMOVED - using tests table directly)
@@ -290,51 +589,13 @@ async def cache_test_result(
     The tests table columns: username, gamemode, rank, points, created_at
     Returns True on success, False on failure.
     """
-    points = POINTS.get(rank, 0)
-    gamemode = get_gamemode_display_name(mode_key)
-
     if db_pool is not None:
-        try:
-            async with db_pool.acquire() as conn:
-                # Upsert: insert or update on conflict (username lower + gamemode lower)
-                result = await conn.execute(
-                    """
-                    INSERT INTO tests (username, gamemode, rank, points, created_at)
-                    VALUES ($1, $2, $3, $4, NOW())
-                    ON CONFLICT (LOWER(username), LOWER(gamemode))
-                    DO UPDATE SET rank = EXCLUDED.rank, points = EXCLUDED.points, created_at = EXCLUDED.created_at
-                    """,
-                    username, gamemode, rank, points
-                )
-                return True
-        except Exception as e:
-            print(f"Cache test result error (PG): {e}")
-            return False
+        return await db_upsert_test(username, mode_key, rank, tester_id, tester_name, ts)
 
     elif USE_SUPABASE_API:
         try:
-            # Check if record exists
-            existing = await supabase_select(TESTS_TABLE, {
-                "username": username,
-                "gamemode": gamemode
-            })
-            payload = {
-                "username": username,
-                "gamemode": gamemode,
-                "rank": rank,
-                "points": points,
-                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
-            }
-            if existing:
-                # Update
-                success = await supabase_update(TESTS_TABLE, payload, {
-                    "username": username,
-                    "gamemode": gamemode
-                })
-            else:
-                # Insert
-                success = await supabase_insert(TESTS_TABLE, payload)
-            return success
+            # One request: insert, or merge into the existing (username_lower, gamemode) row
+            return await supabase_upsert_tests(_test_row(username, mode_key, rank))
         except Exception as e:
             print(f"Cache test result error (Supabase): {e}")
             return False
@@ -347,17 +608,18 @@ async def get_player_rank_from_cache(username: str, mode_key: str) -> Optional[s
     gamemode = get_gamemode_display_name(mode_key)
     
     if db_pool is not None:
+        if not POSTGRES_BREAKER.allow():
+            return None
         try:
-            async with db_pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    """
-                    SELECT rank FROM tests
-                    WHERE LOWER(username) = LOWER($1) AND LOWER(gamemode) = LOWER($2)
-                    """,
-                    username, gamemode
-                )
-                if row:
-                    return row["rank"]
+            row = await pg_call(lambda conn: conn.fetchrow(
+                """
+                SELECT rank FROM tests
+                WHERE LOWER(username) = LOWER($1) AND LOWER(gamemode) = LOWER($2)
+                """,
+                username, gamemode
+            ))
+            if row:
+                return row["rank"]
         except Exception as e:
             print(f"Cache rank lookup error (PG): {e}")
         return None
@@ -464,6 +726,9 @@ WIPE_GLOBAL_COMMANDS = os.getenv("WIPE_GLOBAL_COMMANDS", "0") == "1"
 
 COOLDOWN_SECONDS = 14 * 24 * 60 * 60
 DATA_FILE = "data.json"
+# Where cooldowns/ticket state/queue ids are persisted: "json" (data.json + journal) or "sqlite"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").strip().lower()
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "state.db")
 
 HTTP_TIMEOUT_SECONDS = 10  # hard timeout so it never "thinks forever"
 
@@ -653,6 +918,30 @@ GAMEMODE_INDICATORS = {
 # =========================
 # Your existing Supabase table: tests (id, created_at, username, rank, points, gamemode)
 TESTS_TABLE = "tests"
+# Upserts merge on the case-folded name (username keeps its display case). username_lower
+# is a generated column added by this migration; init_db applies it on DATABASE_URL, a
+# Supabase-only deployment runs it once in the SQL editor.
+TESTS_CONFLICT_COLUMNS = "username_lower,gamemode"
+TESTS_MIGRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations", "001_tests_username_lower.sql")
+# Whether each backend has that key. Without it tests writes use lookup + update/insert
+# rather than an ON CONFLICT that would fail every time.
+TESTS_KEYED_UPSERT = {"postgres": False, "supabase": True}
+
+
+def _test_row(username: str, mode_key: str, rank: str) -> Dict[str, Any]:
+    """
+    Build a tests row with normalized keys (trimmed username, canonical gamemode name).
+    A known player keeps the display case already stored, whatever case was typed.
+    """
+    username = username.strip()
+    known = TESTS_REPLICA.player_tests(username) if TESTS_REPLICA.loaded else []
+    return {
+        "username": known[0]["username"] if known else username,
+        "gamemode": get_gamemode_display_name(mode_key),
+        "rank": rank,
+        "points": POINTS.get(rank, 0),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
 
 
 def get_gamemode_indicator(mode_key: str, is_open: bool = True) -> str:
@@ -679,60 +968,557 @@ def get_gamemode_color(mode_key: str) -> discord.Color:
 # =========================
 # STORAGE
 # =========================
-def _load_data() -> Dict[str, Any]:
-    if not os.path.exists(DATA_FILE):
-        return {"ticket_state": {}, "cooldowns": {}, "queue_panel_message": None, "queue_message_ids": []}
+DATA_JOURNAL_FILE = "data.journal"
+STATE_FLUSH_INTERVAL = 0.25  # seconds a write burst may accumulate before one group commit
+STATE_COMPACT_EVERY = 1000  # journal records before they are folded into data.json
+STATE_COMPACT_INTERVAL = 15 * 60  # fold a non-empty journal at least this often (seconds)
+
+
+def _default_data() -> Dict[str, Any]:
+    return {"ticket_state": {}, "cooldowns": {}, "queue_panel_message": None, "queue_message_ids": [], "active_queues": {}, "tickets": {}}
+
+
+def _load_data(path: str = DATA_FILE) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return _default_data()
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
-        return {"ticket_state": {}, "cooldowns": {}, "queue_panel_message": None, "queue_message_ids": []}
+        return _default_data()
 
 
-def _save_data(data: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _save_data(data: Dict[str, Any], path: str = DATA_FILE) -> None:
+    _write_file_atomic(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def _write_file_atomic(path: str, text: str) -> None:
+    """Write text to path via a temp file + rename so readers never see a torn file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Every write-behind JSON file, flushed once more on shutdown
+WRITE_BEHIND_FILES: List["JsonWriteBehind"] = []
+
+
+class JsonWriteBehind(abc.ABC):
+    """
+    Base for in-memory registries mirrored to a JSON file (subclasses provide
+    _snapshot). Mutations only mark the registry dirty; flush() writes one snapshot
+    off the event loop, so any number of changes between flushes cost one write.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._dirty = False
+        WRITE_BEHIND_FILES.append(self)
+
+    @abc.abstractmethod
+    def _snapshot(self) -> Any:
+        """The JSON-serializable value written to path."""
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        text = json.dumps(self._snapshot(), ensure_ascii=False, indent=2)
+        try:
+            await asyncio.to_thread(_write_file_atomic, self.path, text)
+        except Exception as e:
+            self._dirty = True
+            print(f"[WriteBehind] Failed to write {self.path}: {e}")
+
+
+def _apply_state_record(data: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """Apply one journal record ({"op": "set"|"del", "path": [...], "value": ...}) to data."""
+    path = record.get("path") or []
+    if not path:
+        return
+    node = data
+    for key in path[:-1]:
+        child = node.get(key)
+        if not isinstance(child, dict):
+            if record.get("op") == "del":
+                return
+            child = node[key] = {}
+        node = child
+    if record.get("op") == "set":
+        node[path[-1]] = record.get("value")
+    elif record.get("op") == "del":
+        node.pop(path[-1], None)
+
+
+class JournalStateBackend:
+    """data.json snapshot plus an append-only journal of the changes made since it was written."""
+
+    needs_snapshot = True  # compact() rewrites data.json from the serialized state
+
+    def __init__(self, snapshot_path: str, journal_path: str):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+
+    def load(self) -> Dict[str, Any]:
+        data = _load_data(self.snapshot_path)
+        if not os.path.exists(self.journal_path):
+            return data
+        replayed = 0
+        good_end = 0  # byte offset just past the last intact record
+        torn = False
+        with open(self.journal_path, "rb") as f:
+            for raw in f:
+                line = raw.strip()
+                if line:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        torn = True
+                        break
+                    _apply_state_record(data, record)
+                    replayed += 1
+                good_end += len(raw)
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(good_end - 1, 0))
+            ends_with_newline = good_end == 0 or f.read(1) == b"\n"
+        if torn or not ends_with_newline:
+            # Torn tail from a crash mid-write; everything before it is intact. Cut it off
+            # (and end on a newline) so the next append doesn't glue onto the partial line.
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_end)
+                if not ends_with_newline:
+                    f.seek(good_end)
+                    f.write(b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if torn:
+                print(f"[StateStore] Dropped {size - good_end} byte(s) of torn journal tail after {replayed} record(s)")
+        if replayed:
+            print(f"[StateStore] Replayed {replayed} journal record(s) from {self.journal_path}")
+        return data
+
+    def append(self, lines: List[str]) -> None:
+        """Group commit: write a batch of journal lines with a single fsync."""
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, snapshot: str) -> None:
+        """Replace data.json with snapshot, then drop the journal it already contains."""
+        _write_file_atomic(self.snapshot_path, snapshot)
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteStateBackend:
+    """
+    SQLite (WAL) persistence for the bot state.
+    cooldowns and ticket_state live in tables keyed by (user_id, mode_key),
+    queue message ids in their own table, and any other section in state_kv
+    at entry granularity (section, key); deeper writes rewrite their entry.
+    All writes go through one dedicated writer thread; each journal batch
+    from the StateStore is one transaction.
+    """
+
+    needs_snapshot = False  # the tables already hold the compact form
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS cooldowns (
+            user_id TEXT NOT NULL,
+            mode_key TEXT NOT NULL,
+            last_closed REAL NOT NULL,
+            PRIMARY KEY (user_id, mode_key)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ticket_state (
+            user_id TEXT NOT NULL,
+            mode_key TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, mode_key)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ticket_state_channel ON ticket_state(channel_id)",
+        """
+        CREATE TABLE IF NOT EXISTS queue_message_ids (
+            message_id INTEGER PRIMARY KEY,
+            gamemode TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS state_kv (
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (section, key)
+        ) WITHOUT ROWID
+        """,
+    )
+    # Sections with dedicated (user_id, mode_key) tables -> value column
+    KEYED_TABLES = {"cooldowns": "last_closed", "ticket_state": "channel_id"}
+    META_SECTION = "_meta"
+
+    def __init__(self, db_path: str, legacy_snapshot_path: str, legacy_journal_path: str):
+        self.db_path = db_path
+        self.legacy_snapshot_path = legacy_snapshot_path
+        self.legacy_journal_path = legacy_journal_path
+        self._queue: SimpleQueue = SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: every committed batch is fsynced, which is the group commit
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def load(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+            self._migrate_from_json(conn)
+            data = _default_data()
+            for section, value_column in self.KEYED_TABLES.items():
+                rows = conn.execute(f"SELECT user_id, mode_key, {value_column} FROM {section}")
+                for user_id, mode_key, value in rows:
+                    data[section].setdefault(user_id, {})[mode_key] = value
+            data["queue_message_ids"] = [
+                [message_id, gamemode]
+                for message_id, gamemode in conn.execute("SELECT message_id, gamemode FROM queue_message_ids")
+            ]
+            for section, key, value in conn.execute("SELECT section, key, value FROM state_kv"):
+                if section.startswith("_"):
+                    continue
+                if key == "":
+                    data[section] = json.loads(value)
+                else:
+                    node = data.get(section)
+                    if not isinstance(node, dict):
+                        node = data[section] = {}
+                    node[key] = json.loads(value)
+        finally:
+            conn.close()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="state-sqlite-writer", daemon=True)
+        self._writer.start()
+        return data
+
+    def _migrate_from_json(self, conn: sqlite3.Connection) -> None:
+        """One-shot import of the data.json (+ journal) layout into a fresh database."""
+        row = conn.execute(
+            "SELECT value FROM state_kv WHERE section = ? AND key = 'migrated_at'", (self.META_SECTION,)
+        ).fetchone()
+        if row:
+            return
+        legacy = JournalStateBackend(self.legacy_snapshot_path, self.legacy_journal_path).load()
+        with conn:
+            for section, value in legacy.items():
+                self._apply(conn, {"op": "set", "path": [section], "value": value})
+            conn.execute(
+                "INSERT OR REPLACE INTO state_kv (section, key, value) VALUES (?, 'migrated_at', ?)",
+                (self.META_SECTION, json.dumps(time.time())),
+            )
+        if os.path.exists(self.legacy_snapshot_path):
+            cooldown_rows = sum(len(v) for v in legacy.get("cooldowns", {}).values() if isinstance(v, dict))
+            print(f"[StateStore] Migrated {self.legacy_snapshot_path} into {self.db_path} ({cooldown_rows} cooldown row(s))")
+
+    def _apply(self, conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+        path = record.get("path") or []
+        if not path:
+            return
+        section = path[0]
+        is_set = record.get("op") == "set"
+        value = record.get("value")
+
+        if section in self.KEYED_TABLES:
+            column = self.KEYED_TABLES[section]
+            if len(path) == 1:
+                conn.execute(f"DELETE FROM {section}")
+                for user_id, modes in (value or {}).items() if is_set else ():
+                    self._apply(conn, {"op": "set", "path": [section, user_id], "value": modes})
+            elif len(path) == 2:
+                conn.execute(f"DELETE FROM {section} WHERE user_id = ?", (path[1],))
+                for mode_key, mode_value in (value or {}).items() if is_set else ():
+                    self._apply(conn, {"op": "set", "path": [section, path[1], mode_key], "value": mode_value})
+            elif is_set and value is not None:
+                conn.execute(
+                    f"INSERT INTO {section} (user_id, mode_key, {column}) VALUES (?, ?, ?) "
+                    f"ON CONFLICT (user_id, mode_key) DO UPDATE SET {column} = excluded.{column}",
+                    (path[1], path[2], value),
+                )
+            else:
+                conn.execute(f"DELETE FROM {section} WHERE user_id = ? AND mode_key = ?", (path[1], path[2]))
+            return
+
+        if section == "queue_message_ids":
+            conn.execute("DELETE FROM queue_message_ids")
+            if is_set and value:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO queue_message_ids (message_id, gamemode) VALUES (?, ?)",
+                    [(int(msg_id), gamemode) for msg_id, gamemode in value],
+                )
+            return
+
+        if len(path) == 1:
+            conn.execute("DELETE FROM state_kv WHERE section = ?", (section,))
+            if not is_set:
+                return
+            if isinstance(value, dict):
+                conn.executemany(
+                    "INSERT INTO state_kv (section, key, value) VALUES (?, ?, ?)",
+                    [(section, str(k), json.dumps(v, ensure_ascii=False)) for k, v in value.items()],
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO state_kv (section, key, value) VALUES (?, '', ?)",
+                    (section, json.dumps(value, ensure_ascii=False)),
+                )
+        elif len(path) == 2:
+            if is_set:
+                conn.execute(
+                    "INSERT OR REPLACE INTO state_kv (section, key, value) VALUES (?, ?, ?)",
+                    (section, str(path[1]), json.dumps(value, ensure_ascii=False)),
+                )
+            else:
+                conn.execute("DELETE FROM state_kv WHERE section = ? AND key = ?", (section, str(path[1])))
+        else:
+            # Deeper write: read-modify-write the (section, key) entry with the JSON backend's semantics
+            key = str(path[1])
+            row = conn.execute("SELECT value FROM state_kv WHERE section = ? AND key = ?", (section, key)).fetchone()
+            holder = {key: json.loads(row[0])} if row else {}
+            _apply_state_record(holder, {**record, "path": [key] + list(path[2:])})
+            if key in holder:
+                conn.execute(
+                    "INSERT OR REPLACE INTO state_kv (section, key, value) VALUES (?, ?, ?)",
+                    (section, key, json.dumps(holder[key], ensure_ascii=False)),
+                )
+
+    def _writer_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, payload, future = item
+                try:
+                    if kind == "records":
+                        with conn:
+                            for line in payload:
+                                self._apply(conn, json.loads(line))
+                    elif kind == "checkpoint":
+                        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    future.set_result(None)
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            conn.close()
+
+    def _submit(self, kind: str, payload: Any) -> None:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((kind, payload, future))
+        future.result()
+
+    def append(self, lines: List[str]) -> None:
+        self._submit("records", lines)
+
+    def compact(self, _snapshot: Optional[str]) -> None:
+        # Rows are already the compact form; just fold the WAL back into the db file
+        self._submit("checkpoint", None)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+            self._writer = None
+
+
+def _create_state_backend():
+    if STATE_BACKEND == "sqlite":
+        return SqliteStateBackend(STATE_DB_FILE, DATA_FILE, DATA_JOURNAL_FILE)
+    return JournalStateBackend(DATA_FILE, DATA_JOURNAL_FILE)
+
+
+_MISSING = object()
+
+
+class StateStore:
+    """
+    In-memory view of the bot state (data.json or the SQLite state db).
+    Reads never touch the disk. Mutations are applied in memory and queued as
+    journal records; a background task group-commits them off the event loop
+    and periodically folds the journal back into a fresh snapshot.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.data: Optional[Dict[str, Any]] = None
+        self._pending: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._since_compact = 0
+        self._last_compact = time.time()
+        self._compact_requested = False
+
+    def load(self) -> Dict[str, Any]:
+        if self.data is None:
+            data = self.backend.load()
+            for key, value in _default_data().items():
+                data.setdefault(key, value)
+            self.data = data
+        return self.data
+
+    def get(self, *path: str, default: Any = None) -> Any:
+        node: Any = self.load()
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                return default
+            node = node[key]
+        return node
+
+    def set(self, path: List[str], value: Any) -> None:
+        record = {"op": "set", "path": list(path), "value": value}
+        _apply_state_record(self.load(), record)
+        self._record(record)
+
+    def delete(self, path: List[str]) -> bool:
+        """Remove the value at path. Returns False if nothing was stored there."""
+        if self.get(*path, default=_MISSING) is _MISSING:
+            return False
+        record = {"op": "del", "path": list(path)}
+        _apply_state_record(self.load(), record)
+        self._record(record)
+        return True
+
+    def request_compaction(self) -> None:
+        self._compact_requested = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _record(self, record: Dict[str, Any]) -> None:
+        # Serialize now so later in-memory mutation of the value can't leak into this record
+        self._pending.append(json.dumps(record, ensure_ascii=False))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the write-behind task (must be called from the running event loop)."""
+        self.load()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self._pending:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=STATE_COMPACT_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                # Let a burst of mutations pile up so it costs one fsync
+                await asyncio.sleep(STATE_FLUSH_INTERVAL)
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[StateStore] Flush loop error: {e}")
+
+    def _should_compact(self) -> bool:
+        if self._compact_requested:
+            return True
+        if self._since_compact >= STATE_COMPACT_EVERY:
+            return True
+        return self._since_compact > 0 and time.time() - self._last_compact >= STATE_COMPACT_INTERVAL
+
+    async def flush(self, compact: bool = False) -> None:
+        async with self._flush_lock:
+            if self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await asyncio.to_thread(self.backend.append, batch)
+                except Exception as e:
+                    print(f"[StateStore] Journal write failed, will retry: {e}")
+                    self._pending = batch + self._pending
+                    return
+                self._since_compact += len(batch)
+
+            if compact or self._should_compact():
+                # Everything journaled so far is reflected in memory, so the
+                # snapshot taken here makes the current journal redundant.
+                snapshot = None
+                if self.backend.needs_snapshot:
+                    snapshot = json.dumps(self.data, ensure_ascii=False, indent=2)
+                try:
+                    await asyncio.to_thread(self.backend.compact, snapshot)
+                except Exception as e:
+                    print(f"[StateStore] Compaction failed: {e}")
+                    return
+                self._since_compact = 0
+                self._last_compact = time.time()
+                self._compact_requested = False
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_lock is not None and self.data is not None:
+            await self.flush(compact=True)
+        await asyncio.to_thread(self.backend.close)
+
+
+STATE_STORE = StateStore(_create_state_backend())
 
 
 def _persist_queue_message_ids():
-    """Save QUEUE_MESSAGE_IDS to data.json"""
+    """Save QUEUE_MESSAGE_IDS to the state store"""
     try:
-        data = _load_data()
         # Convert to list of [msg_id, gamemode] for JSON
         ids_list = [[k, v] for k, v in QUEUE_MESSAGE_IDS.items()]
-        data["queue_message_ids"] = ids_list
-        _save_data(data)
+        STATE_STORE.set(["queue_message_ids"], ids_list)
     except Exception as e:
         print(f"Error persisting queue message IDs: {e}")
 
 
 def get_open_ticket_channel_id(user_id: int, mode_key: str) -> Optional[int]:
-    data = _load_data()
-    return data.get("ticket_state", {}).get(str(user_id), {}).get(mode_key)
+    return STATE_STORE.get("ticket_state", str(user_id), mode_key)
 
 
 def set_open_ticket_channel_id(user_id: int, mode_key: str, channel_id: Optional[int]) -> None:
-    data = _load_data()
-    ticket_state = data.setdefault("ticket_state", {})
-    user_state = ticket_state.setdefault(str(user_id), {})
     if channel_id is None:
-        user_state.pop(mode_key, None)
+        STATE_STORE.delete(["ticket_state", str(user_id), mode_key])
     else:
-        user_state[mode_key] = channel_id
-    _save_data(data)
+        STATE_STORE.set(["ticket_state", str(user_id), mode_key], channel_id)
 
 
 def get_last_closed(user_id: int, mode_key: str) -> float:
-    data = _load_data()
-    return float(data.get("cooldowns", {}).get(str(user_id), {}).get(mode_key, 0))
+    return float(STATE_STORE.get("cooldowns", str(user_id), mode_key, default=0))
 
 
 def set_last_closed(user_id: int, mode_key: str, ts: float) -> None:
-    data = _load_data()
-    cds = data.setdefault("cooldowns", {})
-    u = cds.setdefault(str(user_id), {})
-    u[mode_key] = ts
-    _save_data(data)
+    STATE_STORE.set(["cooldowns", str(user_id), mode_key], ts)
+    COOLDOWN_INDEX.push(str(user_id), mode_key, ts)
 
 
 def cooldown_left(user_id: int, mode_key: str) -> int:
@@ -744,33 +1530,366 @@ def cooldown_left(user_id: int, mode_key: str) -> int:
 
 
 # =========================
-# LINK SYSTEM (Discord -> Minecraft Account Linking) - Database Version
+# TICKET REGISTRY
 # =========================
 
-# JSON fallback functions for linked accounts
-def _load_link_data() -> Dict[str, Any]:
-    if not os.path.exists("links.json"):
-        return {}
-    try:
-        with open("links.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def _parse_ticket_topic(topic: str) -> Dict[str, str]:
+    """"NeoTiers ticket | owner=1 | mode=sword | mc=Steve" -> {"owner": "1", "mode": "sword", "mc": "Steve"}"""
+    fields = {}
+    for part in (topic or "").split("|"):
+        key, sep, value = part.strip().partition("=")
+        if sep:
+            fields[key.strip()] = value.strip()
+    return fields
 
 
-def _save_link_data(data: Dict[str, Any]) -> None:
-    with open("links.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+class TicketRegistry:
+    """
+    Ticket metadata by channel id (owner, mode, Minecraft name, tester and
+    lifecycle timestamps), persisted in the state store's "tickets" section.
+    Replaces parsing channel topics on every ticket action; a topic is only
+    read once for a channel that predates the registry.
+    """
 
+    def __init__(self):
+        self._tickets: Dict[int, Dict[str, Any]] = {}
+        self.stats = {"opened": 0, "closed": 0, "topic_fallbacks": 0, "lifetime_seconds_total": 0.0, "to_result_seconds_total": 0.0, "with_result": 0}
 
-async def get_linked_minecraft_name_async(discord_id: int) -> Optional[str]:
-    """Get the Minecraft name linked to a Discord user (async)"""
-    # Try Supabase REST API first
-    if USE_SUPABASE_API:
-        try:
-            results = await supabase_select("linked_accounts", {"discord_id": str(discord_id)})
-            if results:
-                print(f"FOUND: Linked minecraft {results[0]['minecraft_name']} for discord {discord_id} (Supabase API)")
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def rebuild(self) -> None:
+        """Load persisted tickets, then add any open channel from ticket_state that isn't known yet."""
+        self._tickets = {}
+        for channel_id, ticket in (STATE_STORE.get("tickets", default={}) or {}).items():
+            try:
+                self._tickets[int(channel_id)] = dict(ticket)
+            except (TypeError, ValueError):
+                continue
+        for user_id, modes in (STATE_STORE.get("ticket_state", default={}) or {}).items():
+            for mode_key, channel_id in (modes or {}).items():
+                try:
+                    channel_id = int(channel_id)
+                    if channel_id not in self._tickets:
+                        self._store(channel_id, {"owner_id": int(user_id), "mode_key": mode_key, "minecraft_name": None,
+                                                 "opened_at": None, "tester_id": None, "result_at": None})
+                except (TypeError, ValueError):
+                    continue
+
+    def _store(self, channel_id: int, ticket: Dict[str, Any]) -> Dict[str, Any]:
+        self._tickets[channel_id] = ticket
+        STATE_STORE.set(["tickets", str(channel_id)], ticket)
+        return ticket
+
+    def open(self, channel_id: int, owner_id: int, mode_key: str, minecraft_name: Optional[str],
+             tester_id: Optional[int] = None) -> Dict[str, Any]:
+        self.stats["opened"] += 1
+        return self._store(channel_id, {
+            "owner_id": owner_id,
+            "mode_key": mode_key,
+            "minecraft_name": minecraft_name,
+            "opened_at": time.time(),
+            "tester_id": tester_id,
+            "result_at": None,
+        })
+
+    def get(self, channel_id: int) -> Optional[Dict[str, Any]]:
+        return self._tickets.get(channel_id)
+
+    def lookup(self, channel) -> Optional[Dict[str, Any]]:
+        """Ticket for a channel; legacy channels are registered from their topic on first use."""
+        ticket = self._tickets.get(channel.id)
+        if ticket is not None:
+            return ticket
+        fields = _parse_ticket_topic(getattr(channel, "topic", None) or "")
+        try:
+            owner_id = int(fields.get("owner", ""))
+        except ValueError:
+            return None
+        self.stats["topic_fallbacks"] += 1
+        return self._store(channel.id, {"owner_id": owner_id, "mode_key": fields.get("mode", ""),
+                                        "minecraft_name": fields.get("mc"), "opened_at": None,
+                                        "tester_id": None, "result_at": None})
+
+    def record_result(self, channel_id: int, tester_id: int) -> None:
+        ticket = self._tickets.get(channel_id)
+        if ticket is None:
+            return
+        ticket["tester_id"] = tester_id
+        if ticket.get("result_at") is None:
+            ticket["result_at"] = time.time()
+            if ticket.get("opened_at"):
+                self.stats["with_result"] += 1
+                self.stats["to_result_seconds_total"] += ticket["result_at"] - ticket["opened_at"]
+        self._store(channel_id, ticket)
+
+    def close(self, channel_id: int) -> Optional[Dict[str, Any]]:
+        ticket = self._tickets.pop(channel_id, None)
+        if ticket is None:
+            return None
+        STATE_STORE.delete(["tickets", str(channel_id)])
+        self.stats["closed"] += 1
+        opened_at = ticket.get("opened_at")
+        if opened_at:
+            lifetime = time.time() - opened_at
+            self.stats["lifetime_seconds_total"] += lifetime
+            to_result = f", result after {ticket['result_at'] - opened_at:.0f}s" if ticket.get("result_at") else ""
+            print(f"[Tickets] {ticket['mode_key']} ticket {channel_id} closed after {lifetime:.0f}s{to_result}")
+        return ticket
+
+    def prune(self, guild) -> int:
+        """Forget tickets whose channel no longer exists. Returns how many were dropped."""
+        gone = [cid for cid in self._tickets if guild.get_channel(cid) is None]
+        for channel_id in gone:
+            self._tickets.pop(channel_id, None)
+            STATE_STORE.delete(["tickets", str(channel_id)])
+        return len(gone)
+
+    def snapshot(self) -> Dict[str, Any]:
+        closed = self.stats["closed"]
+        with_result = self.stats["with_result"]
+        return {
+            "open": len(self._tickets),
+            "opened": self.stats["opened"],
+            "closed": closed,
+            "topic_fallbacks": self.stats["topic_fallbacks"],
+            "mean_lifetime_seconds": round(self.stats["lifetime_seconds_total"] / closed, 1) if closed else None,
+            "mean_time_to_result_seconds": round(self.stats["to_result_seconds_total"] / with_result, 1) if with_result else None,
+        }
+
+
+TICKETS = TicketRegistry()
+
+
+# =========================
+# COOLDOWN EXPIRY
+# =========================
+COOLDOWN_SWEEP_INTERVAL = 60 * 60  # seconds between expired-cooldown sweeps
+COOLDOWN_SWEEP_BATCH = 500  # cooldowns dropped per batch before yielding to the loop
+
+
+class CooldownExpiryIndex:
+    """
+    Min-heap of (expires_at, user_id, mode_key) over the stored cooldowns.
+    Entries are never removed eagerly: a reset or a newer close simply leaves
+    a stale entry behind, which is skipped when it reaches the top.
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def rebuild(self, cooldowns: Dict[str, Any]) -> None:
+        heap = []
+        for user_id, modes in (cooldowns or {}).items():
+            if not isinstance(modes, dict):
+                continue
+            for mode_key, last_closed in modes.items():
+                try:
+                    heap.append((float(last_closed) + COOLDOWN_SECONDS, user_id, mode_key, float(last_closed)))
+                except (TypeError, ValueError):
+                    continue
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def push(self, user_id: str, mode_key: str, last_closed: float) -> None:
+        heapq.heappush(self._heap, (float(last_closed) + COOLDOWN_SECONDS, user_id, mode_key, float(last_closed)))
+
+    def has_expired(self, now: float) -> bool:
+        return bool(self._heap) and self._heap[0][0] <= now
+
+    def pop_expired(self, now: float, limit: int) -> List[tuple]:
+        """Pop up to limit entries that expired before now as (user_id, mode_key, last_closed)."""
+        expired = []
+        while self._heap and len(expired) < limit and self._heap[0][0] <= now:
+            _expires_at, user_id, mode_key, last_closed = heapq.heappop(self._heap)
+            expired.append((user_id, mode_key, last_closed))
+        return expired
+
+
+COOLDOWN_INDEX = CooldownExpiryIndex()
+
+
+def sweep_expired_cooldowns(now: Optional[float] = None, limit: int = COOLDOWN_SWEEP_BATCH) -> int:
+    """Drop up to limit expired cooldowns from the state store. Returns how many were removed."""
+    now = time.time() if now is None else now
+    removed = 0
+    for user_id, mode_key, last_closed in COOLDOWN_INDEX.pop_expired(now, limit):
+        current = STATE_STORE.get("cooldowns", user_id, mode_key)
+        try:
+            if current is None or float(current) != last_closed:
+                continue  # reset or re-closed since this entry was pushed
+        except (TypeError, ValueError):
+            pass
+        STATE_STORE.delete(["cooldowns", user_id, mode_key])
+        if not STATE_STORE.get("cooldowns", user_id):
+            STATE_STORE.delete(["cooldowns", user_id])
+        removed += 1
+    return removed
+
+
+async def cooldown_sweeper_task():
+    """Background loop: drop expired cooldowns in batches and compact the state store."""
+    while True:
+        try:
+            total = 0
+            now = time.time()
+            while True:
+                total += sweep_expired_cooldowns(now)
+                # Stale entries count against the batch, so only an unexpired head means done
+                if not COOLDOWN_INDEX.has_expired(now):
+                    break
+                await asyncio.sleep(0)
+            if total:
+                print(f"[CooldownSweeper] Removed {total} expired cooldown(s), {len(COOLDOWN_INDEX)} tracked")
+                STATE_STORE.request_compaction()
+            await asyncio.sleep(COOLDOWN_SWEEP_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[CooldownSweeper] Error: {e}")
+            await asyncio.sleep(COOLDOWN_SWEEP_INTERVAL)
+
+
+# =========================
+# LINK SYSTEM (Discord -> Minecraft Account Linking) - Database Version
+# =========================
+
+LINK_INDEX_PAGE_SIZE = 1000  # rows per request when warming the index from Supabase
+LINK_LOWER_COLUMN = False  # set by init_db once linked_accounts.minecraft_name_lower exists
+
+
+class LinkedAccountIndex:
+    """
+    Both directions of the account links in memory: discord_id -> Minecraft
+    name and lowercased Minecraft name -> discord_id, each an O(1) dict lookup.
+    """
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._ids: Dict[str, int] = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def replace_all(self, rows) -> None:
+        """Rebuild from (discord_id, minecraft_name) pairs."""
+        self._names = {}
+        self._ids = {}
+        for discord_id, minecraft_name in rows:
+            if minecraft_name:
+                self.put(int(discord_id), minecraft_name)
+        self.loaded = True
+
+    def put(self, discord_id: int, minecraft_name: str) -> None:
+        self.drop(discord_id)
+        self._names[discord_id] = minecraft_name
+        self._ids[minecraft_name.lower()] = discord_id
+
+    def drop(self, discord_id: int) -> bool:
+        old_name = self._names.pop(discord_id, None)
+        if old_name is None:
+            return False
+        if self._ids.get(old_name.lower()) == discord_id:
+            del self._ids[old_name.lower()]
+        return True
+
+    def name_for(self, discord_id: int) -> Optional[str]:
+        return self._names.get(discord_id)
+
+    def discord_for(self, minecraft_name: str) -> Optional[int]:
+        return self._ids.get(minecraft_name.lower())
+
+    def to_json(self) -> Dict[str, str]:
+        return {str(discord_id): name for discord_id, name in self._names.items()}
+
+
+# Read-through cache in front of whichever backend holds the links
+LINK_INDEX = LinkedAccountIndex()
+# links.json contents for the JSON fallback, loaded on first use
+JSON_LINKS = LinkedAccountIndex()
+
+
+# JSON fallback functions for linked accounts
+def _load_link_data() -> Dict[str, Any]:
+    if not os.path.exists("links.json"):
+        return {}
+    try:
+        with open("links.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_link_data(data: Dict[str, Any]) -> None:
+    with open("links.json", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _json_links() -> LinkedAccountIndex:
+    if not JSON_LINKS.loaded:
+        JSON_LINKS.replace_all(_load_link_data().items())
+    return JSON_LINKS
+
+
+def _json_link(discord_id: int, minecraft_name: Optional[str]) -> bool:
+    """Set (or with None, remove) a link in links.json. Returns False if there was nothing to remove."""
+    links = _json_links()
+    if minecraft_name is None:
+        if not links.drop(discord_id):
+            return False
+    else:
+        links.put(discord_id, minecraft_name)
+    _save_link_data(links.to_json())
+    return True
+
+
+async def warm_link_index() -> None:
+    """Load every link into LINK_INDEX so lookups skip the backend round trip."""
+    rows = []
+    try:
+        if USE_SUPABASE_API:
+            offset = 0
+            while True:
+                page = await supabase_select("linked_accounts", raw_params={
+                    "select": "discord_id,minecraft_name",
+                    "order": "discord_id",
+                    "limit": str(LINK_INDEX_PAGE_SIZE),
+                    "offset": str(offset),
+                })
+                rows.extend((row["discord_id"], row["minecraft_name"]) for row in page)
+                if len(page) < LINK_INDEX_PAGE_SIZE:
+                    break
+                offset += LINK_INDEX_PAGE_SIZE
+        elif db_pool:
+            async with db_pool.acquire() as conn:
+                records = await conn.fetch("SELECT discord_id, minecraft_name FROM linked_accounts")
+            rows = [(r["discord_id"], r["minecraft_name"]) for r in records]
+        else:
+            rows = list(_json_links().to_json().items())
+    except Exception as e:
+        print(f"[LinkIndex] Warm-up failed, falling back to per-lookup queries: {e}")
+        return
+    LINK_INDEX.replace_all(rows)
+    print(f"[LinkIndex] Loaded {len(LINK_INDEX)} linked account(s)")
+
+
+async def get_linked_minecraft_name_async(discord_id: int) -> Optional[str]:
+    """Get the Minecraft name linked to a Discord user (async)"""
+    cached = LINK_INDEX.name_for(discord_id)
+    if cached:
+        return cached
+
+    # Try Supabase REST API first
+    if USE_SUPABASE_API:
+        try:
+            results = await supabase_select("linked_accounts", {"discord_id": str(discord_id)})
+            if results:
+                print(f"FOUND: Linked minecraft {results[0]['minecraft_name']} for discord {discord_id} (Supabase API)")
+                LINK_INDEX.put(discord_id, results[0]['minecraft_name'])
                 return results[0]['minecraft_name']
             else:
                 print(f"NOT FOUND in Supabase: No link for discord {discord_id}")
@@ -787,6 +1906,7 @@ async def get_linked_minecraft_name_async(discord_id: int) -> Optional[str]:
                 )
                 if row:
                     print(f"FOUND: Linked minecraft {row['minecraft_name']} for discord {discord_id} (DB)")
+                    LINK_INDEX.put(discord_id, row['minecraft_name'])
                 else:
                     print(f"NOT FOUND in DB: No link for discord {discord_id}")
                 return row['minecraft_name'] if row else None
@@ -795,10 +1915,10 @@ async def get_linked_minecraft_name_async(discord_id: int) -> Optional[str]:
 
     # Fallback to JSON
     print(f"FALLBACK: Checking JSON for discord {discord_id}")
-    data = _load_link_data()
-    result = data.get(str(discord_id))
+    result = _json_links().name_for(discord_id)
     if result:
         print(f"FOUND: Linked minecraft {result} for discord {discord_id} (JSON)")
+        LINK_INDEX.put(discord_id, result)
     else:
         print(f"NOT FOUND: No link for discord {discord_id} (JSON)")
     return result
@@ -815,6 +1935,7 @@ async def link_minecraft_account_async(discord_id: int, minecraft_name: str) ->
             })
             if success:
                 print(f"SUCCESS: Linked discord {discord_id} to minecraft {minecraft_name} (Supabase API)")
+                LINK_INDEX.put(discord_id, minecraft_name)
                 return True
         except Exception as e:
             print(f"Error linking to Supabase: {e}")
@@ -834,15 +1955,15 @@ async def link_minecraft_account_async(discord_id: int, minecraft_name: str) ->
                     discord_id, minecraft_name
                 )
             print(f"SUCCESS: Linked discord {discord_id} to minecraft {minecraft_name} (DB)")
+            LINK_INDEX.put(discord_id, minecraft_name)
             return True
         except Exception as e:
             print(f"Error linking to database: {e}")
 
     # Fallback to JSON
     print(f"FALLBACK: Saving to JSON for discord {discord_id}")
-    data = _load_link_data()
-    data[str(discord_id)] = minecraft_name
-    _save_link_data(data)
+    _json_link(discord_id, minecraft_name)
+    LINK_INDEX.put(discord_id, minecraft_name)
     print(f"SUCCESS: Linked discord {discord_id} to minecraft {minecraft_name} (JSON)")
     return True
 
@@ -855,18 +1976,21 @@ async def unlink_minecraft_account_async(discord_id: int) -> bool:
             success = await supabase_delete("linked_accounts", {"discord_id": str(discord_id)})
             if success:
                 print(f"SUCCESS: Unlinked discord {discord_id} (Supabase API)")
+                LINK_INDEX.drop(discord_id)
                 return True
         except Exception as e:
             print(f"Error unlinking from Supabase: {e}")
 
     if not db_pool:
-        return False
+        LINK_INDEX.drop(discord_id)
+        return _json_link(discord_id, None)
     try:
         async with db_pool.acquire() as conn:
             result = await conn.execute(
                 "DELETE FROM linked_accounts WHERE discord_id = $1",
                 discord_id
             )
+        LINK_INDEX.drop(discord_id)
         return result == "DELETE 1"
     except Exception as e:
         print(f"Error unlinking minecraft account: {e}")
@@ -874,148 +1998,57 @@ async def unlink_minecraft_account_async(discord_id: int) -> bool:
 
 
 async def get_discord_by_minecraft_async(minecraft_name: str) -> Optional[int]:
-    """Get Discord ID by linked Minecraft name (async)"""
+    """Get Discord ID by linked Minecraft name (async, case-insensitive)"""
+    cached = LINK_INDEX.discord_for(minecraft_name)
+    if cached is not None:
+        return cached
+
     # Try Supabase REST API first
     if USE_SUPABASE_API:
         try:
             results = await supabase_select("linked_accounts", {"minecraft_name": minecraft_name})
             if results:
+                LINK_INDEX.put(int(results[0]['discord_id']), results[0]['minecraft_name'])
                 return int(results[0]['discord_id'])
         except Exception as e:
             print(f"Error getting discord by minecraft from Supabase: {e}")
 
     if not db_pool:
-        return None
+        return _json_links().discord_for(minecraft_name)
     try:
         async with db_pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT discord_id FROM linked_accounts WHERE LOWER(minecraft_name) = LOWER($1)",
-                minecraft_name
-            )
+            if LINK_LOWER_COLUMN:
+                query = "SELECT discord_id, minecraft_name FROM linked_accounts WHERE minecraft_name_lower = LOWER($1)"
+            else:
+                query = "SELECT discord_id, minecraft_name FROM linked_accounts WHERE LOWER(minecraft_name) = LOWER($1)"
+            row = await conn.fetchrow(query, minecraft_name)
+            if row:
+                LINK_INDEX.put(row['discord_id'], row['minecraft_name'])
             return row['discord_id'] if row else None
     except Exception as e:
         print(f"Error getting discord by minecraft: {e}")
         return None
 
 
-# Synchronous versions that fall back to JSON if DB not available
+# Synchronous compatibility shims; async code must await the *_async versions
 def get_linked_minecraft_name(discord_id: int) -> Optional[str]:
     """Get the Minecraft name linked to a Discord user (sync wrapper)"""
-    # Try Supabase REST API
-    if USE_SUPABASE_API:
-        try:
-            results = supabase_select_sync("linked_accounts", {"discord_id": str(discord_id)})
-            if results:
-                print(f"FOUND: Linked minecraft {results[0]['minecraft_name']} for discord {discord_id} (Supabase API)")
-                return results[0]['minecraft_name']
-        except Exception as e:
-            print(f"Error getting from Supabase: {e}")
-
-    if db_pool:
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If we're in an async context, we need to schedule this
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    future = pool.submit(asyncio.run, get_linked_minecraft_name_async(discord_id))
-                    return future.result()
-            else:
-                return asyncio.run(get_linked_minecraft_name_async(discord_id))
-        except:
-            pass
-    # Fallback to JSON
-    data = _load_link_data()
-    return data.get(str(discord_id))
+    return run_sync(get_linked_minecraft_name_async(discord_id))
 
 
 def link_minecraft_account(discord_id: int, minecraft_name: str) -> None:
     """Link a Discord user to a Minecraft name (sync wrapper)"""
-    # Try Supabase REST API
-    if USE_SUPABASE_API:
-        try:
-            success = supabase_insert_sync("linked_accounts", {
-                "discord_id": str(discord_id),
-                "minecraft_name": minecraft_name
-            })
-            if success:
-                print(f"SUCCESS: Linked discord {discord_id} to minecraft {minecraft_name} (Supabase API)")
-                return
-        except Exception as e:
-            print(f"Error linking to Supabase: {e}")
-
-    if db_pool:
-        try:
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, link_minecraft_account_async(discord_id, minecraft_name))
-                if future.result():
-                    return
-        except:
-            pass
-    # Fallback to JSON
-    data = _load_link_data()
-    data[str(discord_id)] = minecraft_name
-    _save_link_data(data)
+    run_sync(link_minecraft_account_async(discord_id, minecraft_name))
 
 
 def unlink_minecraft_account(discord_id: int) -> bool:
     """Unlink a Discord user from their Minecraft name. Returns True if unlinked."""
-    # Try Supabase REST API
-    if USE_SUPABASE_API:
-        try:
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, supabase_delete("linked_accounts", {"discord_id": str(discord_id)}))
-                if future.result():
-                    print(f"SUCCESS: Unlinked discord {discord_id} (Supabase API)")
-                    return True
-        except Exception as e:
-            print(f"Error unlinking from Supabase: {e}")
-
-    if db_pool:
-        try:
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, unlink_minecraft_account_async(discord_id))
-                if future.result():
-                    return True
-        except:
-            pass
-    # Fallback to JSON
-    data = _load_link_data()
-    if str(discord_id) in data:
-        del data[str(discord_id)]
-        _save_link_data(data)
-        return True
-    return False
+    return run_sync(unlink_minecraft_account_async(discord_id))
 
 
 def get_discord_by_minecraft(minecraft_name: str) -> Optional[int]:
-    """Get Discord ID by linked Minecraft name (sync wrapper)"""
-    # Try Supabase REST API
-    if USE_SUPABASE_API:
-        try:
-            results = supabase_select_sync("linked_accounts", {"minecraft_name": minecraft_name})
-            if results:
-                return int(results[0]['discord_id'])
-        except Exception as e:
-            print(f"Error getting discord by minecraft from Supabase: {e}")
-
-    if db_pool:
-        try:
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                future = pool.submit(asyncio.run, get_discord_by_minecraft_async(minecraft_name))
-                return future.result()
-        except:
-            pass
-    # Fallback to JSON
-    data = _load_link_data()
-    for discord_id, mc_name in data.items():
-        if mc_name.lower() == minecraft_name.lower():
-            return int(discord_id)
-    return None
+    """Get Discord ID by linked Minecraft name (sync wrapper, case-insensitive)"""
+    return run_sync(get_discord_by_minecraft_async(minecraft_name))
 
 
 # =========================
@@ -1024,6 +2057,100 @@ def get_discord_by_minecraft(minecraft_name: str) -> Optional[int]:
 
 LINK_CODE_LENGTH = 8  # 6-8 characters
 LINK_CODE_EXPIRY_MINUTES = 10
+PENDING_LINKS_FILE = "pending_links.json"
+LINK_CODE_SWEEP_INTERVAL = 30  # seconds between local expiry sweeps / pending_links.json flushes
+LINK_CODE_PURGE_INTERVAL = 15 * 60  # seconds between pending_codes purges in the database
+LINK_CODE_PURGE_BATCH = 1000  # rows per DELETE when purging pending_codes
+LINK_CODE_PURGE_BATCH_REST = 200  # ids per DELETE over Supabase REST (they travel in the URL)
+
+
+class PendingLinkCodeCache(JsonWriteBehind):
+    """
+    pending_links.json held in memory with two indexes: code -> entry and
+    discord_id -> code. Expiries sit on a min-heap and are removed by sweep(),
+    so lookups never scan or rewrite the file.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._codes: Optional[Dict[str, Dict[str, Any]]] = None
+        self._by_discord: Dict[int, str] = {}
+        self._expiry_heap: List[tuple] = []
+
+    def _snapshot(self) -> Any:
+        return self._codes or {}
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if self._codes is None:
+            self._codes = {}
+            self._by_discord = {}
+            self._expiry_heap = []
+            for code, info in _load_pending_link_codes().items():
+                if isinstance(info, dict) and info.get("discord_id") is not None:
+                    self._index(code.upper(), info)
+        return self._codes
+
+    def _index(self, code: str, info: Dict[str, Any]) -> None:
+        discord_id = int(info["discord_id"])
+        previous = self._by_discord.get(discord_id)
+        if previous and previous != code:
+            self._codes.pop(previous, None)
+        self._codes[code] = info
+        self._by_discord[discord_id] = code
+        heapq.heappush(self._expiry_heap, (info.get("expires_at", 0), code))
+
+    def _unindex(self, code: str) -> Optional[Dict[str, Any]]:
+        info = self._codes.pop(code, None)
+        if info is not None:
+            discord_id = int(info["discord_id"])
+            if self._by_discord.get(discord_id) == code:
+                del self._by_discord[discord_id]
+        return info
+
+    def issue(self, discord_id: int, code: str, expires_at: float) -> None:
+        """Store a code for a user, replacing any code they already had."""
+        self.load()
+        self._index(code.upper(), {"discord_id": discord_id, "expires_at": expires_at})
+        self.mark_dirty()
+
+    def consume(self, code: str) -> Optional[int]:
+        """Remove a code and return its Discord ID if it was still valid."""
+        self.load()
+        info = self._unindex(code.upper())
+        if info is None:
+            return None
+        self.mark_dirty()
+        if time.time() > info.get("expires_at", 0):
+            return None
+        return int(info["discord_id"])
+
+    def code_for(self, discord_id: int) -> Optional[str]:
+        self.load()
+        code = self._by_discord.get(discord_id)
+        if code is None:
+            return None
+        if time.time() >= self._codes[code].get("expires_at", 0):
+            return None  # expired; the next sweep drops it
+        return code
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop codes whose expiry has passed. Returns how many were removed."""
+        now = time.time() if now is None else now
+        codes = self.load()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, code = heapq.heappop(self._expiry_heap)
+            info = codes.get(code)
+            # Skip heap entries left behind by a consumed or replaced code
+            if info and info.get("expires_at", 0) == expires_at:
+                self._unindex(code)
+                removed += 1
+        if removed:
+            self.mark_dirty()
+        return removed
+
+
+LINK_CODES = PendingLinkCodeCache(PENDING_LINKS_FILE)
 
 
 # =========================
@@ -1073,15 +2200,8 @@ async def generate_link_code_async(discord_id: int) -> str:
         except Exception as e:
             print(f"Error generating link code: {e}")
 
-    # Fallback to JSON
-    data = _load_pending_link_codes()
-    # Remove any existing codes for this user
-    data = {k: v for k, v in data.items() if v.get("discord_id") != discord_id}
-    data[code] = {
-        "discord_id": discord_id,
-        "expires_at": time.time() + (LINK_CODE_EXPIRY_MINUTES * 60)
-    }
-    _save_pending_link_codes(data)
+    # Fallback to JSON (replaces any existing code for this user)
+    LINK_CODES.issue(discord_id, code, time.time() + (LINK_CODE_EXPIRY_MINUTES * 60))
     return code
 
 
@@ -1146,6 +2266,20 @@ async def get_pending_link_code_async(discord_id: int) -> Optional[str]:
         except Exception as e:
             print(f"Error getting pending link code from Supabase: {e}")
 
+    if db_pool:
+        try:
+            async with db_pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT code FROM pending_codes WHERE discord_id = $1 AND used = FALSE AND expires_at > NOW()",
+                    discord_id
+                )
+                return row['code'] if row else None
+        except Exception as e:
+            print(f"Error getting pending link code: {e}")
+
+    # Fallback to JSON
+    return get_pending_link_code(discord_id)
+
 
 async def validate_link_code_for_user(discord_id: int, code: str) -> bool:
     """Check if a code belongs to the specified user (async)"""
@@ -1164,85 +2298,122 @@ async def validate_link_code_for_user(discord_id: int, code: str) -> bool:
             return False
     return False
 
-    if db_pool:
-        try:
-            async with db_pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT code FROM pending_codes WHERE discord_id = $1 AND used = FALSE AND expires_at > NOW()",
-                    discord_id
-                )
-                return row['code'] if row else None
-        except Exception as e:
-            print(f"Error getting pending link code: {e}")
-
-    # Fallback to JSON
-    return get_pending_link_code(discord_id)
-
 
 # Synchronous fallbacks
 def _load_pending_link_codes() -> Dict[str, Any]:
-    if not os.path.exists("pending_links.json"):
+    if not os.path.exists(PENDING_LINKS_FILE):
         return {}
     try:
-        with open("pending_links.json", "r", encoding="utf-8") as f:
+        with open(PENDING_LINKS_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         return {}
 
 
-def _save_pending_link_codes(data: Dict[str, Any]) -> None:
-    with open("pending_links.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
 def generate_link_code(discord_id: int) -> str:
     """Generate a new link code for a Discord user"""
     # Generate random alphanumeric code
     code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=LINK_CODE_LENGTH))
 
     # Store with expiry time
-    data = _load_pending_link_codes()
-    data[code] = {
-        "discord_id": discord_id,
-        "expires_at": time.time() + (LINK_CODE_EXPIRY_MINUTES * 60)
-    }
-    _save_pending_link_codes(data)
-
+    LINK_CODES.issue(discord_id, code, time.time() + (LINK_CODE_EXPIRY_MINUTES * 60))
     return code
 
 
 def verify_link_code(code: str) -> Optional[int]:
     """Verify a link code and return Discord ID if valid, None if invalid/expired"""
-    data = _load_pending_link_codes()
+    # Used and expired codes are both removed
+    return LINK_CODES.consume(code)
 
-    code_info = data.get(code.upper())
-    if not code_info:
-        return None
 
-    # Check if expired
-    if time.time() > code_info.get("expires_at", 0):
-        # Remove expired code
-        data.pop(code.upper(), None)
-        _save_pending_link_codes(data)
+def get_pending_link_code(discord_id: int) -> Optional[str]:
+    """Get existing pending code for a Discord user if any"""
+    return LINK_CODES.code_for(discord_id)
+
+
+async def _supabase_delete_returning_ids(table: str, params: Dict[str, str]) -> Optional[int]:
+    """DELETE matching rows with return=representation; how many were removed, or None on failure."""
+    if not SUPABASE_BREAKER.allow():
+        return None
+    headers = supabase_headers.copy()
+    headers["Prefer"] = "return=representation"
+    try:
+        async with pooled_session() as session:
+            async with session.delete(
+                f"{SUPABASE_URL}/rest/v1/{table}", headers=headers, params={**params, "select": "id"},
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            ) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
+                if resp.status != 200:
+                    print(f"Supabase delete error: {resp.status} - {await resp.text()}")
+                    return None
+                return len(await resp.json())
+    except Exception as e:
+        SUPABASE_BREAKER.record_failure()
+        print(f"Supabase delete exception: {e}")
         return None
 
-    discord_id = code_info.get("discord_id")
-    # Remove used code
-    data.pop(code.upper(), None)
-    _save_pending_link_codes(data)
 
-    return discord_id
+async def purge_expired_link_codes() -> int:
+    """Delete expired and used rows from pending_codes in batches. Returns rows removed."""
+    if USE_SUPABASE_API:
+        removed = 0
+        while True:
+            now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            rows = await supabase_select("pending_codes", raw_params={
+                "select": "id",
+                "or": f'(expires_at.lt."{now_iso}",used.is.true)',
+                "limit": str(LINK_CODE_PURGE_BATCH_REST),
+            })
+            ids = [str(row["id"]) for row in rows if row.get("id") is not None]
+            if not ids:
+                break
+            deleted = await _supabase_delete_returning_ids("pending_codes", {"id": f"in.({','.join(ids)})"})
+            if not deleted:
+                break
+            removed += deleted
+            if len(ids) < LINK_CODE_PURGE_BATCH_REST:
+                break
+        return removed
 
+    if db_pool:
+        removed = 0
+        async with db_pool.acquire() as conn:
+            # Small batches keep each DELETE's lock footprint short
+            while True:
+                status = await conn.execute(
+                    """
+                    DELETE FROM pending_codes WHERE ctid = ANY(ARRAY(
+                        SELECT ctid FROM pending_codes WHERE expires_at < NOW() OR used LIMIT $1
+                    ))
+                    """,
+                    LINK_CODE_PURGE_BATCH
+                )
+                batch = int(status.split()[-1]) if status else 0
+                removed += batch
+                if batch < LINK_CODE_PURGE_BATCH:
+                    break
+        return removed
+    return 0
 
-def get_pending_link_code(discord_id: int) -> Optional[str]:
-    """Get existing pending code for a Discord user if any"""
-    data = _load_pending_link_codes()
-    for code, info in data.items():
-        if info.get("discord_id") == discord_id:
-            # Check if not expired
-            if time.time() < info.get("expires_at", 0):
-                return code
-    return None
+
+async def link_code_janitor_task():
+    """Background loop: expire local link codes and periodically purge the pending_codes table."""
+    next_purge = 0.0
+    while True:
+        try:
+            await asyncio.sleep(LINK_CODE_SWEEP_INTERVAL)
+            LINK_CODES.sweep()
+            await LINK_CODES.flush()
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + LINK_CODE_PURGE_INTERVAL
+                removed = await purge_expired_link_codes()
+                if removed:
+                    print(f"[LinkCodes] Purged {removed} expired or used code(s) from pending_codes")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[LinkCodes] Janitor error: {e}")
 
 
 # =========================
@@ -1250,15 +2421,19 @@ def get_pending_link_code(discord_id: int) -> Optional[str]:
 # =========================
 async def check_minecraft_verification(discord_id: int) -> Dict[str, Any]:
     """Check if a Discord user is verified on the Minecraft server"""
+    if not MINECRAFT_BREAKER.allow():
+        return {"verified": False, "error": "Minecraft API unavailable (circuit open)"}
     try:
-        async with aiohttp.ClientSession() as session:
+        async with pooled_session() as session:
             url = f"{MINECRAFT_API_URL}/api/verify/minecraft/{discord_id}"
             async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                MINECRAFT_BREAKER.record_status(response.status)
                 if response.status == 200:
                     return await response.json()
                 else:
                     return {"verified": False, "error": f"API returned {response.status}"}
     except Exception as e:
+        MINECRAFT_BREAKER.record_failure()
         return {"verified": False, "error": str(e)}
 
 
@@ -1274,77 +2449,132 @@ async def is_minecraft_verified(discord_id: int) -> bool:
 # =========================
 # BAN SYSTEM
 # =========================
+BAN_FILE = "bans.json"
+BAN_MAINTENANCE_INTERVAL = 5  # seconds between expiry sweeps / batched bans.json writes
+
+
 def _load_ban_data() -> Dict[str, Any]:
-    if not os.path.exists("bans.json"):
+    if not os.path.exists(BAN_FILE):
         return {}
     try:
-        with open("bans.json", "r", encoding="utf-8") as f:
+        with open(BAN_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         return {}
 
 
 def _save_ban_data(data: Dict[str, Any]) -> None:
-    with open("bans.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
+    _write_file_atomic(BAN_FILE, json.dumps(data, ensure_ascii=False, indent=2))
 
-def is_player_banned(username: str) -> bool:
-    """Check if a player is banned and if the ban has expired."""
-    data = _load_ban_data()
-    ban_info = data.get(username.lower())
-    if not ban_info:
-        return False
 
-    # Check if ban has expired
-    expires_at = ban_info.get("expires_at", 0)
-    if expires_at > 0 and time.time() > expires_at:
-        # Ban expired, remove it
-        data.pop(username.lower(), None)
-        _save_ban_data(data)
-        return False
+class BanRegistry(JsonWriteBehind):
+    """
+    bans.json held in memory, keyed by lowercased username.
+    Expiries sit on a min-heap; the maintenance task removes expired bans and
+    persists them in batches, so ban checks never touch the disk.
+    """
 
-    return True
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._bans: Optional[Dict[str, Dict[str, Any]]] = None
+        self._expiry_heap: List[tuple] = []
+
+    def _snapshot(self) -> Any:
+        return self._bans or {}
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if self._bans is None:
+            self._bans = _load_ban_data()
+            self._expiry_heap = [
+                (info.get("expires_at", 0), key)
+                for key, info in self._bans.items()
+                if isinstance(info, dict) and info.get("expires_at", 0) > 0
+            ]
+            heapq.heapify(self._expiry_heap)
+        return self._bans
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        ban_info = self.load().get(username.lower())
+        if not ban_info:
+            return None
+        expires_at = ban_info.get("expires_at", 0)
+        if expires_at > 0 and time.time() > expires_at:
+            return None  # expired; the sweeper drops it on its next pass
+        return ban_info
+
+    def add(self, username: str, ban_info: Dict[str, Any]) -> None:
+        key = username.lower()
+        self.load()[key] = ban_info
+        if ban_info.get("expires_at", 0) > 0:
+            heapq.heappush(self._expiry_heap, (ban_info["expires_at"], key))
+        self.mark_dirty()
+
+    def remove(self, username: str) -> bool:
+        if self.load().pop(username.lower(), None) is None:
+            return False
+        self.mark_dirty()
+        return True
 
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop bans whose expiry has passed. Returns how many were removed."""
+        now = time.time() if now is None else now
+        bans = self.load()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            ban_info = bans.get(key)
+            # Skip entries left behind by an unban or a re-ban with a new expiry
+            if ban_info and ban_info.get("expires_at", 0) == expires_at:
+                del bans[key]
+                removed += 1
+        if removed:
+            self.mark_dirty()
+        return removed
 
-def get_ban_info(username: str) -> Optional[Dict[str, Any]]:
-    """Get ban info for a player. Returns None if not banned or ban expired."""
-    data = _load_ban_data()
-    ban_info = data.get(username.lower())
-    if not ban_info:
-        return None
 
-    expires_at = ban_info.get("expires_at", 0)
-    if expires_at > 0 and time.time() > expires_at:
-        data.pop(username.lower(), None)
-        _save_ban_data(data)
-        return None
+BAN_REGISTRY = BanRegistry(BAN_FILE)
+
+
+async def ban_maintenance_task():
+    """Background loop: expire bans and write bans.json when something changed."""
+    while True:
+        try:
+            await asyncio.sleep(BAN_MAINTENANCE_INTERVAL)
+            removed = BAN_REGISTRY.sweep()
+            if removed:
+                print(f"[Bans] {removed} ban(s) expired")
+            await BAN_REGISTRY.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Bans] Maintenance error: {e}")
+
+
+def is_player_banned(username: str) -> bool:
+    """Check if a player is banned (expired bans count as not banned)."""
+    return BAN_REGISTRY.get(username) is not None
+
 
-    return ban_info
+def get_ban_info(username: str) -> Optional[Dict[str, Any]]:
+    """Get ban info for a player. Returns None if not banned or ban expired."""
+    return BAN_REGISTRY.get(username)
 
 
 def ban_player(username: str, days: int, reason: str = "") -> None:
     """Ban a player for a specified number of days. Use days=0 for permanent ban."""
-    data = _load_ban_data()
     expires_at = 0 if days == 0 else time.time() + (days * 24 * 60 * 60)
-    data[username.lower()] = {
+    BAN_REGISTRY.add(username, {
         "username": username,
         "reason": reason,
         "banned_at": time.time(),
         "expires_at": expires_at,
         "permanent": days == 0
-    }
-    _save_ban_data(data)
+    })
 
 
 def unban_player(username: str) -> bool:
     """Unban a player. Returns True if they were banned and are now unbanned."""
-    data = _load_ban_data()
-    if username.lower() in data:
-        data.pop(username.lower(), None)
-        _save_ban_data(data)
-        return True
-    return False
+    return BAN_REGISTRY.remove(username)
 
 
 # =========================
@@ -1415,12 +2645,158 @@ def is_gamemode_tester_or_admin(member: discord.Member, gamemode: str) -> bool:
     return has_gamemode_tester_role(member, gamemode)
 
 
+# =========================
+# REQUEST COALESCING
+# =========================
+
+class SingleFlight:
+    """
+    Concurrent calls with the same (endpoint, params) key share one in-flight
+    task instead of each going upstream. Per-endpoint counters record how many
+    calls arrived, how many went upstream and how many were served by sharing.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    async def do(self, endpoint: str, params: tuple, fn):
+        key = (endpoint, params)
+        stats = self.stats.setdefault(endpoint, {"calls": 0, "upstream": 0, "shared": 0})
+        stats["calls"] += 1
+
+        task = self._inflight.get(key)
+        if task is not None:
+            stats["shared"] += 1
+        else:
+            stats["upstream"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        # Shielded so one caller timing out doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _done(self, key: tuple, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved; waiters already got it
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "endpoints": {name: dict(counts) for name, counts in self.stats.items()},
+            "saved_upstream_calls": sum(counts["shared"] for counts in self.stats.values()),
+        }
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+# =========================
+# KEYED LOCKS
+# =========================
+
+class KeyedLockManager:
+    """
+    asyncio locks by key. A lock is created on first use and reference-counted
+    by its holders and waiters, and dropped as soon as the last one leaves, so
+    memory follows concurrency rather than the number of keys ever seen. With
+    stripes > 0 keys hash onto a fixed set of locks instead (constant memory,
+    occasional false sharing). Records how long acquisitions waited.
+    """
+
+    def __init__(self, name: str, stripes: int = 0):
+        self.name = name
+        self.stripes = stripes
+        self._locks: Dict[Any, list] = {}  # key -> [lock, holders + waiters]
+        self.stats = {"acquisitions": 0, "contended": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+
+    def _slot(self, key: Any) -> Any:
+        return hash(key) % self.stripes if self.stripes else key
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: Any):
+        slot = self._slot(key)
+        entry = self._locks.get(slot)
+        if entry is None:
+            entry = self._locks[slot] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        started = time.monotonic()
+        try:
+            if entry[0].locked():
+                self.stats["contended"] += 1
+            async with entry[0]:
+                waited = time.monotonic() - started
+                self.stats["acquisitions"] += 1
+                self.stats["wait_seconds_total"] += waited
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(slot) is entry:
+                del self._locks[slot]
+
+    @contextlib.asynccontextmanager
+    async def hold_many(self, keys: List[Any]):
+        """Hold several keys at once; slots are taken in a fixed order so two callers can't deadlock."""
+        async with contextlib.AsyncExitStack() as stack:
+            seen = set()
+            for key in sorted(keys, key=lambda k: repr(self._slot(k))):
+                slot = self._slot(key)
+                if slot not in seen:
+                    seen.add(slot)
+                    await stack.enter_async_context(self.hold(key))
+            yield
+
+    def snapshot(self) -> Dict[str, Any]:
+        acquisitions = self.stats["acquisitions"]
+        return {
+            "live_locks": len(self._locks),
+            "acquisitions": acquisitions,
+            "contended": self.stats["contended"],
+            "mean_wait_ms": round(self.stats["wait_seconds_total"] / acquisitions * 1000, 2) if acquisitions else None,
+            "max_wait_ms": round(self.stats["max_wait_seconds"] * 1000, 2),
+        }
+
+
+TICKET_LOCKS = KeyedLockManager("ticket")  # (user_id, mode_key): one ticket channel at a time
+QUEUE_LOCKS = KeyedLockManager("queue")  # gamemode: open / next / close
+PLAYER_LOCKS = KeyedLockManager("player", stripes=64)  # lowercased tierlist name: admin edits
+LOCK_MANAGERS = [TICKET_LOCKS, QUEUE_LOCKS, PLAYER_LOCKS]
+
+
+def _flight_params(username: str, mode: str = "") -> tuple:
+    """Normalized single-flight key for a player lookup."""
+    return (username.strip().lower(), get_gamemode_display_name(mode) if mode else "")
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """Counters served by the health server's /metrics endpoint."""
+    return {
+        "single_flight": SINGLE_FLIGHT.snapshot(),
+        "breakers": {breaker.name: breaker.snapshot() for breaker in BREAKERS},
+        "tests_replica": TESTS_REPLICA.snapshot(),
+        "queue_render": dict(QUEUE_RENDERER.stats),
+        "render_cache": RENDER_CACHE.snapshot(),
+        "message_handles": dict(MESSAGE_HANDLES.stats),
+        "eligibility": dict(ELIGIBILITY_STATS),
+        "tickets": TICKETS.snapshot(),
+        "locks": {manager.name: manager.snapshot() for manager in LOCK_MANAGERS},
+    }
+
+
 async def get_player_rank_for_mode(username: str, mode_key: str) -> str:
     """
     Get a player's current rank for a specific gamemode.
     Tries local cache first, then falls back to website API.
     Returns "Unranked" if not found or on error.
+    Concurrent lookups for the same player and mode share one request.
     """
+    return await SINGLE_FLIGHT.do("rank", _flight_params(username, mode_key), lambda: _get_player_rank_for_mode(username, mode_key))
+
+
+async def _get_player_rank_for_mode(username: str, mode_key: str) -> str:
     # Try local cache first
     cached_rank = await get_player_rank_from_cache(username, mode_key)
     if cached_rank is not None:
@@ -1474,7 +2850,12 @@ def can_join_queue(rank: str) -> bool:
 async def is_player_fully_retired(username: str) -> bool:
     """
     Check if a player is fully retired (has any retired rank across gamemodes).
+    Concurrent checks for the same player share one request.
     """
+    return await SINGLE_FLIGHT.do("retired", _flight_params(username), lambda: _is_player_fully_retired(username))
+
+
+async def _is_player_fully_retired(username: str) -> bool:
     if not WEBSITE_URL:
         return False
     try:
@@ -1492,206 +2873,1120 @@ async def is_player_fully_retired(username: str) -> bool:
 
 
 # =========================
-# DISCORD BOT
+# ELIGIBILITY (queue join / ticket open)
 # =========================
-intents = discord.Intents.default()
-intents.guilds = True
-intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-http_session: Optional[aiohttp.ClientSession] = None
+ELIGIBILITY_DEADLINE = 2.5  # seconds for all checks; the interaction must be answered within 3s
+ELIGIBILITY_RANK_TTL = 60  # seconds a looked-up rank is reused by the rank check
 
+QUEUE_JOIN_CHECKS = ("link", "retired", "cooldown", "rank")
+QUEUE_TESTER_CHECKS = ("link", "retired")  # testers pick player/tester afterwards
+QUEUE_PLAYER_CHECKS = ("link", "cooldown", "rank")
+TICKET_CHECKS = ("link", "ban", "retired", "cooldown")
 
-# =========================
-# HEALTH SERVER (Railway)
-# =========================
-async def start_health_server():
-    global http_session
-    
-    # Ensure http_session is available
-    if http_session is None:
-        http_session = aiohttp.ClientSession()
-    
-    app = web.Application()
+# Remote checks that fail open when they error or miss the deadline (as they always have)
+ELIGIBILITY_SOFT_CHECKS = {"ban", "retired"}
 
-    async def health(_request):
-        return web.Response(text="ok")
+# Only the rank is cached: bans, retirement and links must take effect immediately
+# (links already come from LINK_INDEX), and those checks overlap under the deadline anyway.
+ELIGIBILITY_RANK_CACHE: Dict[tuple, tuple] = {}  # (lowercased name, mode_key) -> (expires_at, rank)
+ELIGIBILITY_STATS = {"evaluations": 0, "rank_cache_hits": 0, "denied": 0, "deadline_misses": 0}
 
-    print("Health server endpoints registered")
 
-    # API endpoint for Minecraft link code verification
-    async def verify_link(request):
-        print(f"verify_link called: code={request.query.get('code')}, minecraft={request.query.get('minecraft')}")
-        try:
-            # Get code from query params
-            code = request.query.get("code", "")
-            minecraft_name = request.query.get("minecraft", "")
+class Eligibility:
+    """Result of evaluate_eligibility: ok, or the first denial with its detail"""
+    __slots__ = ("ok", "reason", "detail", "linked_mc")
 
-            if not code or not minecraft_name:
-                return web.json_response({"success": False, "error": "Missing code or minecraft parameter"}, status=400)
+    def __init__(self, ok: bool, reason: Optional[str] = None, detail: Any = None, linked_mc: Optional[str] = None):
+        self.ok = ok
+        self.reason = reason
+        self.detail = detail
+        self.linked_mc = linked_mc
 
-            print(f"Verifying code: {code}")
-            # Verify the code
-            discord_id = await verify_link_code_async(code.upper())
-            print(f"Verified: discord_id={discord_id}")
 
-            if discord_id is None:
-                return web.json_response({"success": False, "error": "Invalid or expired code"}, status=400)
+async def _check_test_ban(player_name: str) -> Optional[Dict[str, Any]]:
+    """Website test ban for a display name: the ban record, or None if not banned"""
+    if not WEBSITE_URL:
+        return None
+    url = f"{WEBSITE_URL}/api/tests/ban?username={player_name}"
+    timeout = aiohttp.ClientTimeout(total=5)
+    async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+        if resp.status == 200:
+            ban_data = await resp.json()
+            if ban_data.get("banned"):
+                return ban_data
+    return None
 
-            # Ensure http_session is available for linking
-            global http_session
-            if http_session is None:
-                print("Creating http_session")
-                http_session = aiohttp.ClientSession()
 
-            # Link the Minecraft account to the Discord account
-            print(f"Linking account: {discord_id} -> {minecraft_name}")
-            await link_minecraft_account_async(discord_id, minecraft_name)
+async def _eligibility_rank(player_name: str, mode_key: str) -> str:
+    key = (player_name.lower(), mode_key)
+    cached = ELIGIBILITY_RANK_CACHE.get(key)
+    if cached and cached[0] > time.monotonic():
+        ELIGIBILITY_STATS["rank_cache_hits"] += 1
+        return cached[1]
+    rank = await get_player_rank_for_mode(player_name, mode_key)
+    now = time.monotonic()
+    if len(ELIGIBILITY_RANK_CACHE) >= 10000:
+        for stale in [k for k, (expires_at, _rank) in ELIGIBILITY_RANK_CACHE.items() if expires_at <= now]:
+            del ELIGIBILITY_RANK_CACHE[stale]
+    ELIGIBILITY_RANK_CACHE[key] = (now + ELIGIBILITY_RANK_TTL, rank)
+    return rank
 
-            # Send confirmation DM to the user
-            try:
-                user = await bot.fetch_user(discord_id)
-                if user:
-                    embed = discord.Embed(
-                        title="Összekapcsolás sikeres!",
-                        description=f"A Discord fiókod össze lett kapcsolva a **Minecraft** fiókkal!\n\n**Minecraft név:** `{minecraft_name}`",
-                        color=discord.Color.green()
-                    )
-                    await user.send(embed=embed)
-            except Exception as e:
-                print(f"Could not send DM: {e}")
 
-            return web.json_response({"success": True, "discord_id": discord_id, "minecraft": minecraft_name})
-        except Exception as e:
-            import traceback
-            print(f"verify_link error: {e}")
-            traceback.print_exc()
-            return web.json_response({"success": False, "error": str(e)}, status=500)
+async def evaluate_eligibility(member: discord.Member, mode_key: str, checks: tuple) -> Eligibility:
+    """
+    Run the requested checks for member in mode_key. The cooldown is local and
+    checked first; the link lookup and ban check start together, and the
+    retired/rank checks start as soon as the linked name is known. The first
+    denial cancels the rest. Everything shares ELIGIBILITY_DEADLINE.
+    """
+    ELIGIBILITY_STATS["evaluations"] += 1
+    if "cooldown" in checks:
+        left = cooldown_left(member.id, mode_key)
+        if left > 0:
+            ELIGIBILITY_STATS["denied"] += 1
+            return Eligibility(False, "cooldown", left)
 
-        # Send confirmation DM to the user
-        try:
-            user = await bot.fetch_user(discord_id)
-            if user:
-                embed = discord.Embed(
-                    title="✅ Összekapcsolás sikeres!",
-                    description=f"A Discord fiókod össze lett kapcsolva a **Minecraft** fiókkal!\n\n"
-                               f"**Minecraft név:** `{minecraft_name}`\n"
-                               f"**Összekapcsolva:** Örökre!",
-                    color=discord.Color.green()
-                )
-                embed.set_footer(text="Most már használhatod a tierlistát!")
-                await user.send(embed=embed)
-        except Exception as e:
-            print(f"Could not send DM to user: {e}")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + ELIGIBILITY_DEADLINE
+    tasks: Dict[asyncio.Task, str] = {}
+    linked_mc = None
 
-        return web.json_response({
-            "success": True, 
-            "discord_id": discord_id,
-            "minecraft": minecraft_name
-        })
+    def start(name: str, coro) -> None:
+        tasks[asyncio.create_task(coro)] = name
 
-    # API endpoint for high test announcements
-    async def handle_high_test(request):
-        print(f"handle_high_test called")
-        try:
-            # Check authentication
-            auth_header = request.headers.get("Authorization", "")
-            if not auth_header.startswith("Bearer "):
-                return web.json_response({"ok": False, "error": "Missing or invalid Authorization header"}, status=401)
+    def deny(reason: str, detail: Any = None) -> Eligibility:
+        ELIGIBILITY_STATS["denied"] += 1
+        return Eligibility(False, reason, detail, linked_mc)
 
-            token = auth_header[7:]  # Remove "Bearer " prefix
-            if token != BOT_API_KEY:
-                return web.json_response({"ok": False, "error": "Invalid API key"}, status=401)
+    start("link", get_linked_minecraft_name_async(member.id))
+    if "ban" in checks:
+        start("ban", _check_test_ban(member.nick or member.display_name))
+    try:
+        while tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, _pending = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                name = tasks.pop(task)
+                try:
+                    value = task.result()
+                except Exception as e:
+                    print(f"[Eligibility] {name} check failed: {e}")
+                    if name not in ELIGIBILITY_SOFT_CHECKS:
+                        return deny("timeout")
+                    continue
+                if name == "link":
+                    if not value:
+                        return deny("link")
+                    linked_mc = value
+                    if "retired" in checks:
+                        start("retired", is_player_fully_retired(value))
+                    if "rank" in checks:
+                        start("rank", _eligibility_rank(value, mode_key))
+                elif name == "ban" and value:
+                    return deny("ban", value.get("reason", ""))
+                elif name == "retired" and value:
+                    return deny("retired")
+                elif name == "rank" and not can_join_queue(value):
+                    return deny("rank", value)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    missed = set(tasks.values())
+    if missed:
+        ELIGIBILITY_STATS["deadline_misses"] += 1
+        print(f"[Eligibility] {', '.join(sorted(missed))} missed the deadline for {member.id}/{mode_key}")
+        if missed - ELIGIBILITY_SOFT_CHECKS:
+            return deny("timeout")
+    return Eligibility(True, linked_mc=linked_mc)
+
+
+def queue_denial_message(result: Eligibility, mode_key: str) -> str:
+    if result.reason == "link":
+        return "❌ Nincs összekapcsolva a Minecraft fiókod! Használd a `/link` parancsot."
+    if result.reason == "retired":
+        return "❌ Teljes nyugdíjas vagy! Nem csatlakozhatsz queue-hoz."
+    if result.reason == "cooldown":
+        days = result.detail // (24 * 60 * 60)
+        hours = (result.detail % (24 * 60 * 60)) // (60 * 60)
+        return (
+            f"❌ Még **{days} nap {hours} óra** cooldown van hátra a **{get_gamemode_display_name(mode_key)}** módban. "
+            f"Várj a cooldown lejártáig, mielőtt újra queue-hoz csatlakozol."
+        )
+    if result.reason == "rank":
+        return (
+            f"❌ Csak **LT5-HT4** közöttiek csatlakozhatnak a queue-hoz. "
+            f"Rangod: **{result.detail}** (minimum: LT5, maximum: HT4)."
+        )
+    return "⚠️ Az ellenőrzés túl sokáig tartott, próbáld újra pár másodperc múlva."
 
-            # Parse request body
-            try:
-                payload = await request.json()
-            except Exception as e:
-                return web.json_response({"ok": False, "error": f"Invalid JSON: {str(e)}"}, status=400)
 
-            # Extract and validate required fields (with aliases)
-            discord_name = payload.get("discord_name") or payload.get("discordName") or payload.get("discord")
-            minecraft_name = payload.get("minecraft_name") or payload.get("minecraftName") or payload.get("minecraft")
-            tier = payload.get("tier") or payload.get("rank") or payload.get("testedTier")
-            gamemode = payload.get("gamemode") or payload.get("mode") or payload.get("gameMode")
-            fight_notes = payload.get("fightNotes", {})
+def ticket_denial_message(result: Eligibility, mode_key: str) -> str:
+    if result.reason == "link":
+        return (
+            "❌ **Nincs összekapcsolva a Minecraft fiókod!**\n\n"
+            "Használd a `/link` parancsot a Discordban, majd `/link <kód>` a Minecraftban, "
+            "hogy összekapcsold a fiókodat. Csak azok hozhatnak létre ticketet, akik összekapcsolták a fiókjukat!"
+        )
+    if result.reason == "ban":
+        return "❌ Ki vagy tiltva a tesztelésből!\n" + (f"**Ok:** {result.detail}" if result.detail else "")
+    if result.reason == "retired":
+        return "❌ Teljes nyugdíjas vagy! Nem nyithatsz ticketeket."
+    if result.reason == "cooldown":
+        days = result.detail // (24 * 3600)
+        hours = (result.detail % (24 * 3600)) // 3600
+        return f"⏳ **Cooldown**: ebből a játékmódból ({mode_key}) csak **{days} nap {hours} óra** múlva nyithatsz új ticketet."
+    return "⚠️ Az ellenőrzés túl sokáig tartott, próbáld újra pár másodperc múlva."
 
-            # Validate required fields
-            if not discord_name:
-                return web.json_response({"ok": False, "error": "Missing discord_name"}, status=400)
-            if not minecraft_name:
-                return web.json_response({"ok": False, "error": "Missing minecraft_name"}, status=400)
-            if not tier:
-                return web.json_response({"ok": False, "error": "Missing tier"}, status=400)
-            if not gamemode:
-                return web.json_response({"ok": False, "error": "Missing gamemode"}, status=400)
-            if not fight_notes or not isinstance(fight_notes, dict):
-                return web.json_response({"ok": False, "error": "fightNotes must be an object"}, status=400)
 
-            # Check that at least one fight note is filled
-            if not any(fight_notes.values()):
-                return web.json_response({"ok": False, "error": "At least one fight note must be filled"}, status=400)
+# =========================
+# TIERLIST INDEX
+# =========================
 
-            # Normalize tier (uppercase, remove spaces)
-            tier_normalized = tier.upper().replace(" ", "")
+class TierlistIndex:
+    """
+    Resident per-player point totals for global ranking. Players are keyed by
+    lowercased username; _ordered holds every player's negated total in
+    ascending order, so bisect gives "players with more points" in O(log n).
+    Kept current by the write paths (tier results, removals, retire, rename).
+    """
 
-            # Validate tier
-            valid_tiers = ["UNRANKED"] + [t for t in RANKS if t != "Unranked"]
-            if tier_normalized not in valid_tiers:
-                return web.json_response({"ok": False, "error": f"Invalid tier: {tier}"}, status=400)
+    def __init__(self):
+        self._tests: Dict[str, Dict[str, int]] = {}  # player -> {mode_key: points}
+        self._names: Dict[str, str] = {}  # player -> username as stored
+        self._totals: Dict[str, int] = {}
+        self._ordered: List[int] = []
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def replace_all(self, tests: List[Dict[str, Any]]) -> None:
+        """Rebuild from a full tests list (website /api/tests rows)."""
+        self._tests, self._names = {}, {}
+        for test in tests:
+            username = test.get("username")
+            if not username:
+                continue
+            key = username.lower()
+            self._names[key] = username
+            self._tests.setdefault(key, {})[normalize_gamemode(test.get("gamemode", ""))] = _test_points(test)
+        self._totals = {key: sum(modes.values()) for key, modes in self._tests.items()}
+        self._ordered = sorted(-total for total in self._totals.values())
+        self.loaded = True
+
+    def _set_total(self, key: str, total: Optional[int]) -> None:
+        old = self._totals.pop(key, None)
+        if old is not None:
+            del self._ordered[bisect.bisect_left(self._ordered, -old)]
+        if total is not None:
+            self._totals[key] = total
+            bisect.insort(self._ordered, -total)
+
+    def apply_test(self, username: str, gamemode: str, points: int, rank: Optional[str] = None) -> None:
+        key = username.lower()
+        self._names.setdefault(key, username)
+        modes = self._tests.setdefault(key, {})
+        modes[normalize_gamemode(gamemode)] = points
+        self._set_total(key, sum(modes.values()))
+
+    def remove_test(self, username: str, gamemode: Optional[str] = None) -> None:
+        """Drop one gamemode for a player, or the whole player when gamemode is None."""
+        key = username.lower()
+        modes = self._tests.get(key)
+        if modes is None:
+            return
+        if gamemode:
+            modes.pop(normalize_gamemode(gamemode), None)
+        if not gamemode or not modes:
+            self._tests.pop(key, None)
+            self._names.pop(key, None)
+            self._set_total(key, None)
+        else:
+            self._set_total(key, sum(modes.values()))
 
-            # Get gamemode display name and icon
-            gamemode_lower = gamemode.lower().strip()
-            gamemode_display = get_gamemode_display_name(gamemode_lower)
-            
-            # Get gamemode icon - map from gamemode display names to icons
-            gamemode_icon_map = {
-                "vanilla": "🎮",
-                "uhc": "🎮",
-                "pot": "🎮",
-                "nethpot": "🎮",
-                "smp": "🎮",
-                "sword": "🗡️",
-                "axe": "🪓",
-                "mace": "🔨",
-                "cart": "🛒",
-                "creeper": "💚",
-                "diasmp": "🎮",
-                "ogvanilla": "🎮",
-                "shieldlessuhc": "🎮",
-                "spearmace": "⚔️",
-                "spearelytra": "🪶",
-                "stickfight": "🎮",
-                "stick fight": "🎮",
-                "trident": "🔱",
-            }
-            gamemode_icon = gamemode_icon_map.get(gamemode_lower, "🎮")
+    def rename(self, old_name: str, new_name: str) -> None:
+        """Move a player's results to a new name; their modes win over the target's."""
+        modes = self._tests.get(old_name.lower())
+        if modes is None:
+            return
+        self.remove_test(old_name)
+        for mode_key, points in modes.items():
+            self.apply_test(new_name, mode_key, points)
+        self._names[new_name.lower()] = new_name
+
+    def total(self, username: str) -> Optional[int]:
+        return self._totals.get(username.lower())
+
+    def rank_of(self, username: str) -> Optional[int]:
+        """1-based global position (ties share a position), or None if not on the tierlist."""
+        total = self._totals.get(username.lower())
+        if total is None:
+            return None
+        return bisect.bisect_left(self._ordered, -total) + 1
 
-            # Build Discord message
-            message_lines = []
-            
-            # Header line
-            message_lines.append(f"{discord_name} - {minecraft_name} - **Sikeres volt {tier_normalized} teszten.**")
-            
-            # Gamemode line
-            message_lines.append(f"**__Gamemode__** {gamemode_icon} {gamemode_display}")
-            
-            # Fight notes lines - only show those with content
-            valid_fight_keys = ["LT3", "HT3", "LT2", "HT2", "LT1", "HT1"]
-            for fight_key in valid_fight_keys:
-                fight_text = fight_notes.get(fight_key, "").strip()
-                if fight_text:
-                    message_lines.append(f"**__{fight_key} Fightok__**")
-                    message_lines.append(f"> {fight_text}")
 
-            discord_message = "\n".join(message_lines)
+def _test_points(test: Dict[str, Any]) -> int:
+    """Points of a tests row; the stored value wins so retired ranks keep theirs."""
+    points = test.get("points")
+    if isinstance(points, (int, float)):
+        return int(points)
+    return POINTS.get(str(test.get("rank", "")), 0)
 
-            # Send message to Discord channel
-            if HIGH_TEST_CHANNEL_ID and HIGH_TEST_CHANNEL_ID > 0:
-                try:
-                    channel = bot.get_channel(HIGH_TEST_CHANNEL_ID)
-                    if channel:
-                        await channel.send(discord_message)
+
+TIERLIST_INDEX = TierlistIndex()
+
+
+async def fetch_all_tests() -> Optional[List[Dict[str, Any]]]:
+    """GET the full tests list from the website, or None on failure."""
+    if not WEBSITE_URL or not WEBSITE_BREAKER.allow():
+        return None
+    try:
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+        async with http_session.get(f"{WEBSITE_URL}/api/tests", headers=_auth_headers(), timeout=timeout) as resp:
+            WEBSITE_BREAKER.record_status(resp.status)
+            if resp.status != 200:
+                print(f"[Tierlist] Full fetch failed: {resp.status}")
+                return None
+            data = await resp.json()
+            return data.get("tests", [])
+    except Exception as e:
+        WEBSITE_BREAKER.record_failure()
+        print(f"[Tierlist] Full fetch error: {e}")
+        return None
+
+
+# =========================
+# USERNAME INDEX (autocomplete)
+# =========================
+
+AUTOCOMPLETE_LIMIT = 25  # Discord's max choices per autocomplete response
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _word_trigrams(word: str) -> set:
+    """Trigrams of "  word " (padded like pg_trgm), so short names share their start and end grams."""
+    return _trigrams(f"  {word} ")
+
+
+class UsernameIndex:
+    """
+    Tierlist usernames for autocomplete: a sorted list of casefolded names for
+    prefix lookups (bisect) plus padded-trigram postings for substring and
+    typo-tolerant matches; queries under three characters fall back to a scan.
+    Fed by TESTS_REPLICA with the same calls as TierlistIndex.
+    """
+
+    def __init__(self):
+        self._display: Dict[str, str] = {}  # casefolded -> username as stored
+        self._sorted: List[str] = []
+        self._postings: Dict[str, set] = {}  # trigram -> casefolded names
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def replace_all(self, tests: List[Dict[str, Any]]) -> None:
+        self._display, self._postings = {}, {}
+        for test in tests:
+            username = test.get("username")
+            if username:
+                self._display.setdefault(username.casefold(), username)
+        self._sorted = sorted(self._display)
+        for key in self._sorted:
+            for gram in _word_trigrams(key):
+                self._postings.setdefault(gram, set()).add(key)
+
+    def add(self, username: str) -> None:
+        key = username.casefold()
+        if key in self._display:
+            return
+        self._display[key] = username
+        bisect.insort(self._sorted, key)
+        for gram in _word_trigrams(key):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def discard(self, username: str) -> None:
+        key = username.casefold()
+        if self._display.pop(key, None) is None:
+            return
+        del self._sorted[bisect.bisect_left(self._sorted, key)]
+        for gram in _word_trigrams(key):
+            names = self._postings.get(gram)
+            if names is not None:
+                names.discard(key)
+                if not names:
+                    del self._postings[gram]
+
+    def apply_test(self, username: str, gamemode: str, points: int, rank: Optional[str] = None) -> None:
+        self.add(username)
+
+    def remove_test(self, username: str, gamemode: Optional[str] = None) -> None:
+        """Only a whole-player removal (gamemode None) takes the name out."""
+        if not gamemode:
+            self.discard(username)
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        self.discard(old_name)
+        self.add(new_name)
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[str]:
+        """Prefix matches first, then substring matches, then names sharing most trigrams."""
+        query = query.strip().casefold()
+        start = bisect.bisect_left(self._sorted, query)
+        found: List[str] = []
+        for key in self._sorted[start:start + limit]:
+            if not key.startswith(query):
+                break
+            found.append(key)
+
+        seen = set(found)
+        grams = _trigrams(query)
+        if len(found) < limit and query and not grams:
+            # Too short for trigrams: scan, earliest occurrence first
+            matches = (key for key in self._sorted if key not in seen and query in key)
+            found.extend(heapq.nsmallest(limit - len(found), matches, key=lambda k: (k.find(query), k)))
+
+        elif len(found) < limit and grams:
+            postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+            # Substring: the name must contain every (unpadded) trigram of the query
+            candidates = set.intersection(*postings) if postings[0] else set()
+            for key in sorted(candidates, key=lambda k: (k.find(query), k)):
+                if key not in seen and query in key:
+                    found.append(key)
+                    seen.add(key)
+                    if len(found) >= limit:
+                        break
+
+            if len(found) < limit:
+                # Fuzzy on padded trigrams: half of the query's in common, but at
+                # least two, which is all a one-letter typo leaves a short name
+                padded = _word_trigrams(query)
+                shared: Dict[str, int] = {}
+                for gram in padded:
+                    for key in self._postings.get(gram, ()):
+                        if key not in seen:
+                            shared[key] = shared.get(key, 0) + 1
+                needed = 2 if len(query) <= 5 else max(2, (len(padded) + 1) // 2)
+                ranked = sorted(
+                    (key for key, n in shared.items() if n >= needed),
+                    key=lambda k: (-shared[k], abs(len(k) - len(query)), k)
+                )
+                found.extend(ranked[:limit - len(found)])
+
+        return [self._display[key] for key in found]
+
+
+USERNAME_INDEX = UsernameIndex()
+
+
+async def autocomplete_player_name(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Tierlist player names for autocomplete, served from USERNAME_INDEX."""
+    if not TESTS_REPLICA.loaded:
+        # Autocomplete has ~3s to answer; start the load and offer nothing this time
+        asyncio.create_task(ensure_tests_replica())
+        return []
+    return [app_commands.Choice(name=u, value=u) for u in USERNAME_INDEX.search(current)]
+
+
+# =========================
+# SPIN SAMPLER (/spin)
+# =========================
+
+SPIN_SESSION_TTL = 6 * 60 * 60  # seconds of /spin inactivity before a guild's draw history resets
+SPIN_PICK_TRIES = 32  # random draws before falling back to scanning the bucket
+
+SPIN_STRATEGIES = [
+    ("Egyenletes", "uniform"),
+    ("Súlyozott (ritkán sorsoltak előnyben)", "weighted"),
+    ("Ismétlés nélkül", "norepeat"),
+]
+
+
+class SpinSampler:
+    """
+    Usernames bucketed by (gamemode key, rank) for /spin. Each bucket is a plain
+    list; _pos remembers every entry's index so removal is a swap with the last
+    element, and a uniform pick is random.choice. Fed by TESTS_REPLICA.
+
+    Per-guild sessions remember who was drawn: "weighted" favours players drawn
+    less often, "norepeat" skips everyone already drawn until the bucket runs out.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[tuple, List[str]] = {}  # (mode_key, RANK) -> usernames
+        self._where: Dict[tuple, tuple] = {}  # (player, mode_key) -> bucket
+        self._pos: Dict[tuple, int] = {}  # (player, mode_key) -> index in its bucket
+        self._player_modes: Dict[str, set] = {}  # player -> mode keys
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _bucket(gamemode: str, rank: str) -> tuple:
+        return normalize_gamemode(gamemode), str(rank).upper()
+
+    def bucket_size(self, gamemode: str, rank: str) -> int:
+        return len(self._buckets.get(self._bucket(gamemode, rank), ()))
+
+    def _insert(self, username: str, mode_key: str, rank: str) -> None:
+        player = username.lower()
+        entry = (player, mode_key)
+        bucket = (mode_key, str(rank).upper())
+        if entry in self._where:
+            if self._where[entry] == bucket:
+                self._buckets[bucket][self._pos[entry]] = username
+                return
+            self._remove(player, mode_key)
+        items = self._buckets.setdefault(bucket, [])
+        self._pos[entry] = len(items)
+        items.append(username)
+        self._where[entry] = bucket
+        self._player_modes.setdefault(player, set()).add(mode_key)
+
+    def _remove(self, player: str, mode_key: str) -> None:
+        entry = (player, mode_key)
+        bucket = self._where.pop(entry, None)
+        if bucket is None:
+            return
+        index = self._pos.pop(entry)
+        items = self._buckets[bucket]
+        last = items.pop()
+        if index < len(items):
+            items[index] = last
+            self._pos[(last.lower(), mode_key)] = index
+        if not items:
+            del self._buckets[bucket]
+        modes = self._player_modes.get(player)
+        if modes is not None:
+            modes.discard(mode_key)
+            if not modes:
+                del self._player_modes[player]
+
+    def replace_all(self, tests: List[Dict[str, Any]]) -> None:
+        self._buckets, self._where, self._pos, self._player_modes = {}, {}, {}, {}
+        for test in tests:
+            if test.get("username") and test.get("rank"):
+                self._insert(test["username"], normalize_gamemode(test.get("gamemode", "")), test["rank"])
+
+    def apply_test(self, username: str, gamemode: str, points: int, rank: Optional[str] = None) -> None:
+        if rank:
+            self._insert(username, normalize_gamemode(gamemode), rank)
+
+    def remove_test(self, username: str, gamemode: Optional[str] = None) -> None:
+        player = username.lower()
+        modes = [normalize_gamemode(gamemode)] if gamemode else list(self._player_modes.get(player, ()))
+        for mode_key in modes:
+            self._remove(player, mode_key)
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        old = old_name.lower()
+        for mode_key in list(self._player_modes.get(old, ())):
+            _mode, rank = self._where[(old, mode_key)]
+            self._remove(old, mode_key)
+            self._insert(new_name, mode_key, rank)
+
+    def _session(self, session_id: int) -> Dict[str, Any]:
+        now = time.time()
+        session = self._sessions.get(session_id)
+        if session is None or now - session["last"] > SPIN_SESSION_TTL:
+            session = self._sessions[session_id] = {"drawn": {}, "counts": {}}
+        session["last"] = now
+        return session
+
+    def pick(self, gamemode: str, rank: str, exclude: set = frozenset(), strategy: str = "uniform", session_id: int = 0) -> Optional[str]:
+        """Random username from the bucket, skipping lowercased names in exclude. None if nobody qualifies."""
+        bucket = self._bucket(gamemode, rank)
+        items = self._buckets.get(bucket)
+        if not items:
+            return None
+        session = self._session(session_id)
+        counts = session["counts"]
+        drawn = session["drawn"].setdefault(bucket, set()) if strategy == "norepeat" else None
+
+        def eligible(name: str) -> bool:
+            key = name.lower()
+            return key not in exclude and (drawn is None or key not in drawn)
+
+        def weight(name: str) -> float:
+            return 1.0 / (1 + counts.get(name.lower(), 0))
+
+        for _ in range(SPIN_PICK_TRIES):
+            choice = random.choice(items)
+            if not eligible(choice):
+                continue
+            # Rejection sampling keeps weighted picks O(1) on average
+            if strategy == "weighted" and random.random() >= weight(choice):
+                continue
+            break
+        else:
+            # Most of the bucket is excluded or already drawn
+            pool = [name for name in items if eligible(name)]
+            if not pool and drawn:
+                drawn.clear()  # everyone had a turn, start a new round
+                pool = [name for name in items if eligible(name)]
+            if not pool:
+                return None
+            if strategy == "weighted":
+                choice = random.choices(pool, weights=[weight(name) for name in pool])[0]
+            else:
+                choice = random.choice(pool)
+
+        counts[choice.lower()] = counts.get(choice.lower(), 0) + 1
+        if drawn is not None:
+            drawn.add(choice.lower())
+        return choice
+
+
+SPIN_SAMPLER = SpinSampler()
+
+
+# =========================
+# TESTS REPLICA (local copy of the tests table, kept current by polling)
+# =========================
+
+TESTS_SYNC_INTERVAL = 30  # seconds between incremental polls
+TESTS_FULL_SYNC_INTERVAL = 30 * 60  # seconds between full reconciliations (also catches deletions)
+TESTS_SYNC_PAGE_SIZE = 1000
+TESTS_STALE_AFTER = 5 * 60  # warn when the replica hasn't synced for this long
+
+
+def _parse_ts(value: Any) -> Optional[datetime.datetime]:
+    """created_at from any source (datetime, ISO string, epoch seconds/ms) as an aware datetime."""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, datetime.datetime):
+            ts = value
+        elif isinstance(value, (int, float)):
+            ts = datetime.datetime.fromtimestamp(value / 1000 if value > 1e11 else value, datetime.timezone.utc)
+        else:
+            ts = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+
+class TestsReplica:
+    """
+    In-memory copy of the tests table keyed by (lowercased username, gamemode key).
+    A full sync replaces it; incremental syncs fetch rows changed since the
+    created_at watermark (every upsert refreshes created_at). Local writes are
+    applied immediately. Attached indexes (TIERLIST_INDEX, ...) receive every
+    change through replace_all / apply_test / remove_test / rename.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, Dict[str, Dict[str, Any]]] = {}  # player -> {mode_key: row}
+        self.indexes: List[Any] = []
+        self.watermark: Optional[datetime.datetime] = None
+        self.loaded = False
+        self.last_sync = 0.0  # wall clock of the last successful sync
+        self.last_full_sync = 0.0
+        self.stats = {"full_syncs": 0, "incremental_syncs": 0, "rows_fetched": 0, "errors": 0}
+        self._lock = asyncio.Lock()
+
+    def attach(self, index: Any) -> None:
+        self.indexes.append(index)
+        if self.loaded:
+            index.replace_all(self.all_rows())
+
+    # --- reads ---
+
+    def all_rows(self) -> List[Dict[str, Any]]:
+        return [row for modes in self._rows.values() for row in modes.values()]
+
+    def player_tests(self, username: str) -> List[Dict[str, Any]]:
+        return list(self._rows.get(username.lower(), {}).values())
+
+    def player_test(self, username: str, gamemode: str) -> Optional[Dict[str, Any]]:
+        return self._rows.get(username.lower(), {}).get(normalize_gamemode(gamemode))
+
+    def usernames(self) -> List[str]:
+        return [next(iter(modes.values()))["username"] for modes in self._rows.values() if modes]
+
+    def staleness(self) -> Optional[float]:
+        """Seconds since the last successful sync, or None if never synced."""
+        return time.time() - self.last_sync if self.last_sync else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        staleness = self.staleness()
+        return {
+            "loaded": self.loaded,
+            "players": len(self._rows),
+            "rows": sum(len(modes) for modes in self._rows.values()),
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "staleness_seconds": round(staleness, 1) if staleness is not None else None,
+            "stale": staleness is None or staleness > TESTS_STALE_AFTER,
+            **self.stats,
+        }
+
+    # --- writes ---
+
+    @staticmethod
+    def _normalize(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        username = row.get("username")
+        gamemode = row.get("gamemode") or row.get("mode")
+        if not username or not gamemode:
+            return None
+        created_at = _parse_ts(row.get("created_at") or row.get("createdAt") or row.get("ts"))
+        return {
+            "id": row.get("id"),
+            "username": username,
+            "gamemode": get_gamemode_display_name(normalize_gamemode(gamemode)),
+            "rank": str(row.get("rank", "Unranked")),
+            "points": _test_points(row),
+            "created_at": created_at.isoformat() if created_at else None,
+        }
+
+    def replace_all(self, rows: List[Dict[str, Any]]) -> None:
+        self._rows = {}
+        self.watermark = None
+        for raw in rows:
+            row = self._normalize(raw)
+            if row:
+                self._store(row)
+        self.loaded = True
+        current = self.all_rows()
+        for index in self.indexes:
+            index.replace_all(current)
+
+    def _store(self, row: Dict[str, Any], advance: bool = True) -> None:
+        self._rows.setdefault(row["username"].lower(), {})[normalize_gamemode(row["gamemode"])] = row
+        ts = _parse_ts(row["created_at"])
+        if advance and ts and (self.watermark is None or ts > self.watermark):
+            self.watermark = ts
+
+    def upsert_rows(self, rows: List[Dict[str, Any]], advance: bool = True) -> int:
+        """Apply fetched rows. Returns how many changed something."""
+        changed = 0
+        for raw in rows:
+            row = self._normalize(raw)
+            if not row:
+                continue
+            existing = self.player_test(row["username"], row["gamemode"])
+            if existing and all(existing.get(k) == row.get(k) for k in ("username", "rank", "points", "created_at")):
+                continue
+            self._store(row, advance)
+            for index in self.indexes:
+                index.apply_test(row["username"], row["gamemode"], row["points"], row["rank"])
+            changed += 1
+        return changed
+
+    def apply_test(self, username: str, gamemode: str, points: int, rank: str) -> None:
+        """Mirror a successful local write. Our clock isn't the database's, so the watermark stays put."""
+        self.upsert_rows([{
+            "username": username,
+            "gamemode": gamemode,
+            "rank": rank,
+            "points": points,
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+        }], advance=False)
+
+    def remove_test(self, username: str, gamemode: Optional[str] = None) -> None:
+        key = username.lower()
+        modes = self._rows.get(key)
+        if modes is None:
+            return
+        if gamemode:
+            modes.pop(normalize_gamemode(gamemode), None)
+        if not gamemode or not modes:
+            self._rows.pop(key, None)
+            gamemode = None
+        for index in self.indexes:
+            index.remove_test(username, gamemode)
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        modes = self._rows.pop(old_name.lower(), None)
+        if modes is None:
+            return
+        target = self._rows.setdefault(new_name.lower(), {})
+        for mode_key, row in modes.items():
+            target[mode_key] = {**row, "username": new_name}
+        for index in self.indexes:
+            index.rename(old_name, new_name)
+
+    # --- sync ---
+
+    async def full_sync(self) -> bool:
+        async with self._lock:
+            rows = await _fetch_tests_since(None)
+            if rows is None:
+                self.stats["errors"] += 1
+                return False
+            self.replace_all(rows)
+            self.last_sync = self.last_full_sync = time.time()
+            self.stats["full_syncs"] += 1
+            self.stats["rows_fetched"] += len(rows)
+            print(f"[TestsSync] Full sync: {len(rows)} row(s), {len(self._rows)} player(s)")
+            return True
+
+    async def incremental_sync(self) -> bool:
+        if not self.loaded or self.watermark is None:
+            return await self.full_sync()
+        async with self._lock:
+            # gte, not gt: rows committed later with the same timestamp must not be skipped
+            rows = await _fetch_tests_since(self.watermark)
+            if rows is None:
+                self.stats["errors"] += 1
+                return False
+            if len(rows) >= TESTS_SYNC_PAGE_SIZE and all(_parse_ts(r.get("created_at")) == self.watermark for r in rows):
+                need_full = True  # a whole page shares the watermark; paging by timestamp can't advance
+            else:
+                need_full = False
+                changed = self.upsert_rows(rows)
+                self.last_sync = time.time()
+                self.stats["incremental_syncs"] += 1
+                self.stats["rows_fetched"] += len(rows)
+                if changed:
+                    print(f"[TestsSync] {changed} changed row(s)")
+        if need_full:
+            return await self.full_sync()
+        return True
+
+
+async def _fetch_tests_since(since: Optional[datetime.datetime]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Rows with created_at >= since (all rows when since is None) from the first available
+    source: Postgres, Supabase REST (gte. filter), then the website (?since=). None on failure.
+    """
+    if db_pool is not None and POSTGRES_BREAKER.allow():
+        try:
+            if since is None:
+                records = await pg_call(lambda conn: conn.fetch("SELECT id, username, gamemode, rank, points, created_at FROM tests"))
+            else:
+                records = await pg_call(lambda conn: conn.fetch(
+                    "SELECT id, username, gamemode, rank, points, created_at FROM tests WHERE created_at >= $1 ORDER BY created_at",
+                    since
+                ))
+            return [dict(r) for r in records]
+        except Exception as e:
+            print(f"[TestsSync] Postgres fetch failed: {e}")
+
+    if USE_SUPABASE_API and SUPABASE_BREAKER.allow():
+        rows = await _fetch_tests_supabase(since)
+        if rows is not None:
+            return rows
+
+    if since is None:
+        return await fetch_all_tests()
+    return await fetch_tests_since_website(since)
+
+
+async def _supabase_tests_page(params: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    One page of the tests table. Unlike supabase_select, a failure is None rather than [],
+    so an error is never mistaken for the last page. The caller has already passed the breaker.
+    """
+    try:
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+        async with pooled_session() as session:
+            async with session.get(f"{SUPABASE_URL}/rest/v1/{TESTS_TABLE}", headers=supabase_headers, params=params, timeout=timeout) as resp:
+                SUPABASE_BREAKER.record_status(resp.status)
+                if resp.status != 200:
+                    print(f"[TestsSync] Supabase page failed: {resp.status} - {await resp.text()}")
+                    return None
+                return await resp.json()
+    except Exception as e:
+        SUPABASE_BREAKER.record_failure()
+        print(f"[TestsSync] Supabase page error: {e!r}")
+        return None
+
+
+async def _fetch_tests_supabase(since: Optional[datetime.datetime]) -> Optional[List[Dict[str, Any]]]:
+    """
+    All rows with created_at >= since, paged by keyset on (created_at, id) so rows
+    written during the sync can't shift later pages. None if any page fails.
+    """
+    rows: List[Dict[str, Any]] = []
+    last: Optional[Dict[str, Any]] = None
+    while True:
+        params = {
+            "select": "id,username,gamemode,rank,points,created_at",
+            "order": "created_at.asc,id.asc",
+            "limit": str(TESTS_SYNC_PAGE_SIZE),
+        }
+        if since is not None:
+            params["created_at"] = f"gte.{since.isoformat()}"
+        if last is not None:
+            if last.get("created_at") is None or last.get("id") is None:
+                print("[TestsSync] Supabase keyset paging needs created_at and id on every row")
+                return None
+            ts = last["created_at"]
+            params["or"] = f'(created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt.{last["id"]}))'
+        page = await _supabase_tests_page(params)
+        if page is None:
+            return None
+        rows.extend(page)
+        if len(page) < TESTS_SYNC_PAGE_SIZE:
+            return rows
+        last = page[-1]
+
+
+async def fetch_tests_since_website(since: datetime.datetime) -> Optional[List[Dict[str, Any]]]:
+    """GET /api/tests?since=...; an API that ignores the parameter just returns everything (still correct)."""
+    if not WEBSITE_URL or not WEBSITE_BREAKER.allow():
+        return None
+    try:
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+        params = {"since": since.isoformat()}
+        async with http_session.get(f"{WEBSITE_URL}/api/tests", params=params, headers=_auth_headers(), timeout=timeout) as resp:
+            WEBSITE_BREAKER.record_status(resp.status)
+            if resp.status != 200:
+                print(f"[TestsSync] Website fetch failed: {resp.status}")
+                return None
+            data = await resp.json()
+            return data.get("tests", [])
+    except Exception as e:
+        WEBSITE_BREAKER.record_failure()
+        print(f"[TestsSync] Website fetch error: {e}")
+        return None
+
+
+TESTS_REPLICA = TestsReplica()
+TESTS_REPLICA.attach(TIERLIST_INDEX)
+TESTS_REPLICA.attach(USERNAME_INDEX)
+TESTS_REPLICA.attach(SPIN_SAMPLER)
+
+
+async def ensure_tests_replica() -> bool:
+    """Run the first full sync on demand. Returns whether the replica is available."""
+    if not TESTS_REPLICA.loaded:
+        await SINGLE_FLIGHT.do("tests_full_sync", (), TESTS_REPLICA.full_sync)
+    return TESTS_REPLICA.loaded
+
+
+async def tests_sync_task():
+    """Background loop: poll for changed tests rows and periodically reconcile in full."""
+    warned_stale = False
+    while True:
+        try:
+            if time.time() - TESTS_REPLICA.last_full_sync >= TESTS_FULL_SYNC_INTERVAL:
+                await TESTS_REPLICA.full_sync()
+            else:
+                await TESTS_REPLICA.incremental_sync()
+
+            staleness = TESTS_REPLICA.staleness()
+            if staleness is None or staleness > TESTS_STALE_AFTER:
+                if not warned_stale:
+                    print(f"[TestsSync] WARNING: replica is stale (last sync: {'never' if staleness is None else f'{staleness:.0f}s ago'})")
+                    warned_stale = True
+            elif warned_stale:
+                print("[TestsSync] Replica is current again")
+                warned_stale = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[TestsSync] Error: {e}")
+        await asyncio.sleep(TESTS_SYNC_INTERVAL)
+
+
+# =========================
+# DISCORD BOT
+# =========================
+intents = discord.Intents.default()
+intents.guilds = True
+intents.members = True
+
+bot = commands.Bot(command_prefix="!", intents=intents)
+http_session: Optional[aiohttp.ClientSession] = None
+
+
+# =========================
+# HEALTH SERVER (Railway)
+# =========================
+async def start_health_server():
+    global http_session
+    
+    # Ensure http_session is available
+    if http_session is None:
+        http_session = create_http_session()
+    
+    app = web.Application()
+
+    async def health(_request):
+        return web.Response(text="ok")
+
+    print("Health server endpoints registered")
+
+    # API endpoint for Minecraft link code verification
+    async def verify_link(request):
+        print(f"verify_link called: code={request.query.get('code')}, minecraft={request.query.get('minecraft')}")
+        try:
+            # Get code from query params
+            code = request.query.get("code", "")
+            minecraft_name = request.query.get("minecraft", "")
+
+            if not code or not minecraft_name:
+                return web.json_response({"success": False, "error": "Missing code or minecraft parameter"}, status=400)
+
+            print(f"Verifying code: {code}")
+            # Verify the code
+            discord_id = await verify_link_code_async(code.upper())
+            print(f"Verified: discord_id={discord_id}")
+
+            if discord_id is None:
+                return web.json_response({"success": False, "error": "Invalid or expired code"}, status=400)
+
+            # Ensure http_session is available for linking
+            global http_session
+            if http_session is None:
+                print("Creating http_session")
+                http_session = create_http_session()
+
+            # Link the Minecraft account to the Discord account
+            print(f"Linking account: {discord_id} -> {minecraft_name}")
+            await link_minecraft_account_async(discord_id, minecraft_name)
+
+            # Send confirmation DM to the user
+            try:
+                user = await bot.fetch_user(discord_id)
+                if user:
+                    embed = discord.Embed(
+                        title="Összekapcsolás sikeres!",
+                        description=f"A Discord fiókod össze lett kapcsolva a **Minecraft** fiókkal!\n\n**Minecraft név:** `{minecraft_name}`",
+                        color=discord.Color.green()
+                    )
+                    await user.send(embed=embed)
+            except Exception as e:
+                print(f"Could not send DM: {e}")
+
+            return web.json_response({"success": True, "discord_id": discord_id, "minecraft": minecraft_name})
+        except Exception as e:
+            import traceback
+            print(f"verify_link error: {e}")
+            traceback.print_exc()
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+
+        # Send confirmation DM to the user
+        try:
+            user = await bot.fetch_user(discord_id)
+            if user:
+                embed = discord.Embed(
+                    title="✅ Összekapcsolás sikeres!",
+                    description=f"A Discord fiókod össze lett kapcsolva a **Minecraft** fiókkal!\n\n"
+                               f"**Minecraft név:** `{minecraft_name}`\n"
+                               f"**Összekapcsolva:** Örökre!",
+                    color=discord.Color.green()
+                )
+                embed.set_footer(text="Most már használhatod a tierlistát!")
+                await user.send(embed=embed)
+        except Exception as e:
+            print(f"Could not send DM to user: {e}")
+
+        return web.json_response({
+            "success": True, 
+            "discord_id": discord_id,
+            "minecraft": minecraft_name
+        })
+
+    # API endpoint for high test announcements
+    async def handle_high_test(request):
+        print(f"handle_high_test called")
+        try:
+            # Check authentication
+            auth_header = request.headers.get("Authorization", "")
+            if not auth_header.startswith("Bearer "):
+                return web.json_response({"ok": False, "error": "Missing or invalid Authorization header"}, status=401)
+
+            token = auth_header[7:]  # Remove "Bearer " prefix
+            if token != BOT_API_KEY:
+                return web.json_response({"ok": False, "error": "Invalid API key"}, status=401)
+
+            # Parse request body
+            try:
+                payload = await request.json()
+            except Exception as e:
+                return web.json_response({"ok": False, "error": f"Invalid JSON: {str(e)}"}, status=400)
+
+            # Extract and validate required fields (with aliases)
+            discord_name = payload.get("discord_name") or payload.get("discordName") or payload.get("discord")
+            minecraft_name = payload.get("minecraft_name") or payload.get("minecraftName") or payload.get("minecraft")
+            tier = payload.get("tier") or payload.get("rank") or payload.get("testedTier")
+            gamemode = payload.get("gamemode") or payload.get("mode") or payload.get("gameMode")
+            fight_notes = payload.get("fightNotes", {})
+
+            # Validate required fields
+            if not discord_name:
+                return web.json_response({"ok": False, "error": "Missing discord_name"}, status=400)
+            if not minecraft_name:
+                return web.json_response({"ok": False, "error": "Missing minecraft_name"}, status=400)
+            if not tier:
+                return web.json_response({"ok": False, "error": "Missing tier"}, status=400)
+            if not gamemode:
+                return web.json_response({"ok": False, "error": "Missing gamemode"}, status=400)
+            if not fight_notes or not isinstance(fight_notes, dict):
+                return web.json_response({"ok": False, "error": "fightNotes must be an object"}, status=400)
+
+            # Check that at least one fight note is filled
+            if not any(fight_notes.values()):
+                return web.json_response({"ok": False, "error": "At least one fight note must be filled"}, status=400)
+
+            # Normalize tier (uppercase, remove spaces)
+            tier_normalized = tier.upper().replace(" ", "")
+
+            # Validate tier
+            valid_tiers = ["UNRANKED"] + [t for t in RANKS if t != "Unranked"]
+            if tier_normalized not in valid_tiers:
+                return web.json_response({"ok": False, "error": f"Invalid tier: {tier}"}, status=400)
+
+            # Get gamemode display name and icon
+            gamemode_lower = gamemode.lower().strip()
+            gamemode_display = get_gamemode_display_name(gamemode_lower)
+            
+            # Get gamemode icon - map from gamemode display names to icons
+            gamemode_icon_map = {
+                "vanilla": "🎮",
+                "uhc": "🎮",
+                "pot": "🎮",
+                "nethpot": "🎮",
+                "smp": "🎮",
+                "sword": "🗡️",
+                "axe": "🪓",
+                "mace": "🔨",
+                "cart": "🛒",
+                "creeper": "💚",
+                "diasmp": "🎮",
+                "ogvanilla": "🎮",
+                "shieldlessuhc": "🎮",
+                "spearmace": "⚔️",
+                "spearelytra": "🪶",
+                "stickfight": "🎮",
+                "stick fight": "🎮",
+                "trident": "🔱",
+            }
+            gamemode_icon = gamemode_icon_map.get(gamemode_lower, "🎮")
+
+            # Build Discord message
+            message_lines = []
+            
+            # Header line
+            message_lines.append(f"{discord_name} - {minecraft_name} - **Sikeres volt {tier_normalized} teszten.**")
+            
+            # Gamemode line
+            message_lines.append(f"**__Gamemode__** {gamemode_icon} {gamemode_display}")
+            
+            # Fight notes lines - only show those with content
+            valid_fight_keys = ["LT3", "HT3", "LT2", "HT2", "LT1", "HT1"]
+            for fight_key in valid_fight_keys:
+                fight_text = fight_notes.get(fight_key, "").strip()
+                if fight_text:
+                    message_lines.append(f"**__{fight_key} Fightok__**")
+                    message_lines.append(f"> {fight_text}")
+
+            discord_message = "\n".join(message_lines)
+
+            # Send message to Discord channel
+            if HIGH_TEST_CHANNEL_ID and HIGH_TEST_CHANNEL_ID > 0:
+                try:
+                    channel = bot.get_channel(HIGH_TEST_CHANNEL_ID)
+                    if channel:
+                        await channel.send(discord_message)
                         print(f"Sent high-test message to channel {HIGH_TEST_CHANNEL_ID}")
                     else:
                         print(f"Channel {HIGH_TEST_CHANNEL_ID} not found")
@@ -1715,7 +4010,11 @@ async def start_health_server():
             traceback.print_exc()
             return web.json_response({"ok": False, "error": str(e)}, status=500)
 
+    async def metrics(_request):
+        return web.json_response(collect_metrics())
+
     app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
     app.router.add_get("/api/link/verify", verify_link)
     app.router.add_post("/api/high-test", handle_high_test)
 
@@ -1806,10 +4105,11 @@ async def fetch_bot_notifications() -> list:
     url = f"{BOT_NOTIFICATIONS_API_URL}/api/bot-notifications"
     try:
         timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with pooled_session() as session:
             async with session.get(
                 url,
                 headers={"Authorization": f"Bearer {BOT_API_KEY}"},
+                timeout=timeout,
             ) as resp:
                 if resp.status == 200:
                     data = await resp.json()
@@ -1844,7 +4144,7 @@ async def mark_notifications_processed(ids: list) -> bool:
     url = f"{BOT_NOTIFICATIONS_API_URL}/api/bot-notifications"
     try:
         timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with pooled_session() as session:
             async with session.post(
                 url,
                 headers={
@@ -1852,6 +4152,7 @@ async def mark_notifications_processed(ids: list) -> bool:
                     "Content-Type": "application/json",
                 },
                 json={"ids": ids},
+                timeout=timeout,
             ) as resp:
                 if resp.status in (200, 201, 204):
                     print(f"[BotNotifications] Marked {len(ids)} notification(s) as processed ({resp.status})")
@@ -1921,7 +4222,12 @@ async def send_bot_notifications_task():
             print(f"[BotNotifications] Task fatal error: {exc}")
 
 
-async def api_get_tests(username: str, mode: str) -> Dict[str, Any]:
+async def api_get_tests(username: str, mode: str = "") -> Dict[str, Any]:
+    """GET the website's tests for a player (optionally one gamemode); identical concurrent calls share one request."""
+    return await SINGLE_FLIGHT.do("tests", _flight_params(username, mode), lambda: _api_get_tests(username, mode))
+
+
+async def _api_get_tests(username: str, mode: str) -> Dict[str, Any]:
     if not WEBSITE_URL:
         return {"status": 0, "data": {"tests": []}}
 
@@ -1929,11 +4235,14 @@ async def api_get_tests(username: str, mode: str) -> Dict[str, Any]:
     if mode:
         mode_for_api = get_gamemode_display_name(mode)
         url += f"&gamemode={mode_for_api}"
+    if not WEBSITE_BREAKER.allow():
+        return {"status": 0, "data": {"error": "website unavailable (circuit open)"}}
     print(f"[API_GET_TESTS] Requesting: {url}")
 
     try:
         timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
         async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+            WEBSITE_BREAKER.record_status(resp.status)
             print(f"[API_GET_TESTS] Response status: {resp.status}")
             try:
                 data = await resp.json()
@@ -1941,14 +4250,25 @@ async def api_get_tests(username: str, mode: str) -> Dict[str, Any]:
                 data = {"error": await resp.text()}
             return {"status": resp.status, "data": data}
     except asyncio.TimeoutError:
+        WEBSITE_BREAKER.record_failure()
         print(f"[API_GET_TESTS] Timeout fetching tests for {username}")
         return {"status": 0, "data": {"error": "timeout"}}
     except Exception as e:
+        WEBSITE_BREAKER.record_failure()
         print(f"[API_GET_TESTS] Error: {e}")
         return {"status": 0, "data": {"error": str(e)}}
 
 
 async def api_post_test(username: str, mode: str, rank: str, tester: discord.Member) -> Dict[str, Any]:
+    """Save a tier result (Postgres, then Supabase, then the website) and mirror it into the tierlist index."""
+    result = await _api_post_test(username, mode, rank, tester)
+    if result.get("status") in (200, 201):
+        TESTS_REPLICA.apply_test(username, mode, POINTS.get(rank, 0), rank)
+        ELIGIBILITY_RANK_CACHE.pop((username.lower(), normalize_gamemode(mode)), None)
+    return result
+
+
+async def _api_post_test(username: str, mode: str, rank: str, tester: discord.Member) -> Dict[str, Any]:
     mode_for_api = get_gamemode_display_name(mode)
 
     # Primary: Direct PostgreSQL upsert (atomic ON CONFLICT) – most reliable
@@ -1963,66 +4283,23 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
             ts=int(time.time())
         )
         if success:
-            # Also cache the result locally (non-fatal if it fails)
-            try:
-                await cache_test_result(
-                    username=username,
-                    mode_key=mode,
-                    rank=rank,
-                    tester_id=str(tester.id),
-                    tester_name=tester.display_name,
-                    ts=int(time.time())
-                )
-            except Exception as e:
-                print(f"Warning: failed to cache test result: {e}")
+            # The tests table is the cache, so there is nothing else to write
             return {"status": 200, "data": {"success": True}}
         print("DB upsert failed, falling back")
 
-    # Secondary: Supabase REST API with existence check (like cache_test_result)
+    # Secondary: Supabase REST API, one upsert request on (username_lower, gamemode)
     if USE_SUPABASE_API:
-        print(f"[API_POST_TEST] Checking Supabase: {username}/{mode_for_api}")
-        points = POINTS.get(rank, 0)
-        payload = {
-            "username": username,
-            "gamemode": mode_for_api,
-            "rank": rank,
-            "points": points,
-            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
-        }
-        # Check if record exists first (required for proper upsert without unique constraint)
-        existing = await supabase_select(TESTS_TABLE, {
-            "username": username,
-            "gamemode": mode_for_api
-        })
-        success = False
-        if existing:
-            # Update existing record
-            success = await supabase_update(TESTS_TABLE, payload, {
-                "username": username,
-                "gamemode": mode_for_api
-            })
-        else:
-            # Insert new record
-            success = await supabase_insert(TESTS_TABLE, payload)
+        print(f"[API_POST_TEST] Supabase upsert: {username}/{mode_for_api}")
+        success = await supabase_upsert_tests(_test_row(username, mode, rank))
         if success:
-            # Also cache locally
-            try:
-                await cache_test_result(
-                    username=username,
-                    mode_key=mode,
-                    rank=rank,
-                    tester_id=str(tester.id),
-                    tester_name=tester.display_name,
-                    ts=int(time.time())
-                )
-            except Exception as e:
-                print(f"Warning: failed to cache test result: {e}")
             return {"status": 200, "data": {"success": True}}
-        print("Supabase API failed, falling back")
+        print(f"[API_POST_TEST] Supabase upsert failed for {username}/{mode_for_api}, falling back to the website")
 
     # Fallback: Website API – check existence first, then either PUT or POST
     if not WEBSITE_URL:
         return {"status": 0, "data": {"error": "WEBSITE_URL not set"}}
+    if not WEBSITE_BREAKER.allow():
+        return {"status": 0, "data": {"error": "website unavailable (circuit open)"}}
 
     timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
 
@@ -2030,6 +4307,7 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
     try:
         check_url = f"{WEBSITE_URL}/api/tests?username={username}&mode={mode_for_api}"
         async with http_session.get(check_url, headers=_auth_headers(), timeout=timeout) as resp:
+            WEBSITE_BREAKER.record_status(resp.status)
             if resp.status == 200:
                 data = await resp.json()
                 test = data.get("test") or (data.get("tests") or [None])[0]
@@ -2046,6 +4324,7 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
                         "ts": int(time.time()),
                     }
                     async with http_session.put(update_url, json=put_payload, headers=_auth_headers(), timeout=timeout) as put_resp:
+                        WEBSITE_BREAKER.record_status(put_resp.status)
                         try:
                             put_data = await put_resp.json()
                         except Exception:
@@ -2068,7 +4347,11 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
                 else:
                     print("No existing test, creating via POST")
     except Exception as e:
+        WEBSITE_BREAKER.record_failure()
         print(f"Error checking existing test: {e}")
+        # A timeout or connection error here means the POST would hit the same wall
+        if not WEBSITE_BREAKER.allow():
+            return {"status": 0, "data": {"error": "website unavailable (circuit open)"}}
 
     # POST new test (no upsert flag)
     url = f"{WEBSITE_URL}/api/tests"
@@ -2083,6 +4366,7 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
     print(f"[API_POST_TEST] POST new test: {username}/{mode_for_api}")
     try:
         async with http_session.post(url, json=payload, headers=_auth_headers(), timeout=timeout) as resp:
+            WEBSITE_BREAKER.record_status(resp.status)
             try:
                 data = await resp.json()
             except Exception:
@@ -2106,6 +4390,7 @@ async def api_post_test(username: str, mode: str, rank: str, tester: discord.Mem
                     print(f"Warning: failed to cache test result: {e}")
             return {"status": resp.status, "data": data}
     except Exception as e:
+        WEBSITE_BREAKER.record_failure()
         print(f"[API_POST_TEST] POST exception: {e}")
         return {"status": 0, "data": {"error": str(e)}}
 
@@ -2128,6 +4413,8 @@ async def api_rename_player(old_name: str, new_name: str) -> Dict[str, Any]:
             data = await resp.json()
         except Exception:
             data = {"error": await resp.text()}
+        if resp.status == 200:
+            TESTS_REPLICA.rename(old_name, new_name)
         return {"status": resp.status, "data": data}
 
 
@@ -2178,6 +4465,7 @@ async def api_remove_player(username: str, gamemode: Optional[str] = None) -> Di
         status = resp.status
         # If removal succeeded, also clear local cache
         if status == 200:
+            TESTS_REPLICA.remove_test(username, gamemode)
             try:
                 if gamemode:
                     # Convert display name to internal key
@@ -2214,13 +4502,9 @@ class CloseTicketView(discord.ui.View):
             await interaction.response.send_message("Hiba: member not found.", ephemeral=True)
             return
 
-        topic = channel.topic or ""
-        owner_id = 0
-        if "owner=" in topic:
-            try:
-                owner_id = int(topic.split("owner=")[1].split("|")[0].strip())
-            except (ValueError, IndexError):
-                owner_id = 0
+        ticket = TICKETS.lookup(channel)
+        owner_id = ticket["owner_id"] if ticket else 0
+        mode_key = ticket["mode_key"] if ticket else ""
 
         if member.id != owner_id and not is_staff_member(member):
             await interaction.response.send_message("Nincs jogosultságod a ticket zárásához.", ephemeral=True)
@@ -2228,23 +4512,9 @@ class CloseTicketView(discord.ui.View):
 
         await interaction.response.send_message("✅ Ticket zárása... 3 mp múlva törlöm a csatornát.", ephemeral=True)
 
-        # Get owner_id and mode_key from channel topic
-        topic = channel.topic or ""
-        owner_id = 0
-        mode_key = ""
-        if "owner=" in topic:
-            try:
-                owner_id = int(topic.split("owner=")[1].split("|")[0].strip())
-            except (ValueError, IndexError):
-                owner_id = 0
-        if "mode=" in topic:
-            try:
-                mode_key = topic.split("mode=")[1].split("|")[0].strip()
-            except (ValueError, IndexError):
-                mode_key = ""
-
         set_last_closed(owner_id, mode_key, time.time())
         set_open_ticket_channel_id(owner_id, mode_key, None)
+        TICKETS.close(channel.id)
 
         await asyncio.sleep(3)
         try:
@@ -2274,25 +4544,15 @@ class CloseTicketView(discord.ui.View):
             await interaction.response.send_message("Hiba: ez nem szövegcsatorna.", ephemeral=True)
             return
 
-        topic = channel.topic or ""
-        owner_id = 0
-        mode_key = ""
-        if "owner=" in topic:
-            try:
-                owner_id = int(topic.split("owner=")[1].split("|")[0].strip())
-            except (ValueError, IndexError):
-                owner_id = 0
-        if "mode=" in topic:
-            try:
-                mode_key = topic.split("mode=")[1].split("|")[0].strip()
-            except (ValueError, IndexError):
-                mode_key = ""
+        ticket = TICKETS.lookup(channel)
+        owner_id = ticket["owner_id"] if ticket else 0
+        mode_key = ticket["mode_key"] if ticket else ""
 
         if owner_id == 0:
             await interaction.response.send_message("Hiba: nem találom a ticket tulajdonosát.", ephemeral=True)
             return
 
-        linked_minecraft = get_linked_minecraft_name(owner_id)
+        linked_minecraft = await get_linked_minecraft_name_async(owner_id)
         if not linked_minecraft:
             await interaction.response.send_message("❌ A játékos nincs összekapcsolva! Nem tudom a Minecraft nevét.", ephemeral=True)
             return
@@ -2443,61 +4703,15 @@ class TicketButton(discord.ui.Button):
             await interaction.response.send_message("Hiba: guild/member nem elérhető.", ephemeral=True)
             return
 
-        linked_minecraft = get_linked_minecraft_name(member.id)
-        if not linked_minecraft:
-            await interaction.response.send_message(
-                "❌ **Nincs összekapcsolva a Minecraft fiókod!**\n\n"
-                "Használd a `/link` parancsot a Discordban, majd `/link <kód>` a Minecraftban, "
-                "hogy összekapcsold a fiókodat. Csak azok hozhatnak létre ticketet, akik összekapcsolták a fiókjukat!",
-                ephemeral=True
-            )
-            return
-
-        player_name = member.display_name
-        if member.nick:
-            player_name = member.nick
-
-        if WEBSITE_URL:
-            try:
-                url = f"{WEBSITE_URL}/api/tests/ban?username={player_name}"
-                timeout = aiohttp.ClientTimeout(total=5)
-                async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-                    if resp.status == 200:
-                        ban_data = await resp.json()
-                        if ban_data.get("banned"):
-                            reason = ban_data.get("reason", "")
-                            await interaction.response.send_message(
-                                f"❌ Ki vagy tiltva a tesztelésből!\n" +
-                                (f"**Ok:** {reason}" if reason else ""),
-                                ephemeral=True
-                            )
-                            return
-            except Exception:
-                pass
-
-        # Check if fully retired
-        if await is_player_fully_retired(linked_minecraft):
-            await interaction.response.send_message(
-                "❌ Teljes nyugdíjas vagy! Nem nyithatsz ticketeket.",
-                ephemeral=True
-            )
-            return
-
-        left = cooldown_left(member.id, self.mode_key)
-        if left > 0:
-            days = left // (24 * 3600)
-            hours = (left % (24 * 3600)) // 3600
-            await interaction.response.send_message(
-                f"⏳ **Cooldown**: ebből a játékmódból ({self.mode_key}) csak **{days} nap {hours} óra** múlva nyithatsz új ticketet.",
-                ephemeral=True
-            )
+        # Link, ban, retired and cooldown checks run concurrently under one deadline
+        result = await evaluate_eligibility(member, self.mode_key, TICKET_CHECKS)
+        if not result.ok:
+            await interaction.response.send_message(ticket_denial_message(result, self.mode_key), ephemeral=True)
             return
+        linked_minecraft = result.linked_mc
 
         # Acquire lock
-        lock_key = (member.id, self.mode_key)
-        if lock_key not in TICKET_CREATION_LOCKS:
-            TICKET_CREATION_LOCKS[lock_key] = asyncio.Lock()
-        async with TICKET_CREATION_LOCKS[lock_key]:
+        async with TICKET_LOCKS.hold((member.id, self.mode_key)):
             existing_channel_id = get_open_ticket_channel_id(member.id, self.mode_key)
             if existing_channel_id:
                 ch = guild.get_channel(existing_channel_id)
@@ -2505,7 +4719,9 @@ class TicketButton(discord.ui.Button):
                     await interaction.response.send_message("Van már ticketed ebből a játékmódból. 🔒", ephemeral=True)
                     return
                 else:
+                    # Channel deleted by hand: drop the registry entry along with the ticket state
                     set_open_ticket_channel_id(member.id, self.mode_key, None)
+                    TICKETS.close(existing_channel_id)
 
             category = guild.get_channel(TICKET_CATEGORY_ID) if TICKET_CATEGORY_ID else None
             if TICKET_CATEGORY_ID and not isinstance(category, discord.CategoryChannel):
@@ -2545,6 +4761,7 @@ class TicketButton(discord.ui.Button):
                 return
 
             set_open_ticket_channel_id(member.id, self.mode_key, channel.id)
+            TICKETS.open(channel.id, member.id, self.mode_key, linked_minecraft)
 
             # Ping the tester role for this gamemode
             ping_role_id = QUEUE_PING_ROLES.get(self.mode_key)
@@ -2603,19 +4820,250 @@ QUEUE_PING_ROLES = {key: role_id for _, key, role_id in TICKET_TYPES}
 TICKET_CREATE_CATEGORY_ID = 1495038336744689674
 
 # In-memory queue storage
-ACTIVE_QUEUES: Dict[str, Dict[str, Any]] = {}
+ACTIVE_QUEUES: Dict[str, "GameQueue"] = {}
 QUEUE_MESSAGE_IDS: Dict[int, str] = {}
 QUEUE_PANEL_MESSAGE = None  # Tuple of (channel_id, message_id) for the queue panel message
 
-# Lock to prevent duplicate ticket creation (key: (user_id, mode_key))
-TICKET_CREATION_LOCKS: Dict[tuple, asyncio.Lock] = {}
 
 class QueuePlayer:
     """Represents a player in a queue"""
-    def __init__(self, discord_id: int, minecraft_name: str):
+    def __init__(self, discord_id: int, minecraft_name: str, joined_at: Optional[float] = None):
         self.discord_id = discord_id
         self.minecraft_name = minecraft_name
-        self.joined_at = time.time()
+        self.joined_at = joined_at if joined_at is not None else time.time()
+
+
+class _Fenwick:
+    """Prefix sums over an append-only sequence of 0/1 slots (1 = still waiting)."""
+
+    def __init__(self):
+        self._tree: List[int] = [0]  # 1-based
+
+    def _prefix(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def append(self, value: int) -> int:
+        """Add a slot at the end; returns its 1-based index."""
+        i = len(self._tree)
+        self._tree.append(value + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        return i
+
+    def add(self, i: int, delta: int) -> None:
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        return self._prefix(i)
+
+
+# discord_id -> {gamemode: "player" | "tester"} across every open queue
+QUEUE_MEMBERSHIP: Dict[int, Dict[str, str]] = {}
+
+
+def queues_of(discord_id: int) -> Dict[str, str]:
+    """Open queues the user is in, as {gamemode: role}."""
+    return dict(QUEUE_MEMBERSHIP.get(discord_id, {}))
+
+
+def other_queues_note(discord_id: int, gamemode: str) -> str:
+    """Reply suffix naming the user's other open queues ("" if there are none)."""
+    others = [
+        f"**{get_gamemode_display_name(gm)}** ({'teszter' if role == 'tester' else 'játékos'})"
+        for gm, role in sorted(queues_of(discord_id).items()) if gm != gamemode
+    ]
+    return f"\nTovábbi queue-k, amikben benne vagy: {', '.join(others)}" if others else ""
+
+
+class GameQueue:
+    """
+    One open queue. Players and testers are OrderedDicts keyed by discord id, so
+    join, leave, dedupe and next-player are O(1); each player also holds a slot
+    in a Fenwick tree over join order, which gives their position in O(log n).
+    Every change is mirrored into QUEUE_MEMBERSHIP.
+    """
+
+    def __init__(self, gamemode: str, opened_by: int, opened_at: Optional[float] = None):
+        self.gamemode = gamemode
+        self.opened_by = opened_by
+        self.opened_at = opened_at if opened_at is not None else time.time()
+        self.called_players: List[int] = []
+        self._players: "OrderedDict[int, QueuePlayer]" = OrderedDict()
+        self._testers: "OrderedDict[int, QueuePlayer]" = OrderedDict()
+        self._slots: Dict[int, int] = {}  # player discord_id -> Fenwick slot
+        self._waiting = _Fenwick()
+
+    @property
+    def players(self) -> List[QueuePlayer]:
+        return list(self._players.values())
+
+    @property
+    def testers(self) -> List[QueuePlayer]:
+        return list(self._testers.values())
+
+    @property
+    def player_count(self) -> int:
+        return len(self._players)
+
+    @property
+    def tester_count(self) -> int:
+        return len(self._testers)
+
+    def role_of(self, discord_id: int) -> Optional[str]:
+        if discord_id in self._players:
+            return "player"
+        if discord_id in self._testers:
+            return "tester"
+        return None
+
+    def _index(self, discord_id: int, role: Optional[str]) -> None:
+        if role is None:
+            modes = QUEUE_MEMBERSHIP.get(discord_id)
+            if modes is not None:
+                modes.pop(self.gamemode, None)
+                if not modes:
+                    del QUEUE_MEMBERSHIP[discord_id]
+        else:
+            QUEUE_MEMBERSHIP.setdefault(discord_id, {})[self.gamemode] = role
+
+    def add_player(self, player: QueuePlayer) -> bool:
+        """Append to the end of the queue. False if the user is already in it (either role)."""
+        if self.role_of(player.discord_id):
+            return False
+        self._players[player.discord_id] = player
+        self._slots[player.discord_id] = self._waiting.append(1)
+        self._index(player.discord_id, "player")
+        return True
+
+    def add_tester(self, tester: QueuePlayer) -> bool:
+        if self.role_of(tester.discord_id):
+            return False
+        self._testers[tester.discord_id] = tester
+        self._index(tester.discord_id, "tester")
+        return True
+
+    def remove(self, discord_id: int) -> Optional[str]:
+        """Take the user out of the queue. Returns the role they had, or None."""
+        if self._players.pop(discord_id, None) is not None:
+            self._waiting.add(self._slots.pop(discord_id), -1)
+            role = "player"
+        elif self._testers.pop(discord_id, None) is not None:
+            role = "tester"
+        else:
+            return None
+        self._index(discord_id, None)
+        return role
+
+    def pop_next_player(self) -> Optional[QueuePlayer]:
+        """FIFO: remove the longest-waiting player and record them as called."""
+        if not self._players:
+            return None
+        discord_id, player = self._players.popitem(last=False)
+        self._waiting.add(self._slots.pop(discord_id), -1)
+        self._index(discord_id, None)
+        self.called_players.append(discord_id)
+        return player
+
+    def position(self, discord_id: int) -> Optional[int]:
+        """1-based place among waiting players, or None if not waiting."""
+        slot = self._slots.get(discord_id)
+        return self._waiting.prefix(slot) if slot is not None else None
+
+    def retain(self, keep) -> None:
+        """Drop every player/tester for whom keep(discord_id) is false."""
+        for discord_id in [uid for uid in list(self._players) + list(self._testers) if not keep(uid)]:
+            self.remove(discord_id)
+
+    def close(self) -> None:
+        """Release every member from QUEUE_MEMBERSHIP (the queue is going away)."""
+        for discord_id in list(self._players) + list(self._testers):
+            self._index(discord_id, None)
+
+    def to_state(self) -> Dict[str, Any]:
+        """JSON form for the state store"""
+        return {
+            "opened_by": self.opened_by,
+            "opened_at": self.opened_at,
+            "players": [[p.discord_id, p.minecraft_name, p.joined_at] for p in self._players.values()],
+            "testers": [[t.discord_id, t.minecraft_name, t.joined_at] for t in self._testers.values()],
+            "called_players": list(self.called_players),
+        }
+
+    @classmethod
+    def from_state(cls, gamemode: str, entry: Dict[str, Any]) -> "GameQueue":
+        # Parse everything first so a bad entry can't leave members in QUEUE_MEMBERSHIP
+        players = [QueuePlayer(int(p[0]), p[1], float(p[2])) for p in entry.get("players", [])]
+        testers = [QueuePlayer(int(t[0]), t[1], float(t[2])) for t in entry.get("testers", [])]
+        called = [int(uid) for uid in entry.get("called_players", [])]
+        queue = cls(gamemode, int(entry["opened_by"]), float(entry.get("opened_at", 0)))
+        for player in players:
+            queue.add_player(player)
+        for tester in testers:
+            queue.add_tester(tester)
+        queue.called_players = called
+        return queue
+
+
+def _close_active_queue(gamemode: str) -> Optional[GameQueue]:
+    """Remove the queue from ACTIVE_QUEUES (and its members from the index) and persist that."""
+    queue = ACTIVE_QUEUES.pop(gamemode, None)
+    if queue is not None:
+        queue.close()
+    _persist_queue(gamemode)
+    return queue
+
+
+def _persist_queue(gamemode: str) -> None:
+    """Write one queue's current state to the state store (or drop it once closed)"""
+    try:
+        queue = ACTIVE_QUEUES.get(gamemode)
+        if queue is None:
+            STATE_STORE.delete(["active_queues", gamemode])
+            return
+        state = queue.to_state()
+        # The maintenance loop re-renders unchanged queues; don't journal those
+        if STATE_STORE.get("active_queues", gamemode) != state:
+            STATE_STORE.set(["active_queues", gamemode], state)
+    except Exception as e:
+        print(f"Error persisting queue {gamemode}: {e}")
+
+
+def restore_active_queues() -> int:
+    """
+    Rebuild ACTIVE_QUEUES from the state store after a restart. A queue is only
+    restored while its queue message is still mapped in QUEUE_MESSAGE_IDS, and
+    players/testers who left the guild are dropped. Returns the restored count.
+    """
+    restored = 0
+    live_modes = set(QUEUE_MESSAGE_IDS.values())
+    for gamemode, entry in list((STATE_STORE.get("active_queues", default={}) or {}).items()):
+        if gamemode in ACTIVE_QUEUES:
+            continue  # reconnect: the in-memory queue is newer
+        if gamemode not in live_modes:
+            STATE_STORE.delete(["active_queues", gamemode])
+            continue
+        try:
+            queue = GameQueue.from_state(gamemode, entry)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"[QueueRestore] Dropping unreadable {gamemode} queue: {e}")
+            STATE_STORE.delete(["active_queues", gamemode])
+            continue
+
+        channel = bot.get_channel(QUEUE_CHANNELS.get(gamemode, 0))
+        guild = getattr(channel, "guild", None)
+        if guild is not None and guild.chunked:
+            queue.retain(lambda discord_id: guild.get_member(discord_id) is not None)
+
+        ACTIVE_QUEUES[gamemode] = queue
+        _persist_queue(gamemode)
+        QUEUE_RENDERER.mark(gamemode)
+        restored += 1
+        print(f"[QueueRestore] {gamemode}: {queue.player_count} player(s), {queue.tester_count} tester(s)")
+    return restored
 
 class QueueActionView(discord.ui.View):
     """Join/Leave/Close/Next buttons for queue messages"""
@@ -2656,30 +5104,22 @@ class QueueActionView(discord.ui.View):
             await interaction.response.send_message("❌ A queue nem létezik vagy nem nyitva.", ephemeral=True)
             return
 
-        if any(p.discord_id == member.id for p in queue["players"]):
+        role = queue.role_of(member.id)
+        if role == "player":
             await interaction.response.send_message("Már benne vagy a queue-ban!", ephemeral=True)
             return
-        if any(t.discord_id == member.id for t in queue.get("testers", [])):
+        if role == "tester":
             await interaction.response.send_message("Már benna van a queue-ban teszterként!", ephemeral=True)
             return
 
-        linked_mc = get_linked_minecraft_name(member.id)
-        if not linked_mc:
-            await interaction.response.send_message(
-                "❌ Nincs összekapcsolva a Minecraft fiókod! Használd a `/link` parancsot.",
-                ephemeral=True
-            )
-            return
-
-        # Check if fully retired
-        if await is_player_fully_retired(linked_mc):
-            await interaction.response.send_message(
-                "❌ Teljes nyugdíjas vagy! Nem csatlakozhatsz queue-hoz.",
-                ephemeral=True
-            )
+        is_tester = is_gamemode_tester_or_admin(member, gamemode)
+        result = await evaluate_eligibility(member, gamemode, QUEUE_TESTER_CHECKS if is_tester else QUEUE_JOIN_CHECKS)
+        if not result.ok:
+            await interaction.response.send_message(queue_denial_message(result, gamemode), ephemeral=True)
             return
+        linked_mc = result.linked_mc
 
-        if is_gamemode_tester_or_admin(member, gamemode):
+        if is_tester:
             view = JoinAsChoiceView(gamemode, member, linked_mc)
             await interaction.response.send_message(
                 'Tesztelő rangú vagy. Válaszd, hogy játékosként vagy teszterként szeretnél belépni:',
@@ -2688,30 +5128,14 @@ class QueueActionView(discord.ui.View):
             )
             return
 
-        cd_left = cooldown_left(member.id, gamemode)
-        if cd_left > 0:
-            days = cd_left // (24 * 60 * 60)
-            hours = (cd_left % (24 * 60 * 60)) // (60 * 60)
-            await interaction.response.send_message(
-                f"❌ Még **{days} nap {hours} óra** cooldown van hátra a **{get_gamemode_display_name(gamemode)}** módban. "
-                f"Várj a cooldown lejártáig, mielőtt újra queue-hoz csatlakozol.",
-                ephemeral=True
-            )
-            return
-
-        player_rank = await get_player_rank_for_mode(linked_mc, gamemode)
-        if not can_join_queue(player_rank):
-            await interaction.response.send_message(
-                f"❌ Csak **LT5-HT4** közöttiek csatlakozhatnak a queue-hoz. "
-                f"Rangod: **{player_rank}** (minimum: LT5, maximum: HT4).",
-                ephemeral=True
-            )
+        # The awaits above may have let a second click through; add_player dedupes
+        if not queue.add_player(QueuePlayer(member.id, linked_mc)):
+            await interaction.response.send_message("Már benne vagy a queue-ban!", ephemeral=True)
             return
-
-        queue["players"].append(QueuePlayer(member.id, linked_mc))
         await update_queue_message(gamemode)
         await interaction.response.send_message(
-            f"✅ Beléptél a **{get_gamemode_display_name(gamemode)}** queue-ba!",
+            f"✅ Beléptél a **{get_gamemode_display_name(gamemode)}** queue-ba! "
+            f"Helyed: **#{queue.position(member.id)}**{other_queues_note(member.id, gamemode)}",
             ephemeral=True
         )
         return
@@ -2733,25 +5157,13 @@ class QueueActionView(discord.ui.View):
             await interaction.response.send_message("❌ A queue nem létezik.", ephemeral=True)
             return
 
-        for i, p in enumerate(queue["players"]):
-            if p.discord_id == member.id:
-                queue["players"].pop(i)
-                await update_queue_message(gamemode)
-                await interaction.response.send_message(
-                    f"✅ Kiléptél a **{get_gamemode_display_name(gamemode)}** queue-ból!",
-                    ephemeral=True
-                )
-                return
-
-        for i, t in enumerate(queue.get("testers", [])):
-            if t.discord_id == member.id:
-                queue["testers"].pop(i)
-                await update_queue_message(gamemode)
-                await interaction.response.send_message(
-                    f"✅ Kiléptél a **{get_gamemode_display_name(gamemode)}** queue-ból!",
-                    ephemeral=True
-                )
-                return
+        if queue.remove(member.id):
+            await update_queue_message(gamemode)
+            await interaction.response.send_message(
+                f"✅ Kiléptél a **{get_gamemode_display_name(gamemode)}** queue-ból!{other_queues_note(member.id, gamemode)}",
+                ephemeral=True
+            )
+            return
 
         await interaction.response.send_message("Nem vagy a queue-ban.", ephemeral=True)
 
@@ -2769,7 +5181,7 @@ class QueueActionView(discord.ui.View):
 
         queue = ACTIVE_QUEUES.get(gamemode)
         if queue:
-            if not is_staff_member(member) and queue["opened_by"] != member.id:
+            if not is_staff_member(member) and queue.opened_by != member.id:
                 await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő zárhatja be.", ephemeral=True)
                 return
             view = ConfirmCloseQueueView(gamemode)
@@ -2792,7 +5204,10 @@ class QueueActionView(discord.ui.View):
                 channel = bot.get_channel(channel_id)
                 if channel and isinstance(channel, discord.TextChannel):
                     try:
-                        msg = await channel.fetch_message(msg_id)
+                        if interaction.message is not None and interaction.message.id == msg_id:
+                            msg = interaction.message
+                        else:
+                            msg = await channel.fetch_message(msg_id)
                         if msg.components:
                             if not is_staff_member(member):
                                 await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő vagy staff zárhatja be.", ephemeral=True)
@@ -2804,6 +5219,8 @@ class QueueActionView(discord.ui.View):
                                 ephemeral=True
                             )
                             return
+                    except discord.NotFound:
+                        _forget_queue_message(msg_id)
                     except Exception:
                         pass
         await interaction.response.send_message("❌ A queue már lezárva vagy nem elérhető.", ephemeral=True)
@@ -2820,64 +5237,65 @@ class QueueActionView(discord.ui.View):
             await interaction.response.send_message("❌ Hiba: nem sikerült meghatározni a játékmódot.", ephemeral=True)
             return
 
-        queue = ACTIVE_QUEUES.get(gamemode)
-        if not queue or not queue["players"]:
-            await interaction.response.send_message("❌ Nincs több játékos a queue-ban.", ephemeral=True)
-            return
+        async with QUEUE_LOCKS.hold(gamemode):
+            queue = ACTIVE_QUEUES.get(gamemode)
+            if not queue or not queue.player_count:
+                await interaction.response.send_message("❌ Nincs több játékos a queue-ban.", ephemeral=True)
+                return
 
-        if not is_staff_member(member) and queue["opened_by"] != member.id:
-            await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő hívhatja a következő játékost.", ephemeral=True)
-            return
+            if not is_staff_member(member) and queue.opened_by != member.id:
+                await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő hívhatja a következő játékost.", ephemeral=True)
+                return
 
-        # Get next player (FIFO)
-        next_player_obj = queue["players"].pop(0)
-        queue["called_players"].append(next_player_obj.discord_id)
-        await update_queue_message(gamemode)
+            # Get next player (FIFO)
+            next_player_obj = queue.pop_next_player()
+            await update_queue_message(gamemode)
 
-        # Create ticket channel
-        guild = interaction.guild
-        category = guild.get_channel(TICKET_CREATE_CATEGORY_ID)
-        if not category or not isinstance(category, discord.CategoryChannel):
-            await interaction.response.send_message("❌ Hiba: ticket kategória nem található.", ephemeral=True)
-            return
+            # Create ticket channel
+            guild = interaction.guild
+            category = guild.get_channel(TICKET_CREATE_CATEGORY_ID)
+            if not category or not isinstance(category, discord.CategoryChannel):
+                await interaction.response.send_message("❌ Hiba: ticket kategória nem található.", ephemeral=True)
+                return
 
-        channel_name = f"{gamemode}-{next_player_obj.minecraft_name}".lower().replace(" ", "-")[:50]
-        try:
-            overwrites = {
-                guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                guild.get_member(next_player_obj.discord_id): discord.PermissionOverwrite(
-                    view_channel=True, send_messages=True, read_message_history=True
-                ),
-            }
-            if STAFF_ROLE_ID:
-                staff_role = guild.get_role(STAFF_ROLE_ID)
-                if staff_role:
-                    overwrites[staff_role] = discord.PermissionOverwrite(
-                        view_channel=True, send_messages=True, read_message_history=True, manage_channels=True
-                    )
+            channel_name = f"{gamemode}-{next_player_obj.minecraft_name}".lower().replace(" ", "-")[:50]
+            try:
+                overwrites = {
+                    guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                    guild.get_member(next_player_obj.discord_id): discord.PermissionOverwrite(
+                        view_channel=True, send_messages=True, read_message_history=True
+                    ),
+                }
+                if STAFF_ROLE_ID:
+                    staff_role = guild.get_role(STAFF_ROLE_ID)
+                    if staff_role:
+                        overwrites[staff_role] = discord.PermissionOverwrite(
+                            view_channel=True, send_messages=True, read_message_history=True, manage_channels=True
+                        )
 
-            channel = await guild.create_text_channel(
-                name=channel_name,
-                category=category,
-                overwrites=overwrites,
-                topic=f"owner={next_player_obj.discord_id} | mode={gamemode} | mc={next_player_obj.minecraft_name}",
-                reason=f"Queue ticket for {next_player_obj.minecraft_name}"
-            )
+                channel = await guild.create_text_channel(
+                    name=channel_name,
+                    category=category,
+                    overwrites=overwrites,
+                    topic=f"owner={next_player_obj.discord_id} | mode={gamemode} | mc={next_player_obj.minecraft_name}",
+                    reason=f"Queue ticket for {next_player_obj.minecraft_name}"
+                )
+                TICKETS.open(channel.id, next_player_obj.discord_id, gamemode, next_player_obj.minecraft_name, tester_id=member.id)
 
-            embed = discord.Embed(
-                title="Teszt kérés",
-                description=f"**Játékos:** {next_player_obj.minecraft_name}\n"
-                           f"**Játékmód:** {get_gamemode_display_name(gamemode)}\n"
-                           f"**Discord:** <@{next_player_obj.discord_id}>",
-                color=discord.Color.blurple()
-            )
-            embed.set_thumbnail(url=f"https://minotar.net/helm/{next_player_obj.minecraft_name}/128.png")
+                embed = discord.Embed(
+                    title="Teszt kérés",
+                    description=f"**Játékos:** {next_player_obj.minecraft_name}\n"
+                               f"**Játékmód:** {get_gamemode_display_name(gamemode)}\n"
+                               f"**Discord:** <@{next_player_obj.discord_id}>",
+                    color=discord.Color.blurple()
+                )
+                embed.set_thumbnail(url=f"https://minotar.net/helm/{next_player_obj.minecraft_name}/128.png")
 
-            view = CloseTicketView(owner_id=next_player_obj.discord_id, mode_key=gamemode)
-            await channel.send(embed=embed, view=view)
+                view = CloseTicketView(owner_id=next_player_obj.discord_id, mode_key=gamemode)
+                await channel.send(embed=embed, view=view)
 
-        except Exception as e:
-            await interaction.response.send_message(f"❌ Hiba a channel létrehozása során: {e}", ephemeral=True)
+            except Exception as e:
+                await interaction.response.send_message(f"❌ Hiba a channel létrehozása során: {e}", ephemeral=True)
 
 
 class ConfirmCloseQueueView(discord.ui.View):
@@ -2892,52 +5310,51 @@ class ConfirmCloseQueueView(discord.ui.View):
             await interaction.response.send_message("Hiba.", ephemeral=True)
             return
 
-        queue = ACTIVE_QUEUES.get(self.gamemode)
-        if queue:
-            if queue["opened_by"] != member.id and not is_staff_member(member):
-                await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő zárhatja be.", ephemeral=True)
-                return
+        async with QUEUE_LOCKS.hold(self.gamemode):
+            queue = ACTIVE_QUEUES.get(self.gamemode)
+            if queue:
+                if queue.opened_by != member.id and not is_staff_member(member):
+                    await interaction.response.send_message("❌ Csak a queue-t megnyitó tesztelő zárhatja be.", ephemeral=True)
+                    return
 
-            del ACTIVE_QUEUES[self.gamemode]
-            await interaction.response.send_message(
-                f"✅ **{get_gamemode_display_name(self.gamemode)}** queue bezárva.",
-                ephemeral=True
-            )
-        else:
-            await interaction.response.defer(ephemeral=True)
+                _close_active_queue(self.gamemode)
+                await interaction.response.send_message(
+                    f"✅ **{get_gamemode_display_name(self.gamemode)}** queue bezárva.",
+                    ephemeral=True
+                )
+            else:
+                await interaction.response.defer(ephemeral=True)
 
-        if interaction.guild:
-            await refresh_queue_panel(interaction.guild)
+            if interaction.guild:
+                await refresh_queue_panel(interaction.guild)
 
-        try:
-            msg_id = None
-            for mid, gm in list(QUEUE_MESSAGE_IDS.items()):
-                if gm == self.gamemode:
-                    msg_id = mid
-                    break
-            if msg_id:
-                channel_id = QUEUE_CHANNELS.get(self.gamemode)
-                if channel_id:
-                    channel = bot.get_channel(channel_id)
-                    if channel and isinstance(channel, discord.TextChannel):
-                        msg = await channel.fetch_message(msg_id)
-                        if msg.components:
+            try:
+                msg_id = None
+                for mid, gm in list(QUEUE_MESSAGE_IDS.items()):
+                    if gm == self.gamemode:
+                        msg_id = mid
+                        break
+                if msg_id:
+                    channel_id = QUEUE_CHANNELS.get(self.gamemode)
+                    if channel_id:
+                        channel = bot.get_channel(channel_id)
+                        if channel and isinstance(channel, discord.TextChannel):
                             embed = discord.Embed(
                                 title=f"{get_gamemode_indicator(self.gamemode, False)} {get_gamemode_display_name(self.gamemode)} Queue",
                                 description="A queue zárva van.",
                                 color=get_gamemode_color(self.gamemode)
                             )
-                            await msg.edit(embed=embed, view=None)
-                        if msg_id in QUEUE_MESSAGE_IDS:
-                            del QUEUE_MESSAGE_IDS[msg_id]
-                            _persist_queue_message_ids()
-                        if not queue:
-                            await interaction.followup.send(
-                                f"✅ **{get_gamemode_display_name(self.gamemode)}** queue bezárva (állapot visszaállítva).",
-                                ephemeral=True
-                            )
-        except Exception:
-            pass
+                            try:
+                                await MESSAGE_HANDLES.edit(channel, msg_id, embed=embed, view=None)
+                            finally:
+                                _forget_queue_message(msg_id)
+                            if not queue:
+                                await interaction.followup.send(
+                                    f"✅ **{get_gamemode_display_name(self.gamemode)}** queue bezárva (állapot visszaállítva).",
+                                    ephemeral=True
+                                )
+            except Exception:
+                pass
 
     @discord.ui.button(label="Mégsem", style=discord.ButtonStyle.secondary, custom_id="queue_close_cancel")
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -3064,8 +5481,192 @@ class ClearAllPingsButton(discord.ui.Button):
         await interaction.response.send_message("\n".join(parts), ephemeral=True)
 
 
+# =========================
+# MESSAGE HANDLES
+# =========================
+
+class MessageHandleRegistry:
+    """
+    PartialMessage handles by message id, so edits go straight to the PATCH
+    without fetching the message first. Only a NotFound falls back to a fetch,
+    to confirm the message is really gone before callers drop it.
+    """
+
+    def __init__(self):
+        self._handles: Dict[int, discord.PartialMessage] = {}
+        self.stats = {"edits": 0, "fetch_fallbacks": 0, "not_found": 0}
+
+    def get(self, channel: discord.TextChannel, msg_id: int) -> discord.PartialMessage:
+        handle = self._handles.get(msg_id)
+        if handle is None or handle.channel.id != channel.id:
+            handle = self._handles[msg_id] = channel.get_partial_message(msg_id)
+        return handle
+
+    def discard(self, msg_id: int) -> None:
+        self._handles.pop(msg_id, None)
+
+    async def edit(self, channel: discord.TextChannel, msg_id: int, **fields):
+        """Edit by id. Raises discord.NotFound if the message no longer exists."""
+        self.stats["edits"] += 1
+        try:
+            return await self.get(channel, msg_id).edit(**fields)
+        except discord.NotFound:
+            self.discard(msg_id)
+            self.stats["fetch_fallbacks"] += 1
+            try:
+                message = await channel.fetch_message(msg_id)
+            except discord.NotFound:
+                self.stats["not_found"] += 1
+                raise
+            return await message.edit(**fields)
+
+
+MESSAGE_HANDLES = MessageHandleRegistry()
+
+
+def _forget_queue_message(msg_id: int) -> None:
+    """Drop a deleted or closed queue message from QUEUE_MESSAGE_IDS."""
+    MESSAGE_HANDLES.discard(msg_id)
+    RENDER_CACHE.forget(msg_id)
+    if QUEUE_MESSAGE_IDS.pop(msg_id, None) is not None:
+        _persist_queue_message_ids()
+
+
+# =========================
+# QUEUE RENDER SCHEDULER
+# =========================
+
+QUEUE_RENDER_DEBOUNCE = 0.25  # seconds to wait after the first change so a burst lands in one edit
+QUEUE_RENDER_INTERVAL = 1.5  # min seconds between edits of one message (channel bucket: 5 edits / 5s)
+QUEUE_RENDER_RATE_LIMIT_BACKOFF = 5.0  # pause all renders this long after a 429
+QUEUE_PANEL_KEY = "__panel__"
+
+
+class RenderCache:
+    """
+    Hash of the last (embed, components) payload pushed to each managed message,
+    so an edit that would change nothing is skipped before any request is made.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[int, int] = {}  # message id -> payload hash
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def payload_hash(embed: Optional[discord.Embed], view: Optional[discord.ui.View]) -> int:
+        components = None
+        if view is not None:
+            components = [
+                [type(item).__name__, getattr(item, "custom_id", None), getattr(item, "label", None),
+                 str(getattr(item, "style", "")), getattr(item, "disabled", False), getattr(item, "url", None)]
+                for item in view.children
+            ]
+        return hash(json.dumps([embed.to_dict() if embed else None, components], sort_keys=True, default=str))
+
+    def unchanged(self, msg_id: int, payload_hash: int) -> bool:
+        if self._hashes.get(msg_id) == payload_hash:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, msg_id: int, payload_hash: int) -> None:
+        self._hashes[msg_id] = payload_hash
+
+    def forget(self, msg_id: int) -> None:
+        self._hashes.pop(msg_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "messages": len(self._hashes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+
+RENDER_CACHE = RenderCache()
+
+
+class QueueRenderScheduler:
+    """
+    Coalesces queue embed / panel updates. mark() flags a key (gamemode or
+    QUEUE_PANEL_KEY) dirty; one task per key renders it after the debounce and
+    no sooner than QUEUE_RENDER_INTERVAL after its previous edit, so any number
+    of marks in between collapse into a single edit. Edits whose payload is
+    already on the message (RENDER_CACHE) are skipped without a request.
+    """
+
+    _NO_GUILD = object()
+
+    def __init__(self):
+        self._pending: Dict[str, Any] = {}  # key -> guild (panel) or _NO_GUILD
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_edit: Dict[str, float] = {}
+        self._retry_at = 0.0
+        self.stats = {"marks": 0, "renders": 0, "edits": 0, "rate_limited": 0}
+
+    def mark(self, key: str, guild=None) -> None:
+        self.stats["marks"] += 1
+        self._pending[key] = guild if guild is not None else self._NO_GUILD
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: str):
+        try:
+            while key in self._pending:
+                now = time.monotonic()
+                await asyncio.sleep(max(
+                    QUEUE_RENDER_DEBOUNCE,
+                    self._last_edit.get(key, 0.0) + QUEUE_RENDER_INTERVAL - now,
+                    self._retry_at - now,
+                ))
+                guild = self._pending.pop(key, self._NO_GUILD)
+                self.stats["renders"] += 1
+                try:
+                    if key == QUEUE_PANEL_KEY:
+                        if guild is not self._NO_GUILD:
+                            await _render_queue_panel(guild)
+                    else:
+                        await _render_queue_message(key)
+                except discord.HTTPException as e:
+                    if e.status != 429:
+                        raise
+                    self.stats["rate_limited"] += 1
+                    self._retry_at = time.monotonic() + QUEUE_RENDER_RATE_LIMIT_BACKOFF
+                    self._pending.setdefault(key, guild)
+                except Exception as e:
+                    print(f"[QueueRender] {key}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    async def edit(self, key: str, channel: discord.TextChannel, msg_id: int,
+                   embed: Optional[discord.Embed], view: Optional[discord.ui.View]) -> bool:
+        """Edit the message unless it already shows this payload. Returns whether an edit was sent."""
+        payload_hash = RENDER_CACHE.payload_hash(embed, view)
+        if RENDER_CACHE.unchanged(msg_id, payload_hash):
+            return False
+        await MESSAGE_HANDLES.edit(channel, msg_id, embed=embed, view=view)
+        RENDER_CACHE.remember(msg_id, payload_hash)
+        self._last_edit[key] = time.monotonic()
+        self.stats["edits"] += 1
+        return True
+
+
+QUEUE_RENDERER = QueueRenderScheduler()
+
+
 async def update_queue_message(gamemode: str):
-    """Update the queue embed in its channel"""
+    """Persist the queue and schedule a (coalesced) update of its embed"""
+    _persist_queue(gamemode)
+    QUEUE_RENDERER.mark(gamemode)
+
+
+async def _render_queue_message(gamemode: str):
+    """Render the queue embed in its channel"""
     channel_id = QUEUE_CHANNELS.get(gamemode)
     if not channel_id:
         return
@@ -3085,24 +5686,6 @@ async def update_queue_message(gamemode: str):
             await refresh_queue_panel(channel.guild)
         return
 
-    try:
-        message = await channel.fetch_message(msg_id)
-    except discord.NotFound:
-        # Message was deleted, clean up mapping
-        try:
-            del QUEUE_MESSAGE_IDS[msg_id]
-            _persist_queue_message_ids()
-        except KeyError:
-            pass
-        if channel.guild:
-            await refresh_queue_panel(channel.guild)
-        return
-    except Exception:
-        # Fetch failed for other reasons, still refresh panel
-        if channel.guild:
-            await refresh_queue_panel(channel.guild)
-        return
-
     queue = ACTIVE_QUEUES.get(gamemode)
     if not queue:
         embed = discord.Embed(
@@ -3111,21 +5694,20 @@ async def update_queue_message(gamemode: str):
             color=get_gamemode_color(gamemode)
         )
         try:
-            await message.edit(embed=embed, view=None)
-            # Remove from mapping as it's no longer active
-            try:
-                del QUEUE_MESSAGE_IDS[msg_id]
-                _persist_queue_message_ids()
-            except KeyError:
-                pass
+            await QUEUE_RENDERER.edit(gamemode, channel, msg_id, embed, None)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                raise
         except Exception:
             pass
+        # Remove from mapping as it's no longer active (or the message is gone)
+        _forget_queue_message(msg_id)
         if channel.guild:
             await refresh_queue_panel(channel.guild)
         return
 
     player_lines = []
-    for player in queue["players"]:
+    for player in queue.players:
         member = channel.guild.get_member(player.discord_id)
         name = member.display_name if member else player.minecraft_name
         player_lines.append(f"{name} ({player.minecraft_name})")
@@ -3134,7 +5716,7 @@ async def update_queue_message(gamemode: str):
 
     # Build testers list
     tester_lines = []
-    for tester in queue.get("testers", []):
+    for tester in queue.testers:
         member = channel.guild.get_member(tester.discord_id)
         name = member.display_name if member else tester.minecraft_name
         tester_lines.append(f"{name} ({tester.minecraft_name})")
@@ -3143,15 +5725,21 @@ async def update_queue_message(gamemode: str):
 
     embed = discord.Embed(
         title=f"{get_gamemode_indicator(gamemode)} {get_gamemode_display_name(gamemode)} Queue",
-        description=f"Játékosok: **{len(queue['players'])}** | Teszterek: **{len(queue.get('testers', []))}**",
+        description=f"Játékosok: **{queue.player_count}** | Teszterek: **{queue.tester_count}**",
         color=get_gamemode_color(gamemode)
     )
     embed.add_field(name="Játékosok", value=player_text, inline=False)
     embed.add_field(name="Teszterek", value=tester_text, inline=False)
 
-    view = QueueActionView(gamemode)
     try:
-        await message.edit(embed=embed, view=view)
+        await QUEUE_RENDERER.edit(gamemode, channel, msg_id, embed, QueueActionView(gamemode))
+    except discord.NotFound:
+        # Message was deleted, clean up mapping
+        _forget_queue_message(msg_id)
+    except discord.HTTPException as e:
+        if e.status == 429:
+            raise
+        print(f"Queue update error [{gamemode}]: {e}")
     except Exception as e:
         print(f"Queue update error [{gamemode}]: {e}")
     if channel.guild:
@@ -3205,33 +5793,6 @@ async def ticketpanel(interaction: discord.Interaction):
         await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
-async def autocomplete_testresult_username(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    if not WEBSITE_URL:
-        return []
-
-    try:
-        url = f"{WEBSITE_URL}/api/tests"
-        timeout = aiohttp.ClientTimeout(total=5)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            if resp.status != 200:
-                return []
-            data = await resp.json()
-            tests = data.get("tests", [])
-
-            # Extract unique usernames
-            usernames = set()
-            for t in tests:
-                u = t.get("username")
-                if u:
-                    usernames.add(u)
-
-            # Filter by current input
-            matches = [u for u in usernames if current.lower() in u.lower()]
-            return [app_commands.Choice(name=u, value=u) for u in matches[:25]]
-    except Exception:
-        return []
-
-
 class QueuePanelView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
@@ -3261,78 +5822,133 @@ class QueueOpenButton(discord.ui.Button):
         mode_key = self.mode_key
         mode_display = self.mode_label
         
-        if mode_key in ACTIVE_QUEUES:
-            await interaction.followup.send(f"❌ A **{mode_display}** queue már nyitva van!", ephemeral=True)
-            return
+        # Resolve before the open check so check-and-set below has no await in between
+        linked_mc = await get_linked_minecraft_name_async(interaction.user.id) or "TESZTER"
 
-        ACTIVE_QUEUES[mode_key] = {
-            "opened_by": interaction.user.id,
-            "opened_at": time.time(),
-            "players": [],
-            "testers": [QueuePlayer(interaction.user.id, get_linked_minecraft_name(interaction.user.id) or "TESZTER")],
-            "called_players": []
-        }
+        async with QUEUE_LOCKS.hold(mode_key):
+            if mode_key in ACTIVE_QUEUES:
+                await interaction.followup.send(f"❌ A **{mode_display}** queue már nyitva van!", ephemeral=True)
+                return
 
-        channel_id = QUEUE_CHANNELS.get(mode_key)
-        if not channel_id:
-            await interaction.followup.send(f"❌ Nincs channel beállítva ehhez a gamemode-hoz: {mode_display}", ephemeral=True)
-            return
+            queue = GameQueue(mode_key, interaction.user.id)
+            queue.add_tester(QueuePlayer(interaction.user.id, linked_mc))
+            ACTIVE_QUEUES[mode_key] = queue
+            _persist_queue(mode_key)
 
-        channel = interaction.guild.get_channel(channel_id)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            await interaction.followup.send(f"❌ Channel nem található: {channel_id}", ephemeral=True)
-            return
+            channel_id = QUEUE_CHANNELS.get(mode_key)
+            if not channel_id:
+                await interaction.followup.send(f"❌ Nincs channel beállítva ehhez a gamemode-hoz: {mode_display}", ephemeral=True)
+                return
 
-        embed = discord.Embed(
-            title=f"{get_gamemode_indicator(mode_key)} {mode_display} Queue",
-            description="A queue nyitva van! Kattints a gombokhoz alább.",
-            color=get_gamemode_color(mode_key)
-        )
-        embed.add_field(name="Játékosok", value="Még senki nincs a queue-ban.", inline=False)
-        # Show opening tester
-        linked_mc = get_linked_minecraft_name(interaction.user.id) or "TESZTER"
-        tester_name = interaction.user.display_name
-        embed.add_field(name="Teszterek", value=f"{tester_name} ({linked_mc})", inline=False)
-
-        # Get ping role for this gamemode
-        ping_role_id = QUEUE_PING_ROLES.get(mode_key)
-        ping_text = f"<@&{ping_role_id}> " if ping_role_id else ""
-
-        view = QueueActionView(mode_key)
-        message = await channel.send(content=ping_text, embed=embed, view=view)
-        QUEUE_MESSAGE_IDS[message.id] = mode_key
-        _persist_queue_message_ids()
+            channel = interaction.guild.get_channel(channel_id)
+            if not channel or not isinstance(channel, discord.TextChannel):
+                await interaction.followup.send(f"❌ Channel nem található: {channel_id}", ephemeral=True)
+                return
+
+            embed = discord.Embed(
+                title=f"{get_gamemode_indicator(mode_key)} {mode_display} Queue",
+                description="A queue nyitva van! Kattints a gombokhoz alább.",
+                color=get_gamemode_color(mode_key)
+            )
+            embed.add_field(name="Játékosok", value="Még senki nincs a queue-ban.", inline=False)
+            # Show opening tester
+            tester_name = interaction.user.display_name
+            embed.add_field(name="Teszterek", value=f"{tester_name} ({linked_mc})", inline=False)
 
-        await interaction.followup.send(f"✅ **{mode_display}** queue megnyitva!", ephemeral=True)
+            # Get ping role for this gamemode
+            ping_role_id = QUEUE_PING_ROLES.get(mode_key)
+            ping_text = f"<@&{ping_role_id}> " if ping_role_id else ""
+
+            view = QueueActionView(mode_key)
+            message = await channel.send(content=ping_text, embed=embed, view=view)
+            QUEUE_MESSAGE_IDS[message.id] = mode_key
+            _persist_queue_message_ids()
+
+            await interaction.followup.send(f"✅ **{mode_display}** queue megnyitva!", ephemeral=True)
+
+            # Refresh queue panel
+            await refresh_queue_panel(interaction.guild)
 
-        # Refresh queue panel
-        await refresh_queue_panel(interaction.guild)
+
+QUEUE_RECOVERY_CONCURRENCY = 4  # channels checked/scanned in parallel when rebuilding queue message ids
+QUEUE_RECOVERY_HISTORY_LIMIT = 200
+
+
+def _is_active_queue_message(msg) -> bool:
+    """Active queue messages have a "... Queue" embed (not the panel) and buttons"""
+    if not (msg.embeds and msg.components and msg.embeds[0].title):
+        return False
+    title = msg.embeds[0].title
+    return "Queue" in title and "Panel" not in title
 
 
 async def rebuild_queue_message_ids(guild):
-    """Scan queue channels to rebuild QUEUE_MESSAGE_IDS mapping after restart"""
-    global QUEUE_MESSAGE_IDS
-    QUEUE_MESSAGE_IDS.clear()
+    """
+    Validate QUEUE_MESSAGE_IDS after a restart. Each persisted id costs one
+    fetch; only channels whose id is missing or stale get a history scan
+    (stopping at the first active queue message). At most
+    QUEUE_RECOVERY_CONCURRENCY channels are queried at once.
+    """
+    started = time.perf_counter()
+    persisted = {gm: mid for mid, gm in QUEUE_MESSAGE_IDS.items()}
+    channels = {}
     for gamemode, channel_id in QUEUE_CHANNELS.items():
         channel = guild.get_channel(channel_id)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            continue
-        try:
-            async for msg in channel.history(limit=200):
-                # Look for active queue messages: embed title contains "Queue" but not "Panel", and has components
-                if msg.embeds and msg.components and msg.embeds[0].title:
-                    title = msg.embeds[0].title
-                    # Skip the Queue Panel messages (they have "Panel" in title)
-                    if "Queue" in title and "Panel" not in title:
-                        QUEUE_MESSAGE_IDS[msg.id] = gamemode
-                        break  # Only one active queue per channel
-        except Exception as e:
-            print(f"Error scanning channel {channel_id} for queue message: {e}")
+        if channel and isinstance(channel, discord.TextChannel):
+            channels[gamemode] = channel
+    semaphore = asyncio.Semaphore(QUEUE_RECOVERY_CONCURRENCY)
+
+    async def validate(gamemode: str) -> Optional[int]:
+        msg_id = persisted.get(gamemode)
+        if msg_id is None:
+            return None
+        async with semaphore:
+            try:
+                msg = await channels[gamemode].fetch_message(msg_id)
+            except discord.NotFound:
+                return None
+            except Exception as e:
+                print(f"Error checking queue message {msg_id} in {gamemode}: {e}")
+                return None
+        return msg_id if _is_active_queue_message(msg) else None
+
+    async def scan(gamemode: str) -> Optional[int]:
+        async with semaphore:
+            try:
+                async for msg in channels[gamemode].history(limit=QUEUE_RECOVERY_HISTORY_LIMIT):
+                    if _is_active_queue_message(msg):
+                        return msg.id  # Only one active queue per channel
+            except Exception as e:
+                print(f"Error scanning channel {channels[gamemode].id} for queue message: {e}")
+        return None
+
+    modes = list(channels)
+    found = {gm: mid for gm, mid in zip(modes, await asyncio.gather(*(validate(gm) for gm in modes))) if mid}
+    validated_at = time.perf_counter()
+
+    missing = [gm for gm in modes if gm not in found]
+    scanned = await asyncio.gather(*(scan(gm) for gm in missing))
+    found.update({gm: mid for gm, mid in zip(missing, scanned) if mid})
+    scanned_at = time.perf_counter()
+
+    QUEUE_MESSAGE_IDS.clear()
+    QUEUE_MESSAGE_IDS.update({mid: gm for gm, mid in found.items()})
     # Persist the rebuilt mapping
     _persist_queue_message_ids()
+    print(
+        f"[QueueRecovery] {len(modes) - len(missing)}/{len(persisted)} persisted id(s) valid "
+        f"({(validated_at - started) * 1000:.0f} ms); scanned {len(missing)} channel(s), "
+        f"{sum(1 for mid in scanned if mid)} found ({(scanned_at - validated_at) * 1000:.0f} ms)"
+    )
 
 
 async def refresh_queue_panel(guild):
+    """Schedule a (coalesced) refresh of the queue panel"""
+    if QUEUE_PANEL_MESSAGE is not None:
+        QUEUE_RENDERER.mark(QUEUE_PANEL_KEY, guild)
+
+
+async def _render_queue_panel(guild):
     """Refresh the queue panel"""
     global QUEUE_PANEL_MESSAGE
     if QUEUE_PANEL_MESSAGE is None:
@@ -3342,7 +5958,6 @@ async def refresh_queue_panel(guild):
     if not channel or not isinstance(channel, discord.TextChannel):
         return
     try:
-        msg = await channel.fetch_message(msg_id)
         embed = discord.Embed(
             title="Queue nyitás",
             description="Kattints a gombra a queue megnyitásához.",
@@ -3350,12 +5965,14 @@ async def refresh_queue_panel(guild):
         )
         embed.add_field(name="Információk", value="Válaszd ki a gamemodet és nyomd meg a gombot.", inline=False)
         embed.add_field(name="Gombok", value="Queue kezeléshez", inline=False)
-        await msg.edit(embed=embed, view=QueuePanelView())
+        await QUEUE_RENDERER.edit(QUEUE_PANEL_KEY, channel, msg_id, embed, QueuePanelView())
     except discord.NotFound:
         QUEUE_PANEL_MESSAGE = None
-        data = _load_data()
-        data["queue_panel_message"] = None
-        _save_data(data)
+        STATE_STORE.set(["queue_panel_message"], None)
+    except discord.HTTPException as e:
+        if e.status == 429:
+            raise
+        print(f"Error refreshing queue panel: {e}")
     except Exception as e:
         print(f"Error refreshing queue panel: {e}")
 
@@ -3384,14 +6001,14 @@ async def queuepanel(interaction: discord.Interaction):
     embed.add_field(name="Gombok", value="Queue kezeléshez", inline=False)
     
     # Send to channel - NOT ephemeral, visible for everyone
-    message = await channel.send(embed=embed, view=QueuePanelView())
+    view = QueuePanelView()
+    message = await channel.send(embed=embed, view=view)
+    RENDER_CACHE.remember(message.id, RENDER_CACHE.payload_hash(embed, view))
     global QUEUE_PANEL_MESSAGE
     QUEUE_PANEL_MESSAGE = (channel.id, message.id)
     
     # Persist panel message ID
-    data = _load_data()
-    data["queue_panel_message"] = [channel.id, message.id]
-    _save_data(data)
+    STATE_STORE.set(["queue_panel_message"], [channel.id, message.id])
     
     await interaction.followup.send("✅ Panel elküldve!", ephemeral=True)
 
@@ -3482,69 +6099,69 @@ async def closequeue(interaction: discord.Interaction, gamemode: app_commands.Ch
         return
     
     mode_key = gamemode.value.lower()
-    queue = ACTIVE_QUEUES.get(mode_key)
+    async with QUEUE_LOCKS.hold(mode_key):
+        queue = ACTIVE_QUEUES.get(mode_key)
     
-    if not queue:
-        msg_id = None
-        for mid, gm in QUEUE_MESSAGE_IDS.items():
-            if gm == mode_key:
-                msg_id = mid
-                break
-        if msg_id:
-            channel_id = QUEUE_CHANNELS.get(mode_key)
-            if channel_id:
-                channel = interaction.guild.get_channel(channel_id)
-                if channel and isinstance(channel, discord.TextChannel):
-                    try:
-                        msg = await channel.fetch_message(msg_id)
+        if not queue:
+            msg_id = None
+            for mid, gm in QUEUE_MESSAGE_IDS.items():
+                if gm == mode_key:
+                    msg_id = mid
+                    break
+            if msg_id:
+                channel_id = QUEUE_CHANNELS.get(mode_key)
+                if channel_id:
+                    channel = interaction.guild.get_channel(channel_id)
+                    if channel and isinstance(channel, discord.TextChannel):
+                        try:
+                            embed = discord.Embed(
+                                title=f"{get_gamemode_indicator(mode_key, False)} {get_gamemode_display_name(mode_key)} Queue",
+                                description="A queue zárva van.",
+                                color=get_gamemode_color(mode_key)
+                            )
+                            await MESSAGE_HANDLES.edit(channel, msg_id, embed=embed, view=None)
+                            _forget_queue_message(msg_id)
+                            await interaction.followup.send(f"✅ **{gamemode.name}** queue bezárva (törölve a státuszból).", ephemeral=True)
+                            await refresh_queue_panel(interaction.guild)
+                            return
+                        except discord.NotFound:
+                            _forget_queue_message(msg_id)
+            await interaction.followup.send(f"❌ A **{gamemode.name}** queue nincs nyitva.", ephemeral=True)
+            return
+    
+        if queue.opened_by != interaction.user.id and not is_staff_member(interaction.user):
+            await interaction.followup.send("❌ Csak a queue-t megnyitó tesztelő vagy staff zárhatja be.", ephemeral=True)
+            return
+    
+        _close_active_queue(mode_key)
+        await interaction.followup.send(f"✅ **{gamemode.name}** queue bezárva.", ephemeral=True)
+    
+        await refresh_queue_panel(interaction.guild)
+    
+        try:
+            msg_id = None
+            for mid, gm in list(QUEUE_MESSAGE_IDS.items()):
+                if gm == mode_key:
+                    msg_id = mid
+                    break
+            if msg_id:
+                channel_id = QUEUE_CHANNELS.get(mode_key)
+                if channel_id:
+                    channel = interaction.guild.get_channel(channel_id)
+                    if channel and isinstance(channel, discord.TextChannel):
                         embed = discord.Embed(
                             title=f"{get_gamemode_indicator(mode_key, False)} {get_gamemode_display_name(mode_key)} Queue",
                             description="A queue zárva van.",
                             color=get_gamemode_color(mode_key)
                         )
-                        await msg.edit(embed=embed, view=None)
-                        del QUEUE_MESSAGE_IDS[msg_id]
-                        _persist_queue_message_ids()
-                        await interaction.followup.send(f"✅ **{gamemode.name}** queue bezárva (törölve a státuszból).", ephemeral=True)
-                        await refresh_queue_panel(interaction.guild)
-                        return
-                    except discord.NotFound:
-                        pass
-        await interaction.followup.send(f"❌ A **{gamemode.name}** queue nincs nyitva.", ephemeral=True)
-        return
-    
-    if queue.get("opened_by") != interaction.user.id and not is_staff_member(interaction.user):
-        await interaction.followup.send("❌ Csak a queue-t megnyitó tesztelő vagy staff zárhatja be.", ephemeral=True)
-        return
-    
-    del ACTIVE_QUEUES[mode_key]
-    await interaction.followup.send(f"✅ **{gamemode.name}** queue bezárva.", ephemeral=True)
-    
-    await refresh_queue_panel(interaction.guild)
-    
-    try:
-        msg_id = None
-        for mid, gm in list(QUEUE_MESSAGE_IDS.items()):
-            if gm == mode_key:
-                msg_id = mid
-                break
-        if msg_id:
-            channel_id = QUEUE_CHANNELS.get(mode_key)
-            if channel_id:
-                channel = interaction.guild.get_channel(channel_id)
-                if channel and isinstance(channel, discord.TextChannel):
-                    msg = await channel.fetch_message(msg_id)
-                    embed = discord.Embed(
-                        title=f"{get_gamemode_indicator(mode_key, False)} {get_gamemode_display_name(mode_key)} Queue",
-                        description="A queue zárva van.",
-                        color=get_gamemode_color(mode_key)
-                    )
-                    await msg.edit(embed=embed, view=None)
-                    if msg_id in QUEUE_MESSAGE_IDS:
-                        del QUEUE_MESSAGE_IDS[msg_id]
-                        _persist_queue_message_ids()
-    except Exception as e:
-        print(f"Error updating queue message on close: {e}")
+                        try:
+                            await MESSAGE_HANDLES.edit(channel, msg_id, embed=embed, view=None)
+                        finally:
+                            _forget_queue_message(msg_id)
+        except discord.NotFound:
+            pass
+        except Exception as e:
+            print(f"Error updating queue message on close: {e}")
 
 
 @app_commands.command(name="testresult", description="Minecraft tier teszt eredmény embed + weboldal mentés.")
@@ -3554,7 +6171,7 @@ async def closequeue(interaction: discord.Interaction, gamemode: app_commands.Ch
     gamemode="Játékmód",
     rank="Elért rank (pl. LT3 / HT3)"
 )
-@app_commands.autocomplete(username=autocomplete_testresult_username)
+@app_commands.autocomplete(username=autocomplete_player_name)
 @app_commands.choices(
     gamemode=_choices_from_list(MODE_LIST),
     rank=_choices_from_list(RANKS)
@@ -3585,25 +6202,19 @@ async def testresult(
         mode_val = gamemode.value
         rank_val = rank.value
 
-        # Previous rank from website (best-effort)
-        prev_rank = "Unranked"
-        print(f"[TESTRESULT {execution_id}] Getting previous rank for {username} in {mode_val}...")
-        if WEBSITE_URL:
-            try:
-                res = await api_get_tests(username=username, mode=mode_val)
-                print(f"[TESTRESULT {execution_id}] Got previous rank response: {res.get('status')}")
-                if res.get("status") == 200:
-                    data = res.get("data", {})
-                    # Handle single result (test) or list (tests)
-                    test = data.get("test")
-                    tests = data.get("tests", [])
-
-                    target = test if test else (tests[0] if tests else None)
+        # Fetch all tests for the player once: gives the previous rank and the tier list below
+        print(f"[TESTRESULT {execution_id}] Getting tests for {username}...")
+        all_tests_res = await api_get_tests(username=username, mode="")
+        print(f"[TESTRESULT {execution_id}] Got tests response: {all_tests_res.get('status')}")
+        all_tests = all_tests_res.get("data", {}).get("tests", []) if all_tests_res.get("status") == 200 else []
 
-                    if target:
-                        prev_rank = str(target.get("rank", "Unranked")) or "Unranked"
-            except Exception:
-                pass
+        # Previous rank in this gamemode (best-effort)
+        prev_rank = "Unranked"
+        mode_val_key = normalize_gamemode(mode_val)
+        for test in all_tests:
+            if normalize_gamemode(test.get("gamemode", "")) == mode_val_key:
+                prev_rank = str(test.get("rank", "Unranked")) or "Unranked"
+                break
 
         prev_points = POINTS.get(prev_rank, 0)
         new_points = POINTS.get(rank_val, 0)
@@ -3618,10 +6229,6 @@ async def testresult(
         display_prev_rank = prev_rank
         display_rank_val = rank_val
 
-        # Fetch all tests for the player to list previous tiers
-        all_tests_res = await api_get_tests(username=username, mode="")
-        all_tests = all_tests_res.get("data", {}).get("tests", []) if all_tests_res.get("status") == 200 else []
-
         # Group by gamemode, get best rank per mode
         tiers = {}
         for test in all_tests:
@@ -3689,16 +6296,10 @@ async def testresult(
 
         # Set cooldown for the tested player (ALWAYS do this after saving)
         channel = interaction.channel
-        owner_id = None
-        if channel and channel.topic:
-            try:
-                # Parse "owner=123456789"
-                for part in channel.topic.split(" | "):
-                    if part.startswith("owner="):
-                        owner_id = int(part.split("=")[1])
-                        break
-            except Exception:
-                pass
+        ticket = TICKETS.lookup(channel) if channel else None
+        owner_id = ticket["owner_id"] if ticket else None
+        if ticket:
+            TICKETS.record_result(channel.id, interaction.user.id)
 
         if owner_id:
             set_last_closed(owner_id, mode_val, time.time())
@@ -3773,200 +6374,188 @@ async def testresult(
 async def tierlistnamechange(interaction: discord.Interaction, oldname: str, newname: str):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not interaction.guild or not isinstance(interaction.user, discord.Member):
-            await interaction.followup.send("Hiba.", ephemeral=True)
-            return
-        if not is_staff_member(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
-
-        # Call the website API to rename the player
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
-
-        # Pre-delete any conflicting tests for newname in modes that oldname has
+    async with PLAYER_LOCKS.hold_many([oldname.lower(), newname.lower()]):
         try:
-            # Fetch old player's tests to get their modes
-            old_tests_url = f"{WEBSITE_URL}/api/tests?username={oldname}"
-            async with http_session.get(old_tests_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as old_resp:
-                if old_resp.status == 200:
-                    old_data = await old_resp.json()
-                    old_tests = old_data.get("data", {}).get("tests", [])
-                    old_modes = {t.get("gamemode", "").lower() for t in old_tests if t.get("gamemode")}
-                else:
-                    old_modes = set()
-        except Exception as e:
-            print(f"Error fetching old tests for conflict check: {e}")
-            old_modes = set()
+            if not interaction.guild or not isinstance(interaction.user, discord.Member):
+                await interaction.followup.send("Hiba.", ephemeral=True)
+                return
+            if not is_staff_member(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
+                return
 
-        if old_modes:
+            # Call the website API to rename the player
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
+                return
+
+            # Pre-delete any conflicting tests for newname in modes that oldname has
             try:
-                # Fetch new player's tests to find conflicts
-                new_tests_url = f"{WEBSITE_URL}/api/tests?username={newname}"
-                async with http_session.get(new_tests_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as new_resp:
-                    if new_resp.status == 200:
-                        new_data = await new_resp.json()
-                        new_tests = new_data.get("data", {}).get("tests", [])
-                        for test in new_tests:
-                            test_mode = test.get("gamemode", "").lower()
-                            if test_mode in old_modes:
-                                test_id = test.get("id")
-                                if test_id:
-                                    print(f"Deleting conflicting test for {newname}/{test_mode}: id={test_id}")
-                                    if USE_SUPABASE_API:
-                                        await supabase_delete("tests", {"id": test_id})
-                                    elif db_pool is not None:
-                                        await db_delete_test(str(test_id))
-                                    else:
-                                        try:
-                                            del_url = f"{WEBSITE_URL}/api/tests/{test_id}"
-                                            async with http_session.delete(del_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as d_resp:
-                                                print(f"Delete conflict test status: {d_resp.status}")
-                                        except Exception as e:
-                                            print(f"Failed to delete conflicting test {test_id}: {e}")
-                                    # Also remove from local cache (non-fatal)
-                                    try:
-                                        mode_key_cache = GAMEMODE_DISPLAY_TO_KEY.get(test_mode.lower())
-                                        if mode_key_cache:
-                                            await _remove_player_gamemode_score(newname, mode_key_cache)
-                                    except Exception as e:
-                                        print(f"Warning: failed to clear cache for {newname}/{test_mode}: {e}")
+                # Fetch old player's tests to get their modes
+                old_tests_url = f"{WEBSITE_URL}/api/tests?username={oldname}"
+                async with http_session.get(old_tests_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as old_resp:
+                    if old_resp.status == 200:
+                        old_data = await old_resp.json()
+                        old_tests = old_data.get("data", {}).get("tests", [])
+                        old_modes = {t.get("gamemode", "").lower() for t in old_tests if t.get("gamemode")}
+                    else:
+                        old_modes = set()
             except Exception as e:
-                print(f"Error checking/deleting conflicts for {newname}: {e}")
-
-        result = await api_rename_player(old_name=oldname, new_name=newname)
-        status = result.get("status")
-        data = result.get("data", {})
-
-        if status == 200:
-            updated_count = data.get("updatedCount", 0)
+                print(f"Error fetching old tests for conflict check: {e}")
+                old_modes = set()
 
-            # Also update linked_accounts in Supabase
-            if USE_SUPABASE_API:
+            if old_modes:
                 try:
-                    success = await supabase_update(
-                        "linked_accounts",
-                        {"minecraft_name": newname},
-                        {"minecraft_name": oldname}
-                    )
-                    if success:
-                        print(f"Updated linked_accounts: {oldname} -> {newname}")
-                    else:
-                        print(f"Warning: linked_accounts update returned False for {oldname} -> {newname}")
+                    # Fetch new player's tests to find conflicts
+                    new_tests_url = f"{WEBSITE_URL}/api/tests?username={newname}"
+                    async with http_session.get(new_tests_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as new_resp:
+                        if new_resp.status == 200:
+                            new_data = await new_resp.json()
+                            new_tests = new_data.get("data", {}).get("tests", [])
+                            for test in new_tests:
+                                test_mode = test.get("gamemode", "").lower()
+                                if test_mode in old_modes:
+                                    test_id = test.get("id")
+                                    if test_id:
+                                        print(f"Deleting conflicting test for {newname}/{test_mode}: id={test_id}")
+                                        if USE_SUPABASE_API:
+                                            await supabase_delete("tests", {"id": test_id})
+                                        elif db_pool is not None:
+                                            await db_delete_test(str(test_id))
+                                        else:
+                                            try:
+                                                del_url = f"{WEBSITE_URL}/api/tests/{test_id}"
+                                                async with http_session.delete(del_url, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)) as d_resp:
+                                                    print(f"Delete conflict test status: {d_resp.status}")
+                                            except Exception as e:
+                                                print(f"Failed to delete conflicting test {test_id}: {e}")
+                                        # Also remove from local cache (non-fatal)
+                                        try:
+                                            mode_key_cache = GAMEMODE_DISPLAY_TO_KEY.get(test_mode.lower())
+                                            if mode_key_cache:
+                                                await _remove_player_gamemode_score(newname, mode_key_cache)
+                                        except Exception as e:
+                                            print(f"Warning: failed to clear cache for {newname}/{test_mode}: {e}")
                 except Exception as e:
-                    print(f"Error updating linked_accounts: {e}")
+                    print(f"Error checking/deleting conflicts for {newname}: {e}")
+
+            result = await api_rename_player(old_name=oldname, new_name=newname)
+            status = result.get("status")
+            data = result.get("data", {})
+
+            if status == 200:
+                updated_count = data.get("updatedCount", 0)
 
-            # Also update tests table (rename username in cache)
-            try:
-                if db_pool is not None:
-                    async with db_pool.acquire() as conn:
-                        await conn.execute(
-                            "UPDATE tests SET username = $1 WHERE LOWER(username) = LOWER($2)",
-                            newname, oldname
+                # Also update linked_accounts in Supabase
+                if USE_SUPABASE_API:
+                    try:
+                        success = await supabase_update(
+                            "linked_accounts",
+                            {"minecraft_name": newname},
+                            {"minecraft_name": oldname}
                         )
-                elif USE_SUPABASE_API:
-                    await supabase_update(
-                        TESTS_TABLE,
-                        {"username": newname},
-                        {"username": oldname}
-                    )
-            except Exception as e:
-                print(f"Warning: failed to update tests cache on rename: {e}")
+                        if success:
+                            print(f"Updated linked_accounts: {oldname} -> {newname}")
+                            linked_id = LINK_INDEX.discord_for(oldname)
+                            if linked_id is not None:
+                                LINK_INDEX.put(linked_id, newname)
+                        else:
+                            print(f"Warning: linked_accounts update returned False for {oldname} -> {newname}")
+                    except Exception as e:
+                        print(f"Error updating linked_accounts: {e}")
+
+                # Also update tests table (rename username in cache)
+                try:
+                    if db_pool is not None:
+                        async with db_pool.acquire() as conn:
+                            await conn.execute(
+                                "UPDATE tests SET username = $1 WHERE LOWER(username) = LOWER($2)",
+                                newname, oldname
+                            )
+                    elif USE_SUPABASE_API:
+                        await supabase_update(
+                            TESTS_TABLE,
+                            {"username": newname},
+                            {"username": oldname}
+                        )
+                except Exception as e:
+                    print(f"Warning: failed to update tests cache on rename: {e}")
 
-            msg = f"✅ Sikeresen átnevezve: **{oldname}** → **{newname}**\nFrissítve: {updated_count} db bejegyzés (összes gamemód)"
+                msg = f"✅ Sikeresen átnevezve: **{oldname}** → **{newname}**\nFrissítve: {updated_count} db bejegyzés (összes gamemód)"
 
-            await interaction.followup.send(msg, ephemeral=True)
-        elif status == 404:
-            await interaction.followup.send(
-                f"❌ Játékos nem találva: **{oldname}**",
-                ephemeral=True
-            )
-        elif status == 401 or status == 403:
-            await interaction.followup.send(
-                "❌ Nincs jogosultságod ehhez a parancshoz.",
-                ephemeral=True
-            )
-        else:
-            # Truncate data to avoid Discord's 2000 character limit
-            data_str = truncate_message(str(data), 1500)
-            await interaction.followup.send(
-                f"⚠️ Hiba (status {status}): {data_str}",
-                ephemeral=True
-            )
+                await interaction.followup.send(msg, ephemeral=True)
+            elif status == 404:
+                await interaction.followup.send(
+                    f"❌ Játékos nem találva: **{oldname}**",
+                    ephemeral=True
+                )
+            elif status == 401 or status == 403:
+                await interaction.followup.send(
+                    "❌ Nincs jogosultságod ehhez a parancshoz.",
+                    ephemeral=True
+                )
+            else:
+                # Truncate data to avoid Discord's 2000 character limit
+                data_str = truncate_message(str(data), 1500)
+                await interaction.followup.send(
+                    f"⚠️ Hiba (status {status}): {data_str}",
+                    ephemeral=True
+                )
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout (nem válaszolt 10 mp-en belül).", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout (nem válaszolt 10 mp-en belül).", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="profile", description="Megnézed egy játékos tierjeit a tierlistáról.")
 @app_commands.describe(
     name="A játékos neve a tierlistán"
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def profile(interaction: discord.Interaction, name: str):
     await interaction.response.defer(ephemeral=False)
 
     try:
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
+        # Read from the local replica; fall back to the website while it isn't loaded yet
+        replica_ready = await ensure_tests_replica()
+        tests = TESTS_REPLICA.player_tests(name) if replica_ready else []
+
+        if not tests:
+            if not WEBSITE_URL:
+                if replica_ready:
+                    await interaction.followup.send(f"❌ Nincs találat erre a névre: **{name}**", ephemeral=False)
+                else:
+                    await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
+                return
 
-        # Use the new API endpoint that supports filtering by username only
-        url = f"{WEBSITE_URL}/api/tests?username={name}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
+            # Use the new API endpoint that supports filtering by username only
+            url = f"{WEBSITE_URL}/api/tests?username={name}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
-                return
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            tests = data.get("tests", [])
+                tests = data.get("tests", [])
 
             if not tests:
                 await interaction.followup.send(f"❌ Nincs találat erre a névre: **{name}**", ephemeral=False)
                 return
 
-            # Get global rank by fetching all tests and sorting
-            all_url = f"{WEBSITE_URL}/api/tests"
-            async with http_session.get(all_url, headers=_auth_headers(), timeout=timeout) as all_resp:
-                try:
-                    all_data = await all_resp.json()
-                except Exception:
-                    all_data = {}
-
-            all_tests = all_data.get("tests", [])
-            global_rank = None
-            if all_tests:
-                # Group by username and sum points
-                player_totals = {}
-                for t in all_tests:
-                    username = t.get("username", "")
-                    points = t.get("points", 0)
-                    if username in player_totals:
-                        player_totals[username] += points
-                    else:
-                        player_totals[username] = points
-
-                # Sort by total points descending
-                sorted_players = sorted(player_totals.items(), key=lambda x: x[1], reverse=True)
-
-                # Find the player's position
-                player_username = tests[0].get("username", "")
-                player_total_points = player_totals.get(player_username, 0)
+            if replica_ready:
+                # The replica missed these rows (sync lag); repair it before ranking
+                TESTS_REPLICA.upsert_rows(tests)
 
-                for idx, (name, pts) in enumerate(sorted_players, 1):
-                    if name == player_username:
-                        global_rank = idx
-                        break
+        # Global rank from the resident tierlist index (fed by the replica)
+        player_username = tests[0].get("username", "")
+        global_rank = TIERLIST_INDEX.rank_of(player_username) if replica_ready else None
 
         # Build embed - use purple if player has any retired ranks
         has_retired = any(str(t.get("rank", "")).startswith("R") for t in tests)
@@ -4018,13 +6607,15 @@ async def profile(interaction: discord.Interaction, name: str):
 @app_commands.describe(
     gamemode="A játékmód (pl. sword, pot, smp)",
     tier="A tier (pl. ht3, lt1)",
-    sajat="Include self in roll (default: no)"
+    sajat="Include self in roll (default: no)",
+    mod="Sorsolás módja (alap: egyenletes)"
 )
 @app_commands.choices(
     gamemode=_choices_from_list(MODE_LIST),
-    tier=_choices_from_list(RANKS)
+    tier=_choices_from_list(RANKS),
+    mod=[app_commands.Choice(name=label, value=value) for label, value in SPIN_STRATEGIES]
 )
-async def spin(interaction: discord.Interaction, gamemode: app_commands.Choice[str], tier: app_commands.Choice[str], sajat: bool = False):
+async def spin(interaction: discord.Interaction, gamemode: app_commands.Choice[str], tier: app_commands.Choice[str], sajat: bool = False, mod: Optional[app_commands.Choice[str]] = None):
     await interaction.response.defer(ephemeral=False)
 
     try:
@@ -4032,51 +6623,62 @@ async def spin(interaction: discord.Interaction, gamemode: app_commands.Choice[s
             await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
             return
 
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
-
         # Try to exclude the ticket owner (unless sajat=True)
         exclude_user = None
         if not sajat:
             # Use Discord user's display name to exclude
             exclude_user = interaction.user.display_name.lower().replace(" ", "-")
 
-        # Build URL with exclusion if we found someone
-        url = f"{WEBSITE_URL}/api/tests?mode={gamemode.value}&tier={tier.value}"
-        if exclude_user:
-            url += f"&exclude={exclude_user}"
-
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
-
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+        if await ensure_tests_replica():
+            # Local pick from the replica-fed buckets, no web request
+            exclude = set()
+            if exclude_user:
+                exclude.add(exclude_user)
+                linked_mc = await get_linked_minecraft_name_async(interaction.user.id)
+                if linked_mc:
+                    exclude.add(linked_mc.lower())
+            session_id = interaction.guild.id if interaction.guild else interaction.user.id
+            username = SPIN_SAMPLER.pick(gamemode.value, tier.value, exclude, mod.value if mod else "uniform", session_id)
+            rank = tier.value
+        else:
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
                 return
 
-            player = data.get("player")
+            # Build URL with exclusion if we found someone
+            url = f"{WEBSITE_URL}/api/tests?mode={gamemode.value}&tier={tier.value}"
+            if exclude_user:
+                url += f"&exclude={exclude_user}"
 
-            if not player:
-                await interaction.followup.send("❌ Nincs találat erre a gamemódra és tier-re.", ephemeral=False)
-                return
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
+
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
+            player = data.get("player") or {}
             username = player.get("username")
             rank = player.get("rank")
 
-            embed = discord.Embed(
-                title="🎲 Sorsolt játékos",
-                description=f"**{username}** ({rank})",
-                color=discord.Color.gold()
-            )
+        if not username:
+            await interaction.followup.send("❌ Nincs találat erre a gamemódra és tier-re.", ephemeral=False)
+            return
 
-            skin_url = f"https://minotar.net/helm/{username}/128.png"
-            embed.set_thumbnail(url=skin_url)
+        embed = discord.Embed(
+            title="🎲 Sorsolt játékos",
+            description=f"**{username}** ({rank})",
+            color=discord.Color.gold()
+        )
+
+        skin_url = f"https://minotar.net/helm/{username}/128.png"
+        embed.set_thumbnail(url=skin_url)
 
-            await interaction.followup.send(embed=embed)
+        await interaction.followup.send(embed=embed)
 
     except aiohttp.ClientError as e:
         await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
@@ -4098,82 +6700,85 @@ async def spin(interaction: discord.Interaction, gamemode: app_commands.Choice[s
 @app_commands.choices(
     gamemode=_choices_from_list(MODE_LIST)
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def retire(interaction: discord.Interaction, name: str, gamemode: app_commands.Choice[str]):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not can_assign_all_tiers(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
+    async with PLAYER_LOCKS.hold(name.lower()):
+        try:
+            if not can_assign_all_tiers(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
+                return
 
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
+                return
 
-        # First, check the player's current rank to ensure they are Tier 2
-        url = f"{WEBSITE_URL}/api/tests?username={name}&gamemode={gamemode.value}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
+            # First, check the player's current rank to ensure they are Tier 2
+            url = f"{WEBSITE_URL}/api/tests?username={name}&gamemode={gamemode.value}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
-                return
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            test = data.get("test")
-            if not test:
-                await interaction.followup.send(
-                    f"❌ Játékos nem találva: **{name}** ezen a gamemódon ({gamemode.value}).",
-                    ephemeral=True
-                )
-                return
+                test = data.get("test")
+                if not test:
+                    await interaction.followup.send(
+                        f"❌ Játékos nem találva: **{name}** ezen a gamemódon ({gamemode.value}).",
+                        ephemeral=True
+                    )
+                    return
 
-            current_rank = test.get("rank", "")
-            # Check if Tier 2
-            if current_rank not in ["LT2", "HT2"]:
-                await interaction.followup.send(
-                    f"❌ Csak Tier 2 (LT2/HT2) játékosok nyugdíjazhatók. **{name}** jelenleg: **{current_rank}**.",
-                    ephemeral=True
-                )
-                return
+                current_rank = test.get("rank", "")
+                # Check if Tier 2
+                if current_rank not in ["LT2", "HT2"]:
+                    await interaction.followup.send(
+                        f"❌ Csak Tier 2 (LT2/HT2) játékosok nyugdíjazhatók. **{name}** jelenleg: **{current_rank}**.",
+                        ephemeral=True
+                    )
+                    return
 
-        # Call the website API to retire (upsert with R prefix)
-        retire_url = f"{WEBSITE_URL}/api/tests"
-        payload = {
-            "username": name,
-            "gamemode": gamemode.value,
-            "rank": f"R{current_rank}",
-            "points": POINTS.get(current_rank, 0), # Keep same points
-            "retired": True
-        }
+            # Call the website API to retire (upsert with R prefix)
+            retire_url = f"{WEBSITE_URL}/api/tests"
+            payload = {
+                "username": name,
+                "gamemode": gamemode.value,
+                "rank": f"R{current_rank}",
+                "points": POINTS.get(current_rank, 0), # Keep same points
+                "retired": True
+            }
 
-        async with http_session.post(retire_url, json=payload, headers=_auth_headers(), timeout=timeout) as retire_resp:
-            try:
-                retire_data = await retire_resp.json()
-            except Exception:
-                retire_data = {}
+            async with http_session.post(retire_url, json=payload, headers=_auth_headers(), timeout=timeout) as retire_resp:
+                try:
+                    retire_data = await retire_resp.json()
+                except Exception:
+                    retire_data = {}
 
-            if retire_resp.status == 200:
-                msg = f"✅ Sikeres nyugdíjazás! **{name}** ({gamemode.value}) most **R{current_rank}**."
+                if retire_resp.status == 200:
+                    TESTS_REPLICA.apply_test(name, gamemode.value, POINTS.get(current_rank, 0), f"R{current_rank}")
+                    msg = f"✅ Sikeres nyugdíjazás! **{name}** ({gamemode.value}) most **R{current_rank}**."
 
-                await interaction.followup.send(msg, ephemeral=True)
-            else:
-                # Truncate retire_data to avoid Discord's 2000 character limit
-                retire_data_str = truncate_message(str(retire_data), 1500)
-                await interaction.followup.send(
-                    f"⚠️ Hiba: {retire_resp.status} - {retire_data_str}",
-                    ephemeral=True
-                )
+                    await interaction.followup.send(msg, ephemeral=True)
+                else:
+                    # Truncate retire_data to avoid Discord's 2000 character limit
+                    retire_data_str = truncate_message(str(retire_data), 1500)
+                    await interaction.followup.send(
+                        f"⚠️ Hiba: {retire_resp.status} - {retire_data_str}",
+                        ephemeral=True
+                    )
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="unretire", description="Játékos visszahozása nyugdíjból (admin csak).")
@@ -4184,176 +6789,182 @@ async def retire(interaction: discord.Interaction, name: str, gamemode: app_comm
 @app_commands.choices(
     gamemode=_choices_from_list(MODE_LIST)
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def unretire(interaction: discord.Interaction, name: str, gamemode: app_commands.Choice[str]):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not can_assign_all_tiers(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
+    async with PLAYER_LOCKS.hold(name.lower()):
+        try:
+            if not can_assign_all_tiers(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
+                return
 
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
+                return
 
-        # First, get current rank to remove R prefix
-        url = f"{WEBSITE_URL}/api/tests?username={name}&gamemode={gamemode.value}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
+            # First, get current rank to remove R prefix
+            url = f"{WEBSITE_URL}/api/tests?username={name}&gamemode={gamemode.value}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
-                return
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            test = data.get("test")
-            if not test:
-                await interaction.followup.send(
-                    f"❌ Játékos nem találva: **{name}** ezen a gamemódon ({gamemode.value}).",
-                    ephemeral=True
-                )
-                return
+                test = data.get("test")
+                if not test:
+                    await interaction.followup.send(
+                        f"❌ Játékos nem találva: **{name}** ezen a gamemódon ({gamemode.value}).",
+                        ephemeral=True
+                    )
+                    return
 
-            current_rank = test.get("rank", "")
-            if not current_rank.startswith("R"):
-                await interaction.followup.send(
-                    f"❌ A játékos nincs nyugdíjazva ebben a gamemódban.",
-                    ephemeral=True
-                )
-                return
+                current_rank = test.get("rank", "")
+                if not current_rank.startswith("R"):
+                    await interaction.followup.send(
+                        f"❌ A játékos nincs nyugdíjazva ebben a gamemódban.",
+                        ephemeral=True
+                    )
+                    return
 
-            original_rank = current_rank[1:] # Remove R prefix
+                original_rank = current_rank[1:] # Remove R prefix
 
-        # Upsert back to original rank
-        post_url = f"{WEBSITE_URL}/api/tests"
-        payload = {
-            "username": name,
-            "gamemode": gamemode.value,
-            "rank": original_rank,
-            "points": POINTS.get(original_rank, 0)
-        }
+            # Upsert back to original rank
+            post_url = f"{WEBSITE_URL}/api/tests"
+            payload = {
+                "username": name,
+                "gamemode": gamemode.value,
+                "rank": original_rank,
+                "points": POINTS.get(original_rank, 0)
+            }
 
-        async with http_session.post(post_url, json=payload, headers=_auth_headers(), timeout=timeout) as post_resp:
-            try:
-                post_data = await post_resp.json()
-            except Exception:
-                post_data = {}
+            async with http_session.post(post_url, json=payload, headers=_auth_headers(), timeout=timeout) as post_resp:
+                try:
+                    post_data = await post_resp.json()
+                except Exception:
+                    post_data = {}
 
-            if post_resp.status == 200:
-                msg = f"✅ Sikeres visszahozatal! **{name}** ({gamemode.value}) visszatért a tierlistára ({original_rank})."
+                if post_resp.status == 200:
+                    TESTS_REPLICA.apply_test(name, gamemode.value, POINTS.get(original_rank, 0), original_rank)
+                    msg = f"✅ Sikeres visszahozatal! **{name}** ({gamemode.value}) visszatért a tierlistára ({original_rank})."
 
-                await interaction.followup.send(msg, ephemeral=True)
-            else:
-                # Truncate post_data to avoid Discord's 2000 character limit
-                post_data_str = truncate_message(str(post_data), 1500)
-                await interaction.followup.send(
-                    f"⚠️ Hiba: {post_resp.status} - {post_data_str}",
-                    ephemeral=True
-                )
+                    await interaction.followup.send(msg, ephemeral=True)
+                else:
+                    # Truncate post_data to avoid Discord's 2000 character limit
+                    post_data_str = truncate_message(str(post_data), 1500)
+                    await interaction.followup.send(
+                        f"⚠️ Hiba: {post_resp.status} - {post_data_str}",
+                        ephemeral=True
+                    )
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="fullretire", description="Játékos teljes nyugdíjazása minden tesztelt gamemódban (admin csak).")
 @app_commands.describe(
     name="A játékos neve a tierlistán"
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def fullretire(interaction: discord.Interaction, name: str):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not can_assign_all_tiers(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
-
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
-
-        # Get all tests for the player
-        url = f"{WEBSITE_URL}/api/tests?username={name}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
-
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+    async with PLAYER_LOCKS.hold(name.lower()):
+        try:
+            if not can_assign_all_tiers(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
                 return
 
-            tests = data.get("tests", [])
-            if not tests:
-                await interaction.followup.send(
-                    f"❌ Játékos nem találva vagy nincs tesztelve: **{name}**.",
-                    ephemeral=True
-                )
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
                 return
 
-        # Retire in each gamemode
-        retired_modes = []
-        errors = []
+            # Get all tests for the player
+            url = f"{WEBSITE_URL}/api/tests?username={name}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-        for test in tests:
-            gamemode_key = test.get("gamemode", "").lower()
-            gamemode_display = get_gamemode_display_name(gamemode_key)
-            current_rank = test.get("rank", "")
-            if not current_rank or current_rank.startswith("R"):
-                continue  # Already retired or invalid
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            # Remove the current entry first
-            try:
-                remove_result = await api_remove_player(username=name, gamemode=gamemode_display)
-                if not remove_result.get("status") in (200, 204):
-                    errors.append(f"{gamemode_display}: failed to remove current rank ({remove_result.get('status')})")
-                    continue
-            except Exception as e:
-                errors.append(f"{gamemode_display}: remove error {e}")
-                continue
+                tests = data.get("tests", [])
+                if not tests:
+                    await interaction.followup.send(
+                        f"❌ Játékos nem találva vagy nincs tesztelve: **{name}**.",
+                        ephemeral=True
+                    )
+                    return
 
-            # Add the retired rank
-            retire_url = f"{WEBSITE_URL}/api/tests"
-            payload = {
-                "username": name,
-                "gamemode": gamemode_display,
-                "rank": f"R{current_rank}",
-                "points": POINTS.get(current_rank, 0),  # Keep same points
-                "retired": True
-            }
+            # Retire in each gamemode
+            retired_modes = []
+            errors = []
+
+            for test in tests:
+                gamemode_key = test.get("gamemode", "").lower()
+                gamemode_display = get_gamemode_display_name(gamemode_key)
+                current_rank = test.get("rank", "")
+                if not current_rank or current_rank.startswith("R"):
+                    continue  # Already retired or invalid
+
+                # Remove the current entry first
+                try:
+                    remove_result = await api_remove_player(username=name, gamemode=gamemode_display)
+                    if not remove_result.get("status") in (200, 204):
+                        errors.append(f"{gamemode_display}: failed to remove current rank ({remove_result.get('status')})")
+                        continue
+                except Exception as e:
+                    errors.append(f"{gamemode_display}: remove error {e}")
+                    continue
 
-            try:
-                async with http_session.post(retire_url, json=payload, headers=_auth_headers(), timeout=timeout) as retire_resp:
-                    if retire_resp.status == 200:
-                        retired_modes.append(f"{gamemode_display} ({current_rank} → R{current_rank})")
-                    else:
-                        errors.append(f"{gamemode_display}: {retire_resp.status}")
-            except Exception as e:
-                errors.append(f"{gamemode_display}: {e}")
+                # Add the retired rank
+                retire_url = f"{WEBSITE_URL}/api/tests"
+                payload = {
+                    "username": name,
+                    "gamemode": gamemode_display,
+                    "rank": f"R{current_rank}",
+                    "points": POINTS.get(current_rank, 0),  # Keep same points
+                    "retired": True
+                }
 
-        # Build response
-        msg_parts = [f"✅ **{name}** teljes nyugdíjazása:"]
-        if retired_modes:
-            msg_parts.append(f"**Nyugdíjazott módok:**\n" + "\n".join(f"• {mode}" for mode in retired_modes))
-        if errors:
-            msg_parts.append(f"**Hibák:**\n" + "\n".join(f"• {err}" for err in errors))
+                try:
+                    async with http_session.post(retire_url, json=payload, headers=_auth_headers(), timeout=timeout) as retire_resp:
+                        if retire_resp.status == 200:
+                            TESTS_REPLICA.apply_test(name, gamemode_display, POINTS.get(current_rank, 0), f"R{current_rank}")
+                            retired_modes.append(f"{gamemode_display} ({current_rank} → R{current_rank})")
+                        else:
+                            errors.append(f"{gamemode_display}: {retire_resp.status}")
+                except Exception as e:
+                    errors.append(f"{gamemode_display}: {e}")
 
-        await interaction.followup.send("\n\n".join(msg_parts), ephemeral=True)
+            # Build response
+            msg_parts = [f"✅ **{name}** teljes nyugdíjazása:"]
+            if retired_modes:
+                msg_parts.append(f"**Nyugdíjazott módok:**\n" + "\n".join(f"• {mode}" for mode in retired_modes))
+            if errors:
+                msg_parts.append(f"**Hibák:**\n" + "\n".join(f"• {err}" for err in errors))
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+            await interaction.followup.send("\n\n".join(msg_parts), ephemeral=True)
+
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="fullunretire", description="Játékos visszahozása teljes nyugdíjból minden gamemódban (admin csak).")
@@ -4363,92 +6974,94 @@ async def fullretire(interaction: discord.Interaction, name: str):
 async def fullunretire(interaction: discord.Interaction, name: str):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not can_assign_all_tiers(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
+    async with PLAYER_LOCKS.hold(name.lower()):
+        try:
+            if not can_assign_all_tiers(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
+                return
 
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
+                return
 
-        # Get all tests for the player
-        url = f"{WEBSITE_URL}/api/tests?username={name}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
+            # Get all tests for the player
+            url = f"{WEBSITE_URL}/api/tests?username={name}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
-                return
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            tests = data.get("tests", [])
-            if not tests:
-                await interaction.followup.send(
-                    f"❌ Játékos nem találva vagy nincs tesztelve: **{name}**.",
-                    ephemeral=True
-                )
-                return
+                tests = data.get("tests", [])
+                if not tests:
+                    await interaction.followup.send(
+                        f"❌ Játékos nem találva vagy nincs tesztelve: **{name}**.",
+                        ephemeral=True
+                    )
+                    return
 
-        # Unretire in each gamemode
-        unretired_modes = []
-        errors = []
+            # Unretire in each gamemode
+            unretired_modes = []
+            errors = []
 
-        for test in tests:
-            gamemode_key = test.get("gamemode", "").lower()
-            gamemode_display = get_gamemode_display_name(gamemode_key)
-            current_rank = test.get("rank", "")
-            if not current_rank or not current_rank.startswith("R"):
-                continue
+            for test in tests:
+                gamemode_key = test.get("gamemode", "").lower()
+                gamemode_display = get_gamemode_display_name(gamemode_key)
+                current_rank = test.get("rank", "")
+                if not current_rank or not current_rank.startswith("R"):
+                    continue
 
-            original_rank = current_rank[1:]  # Remove R prefix
+                original_rank = current_rank[1:]  # Remove R prefix
 
-            # Remove the retired entry first
-            try:
-                remove_result = await api_remove_player(username=name, gamemode=gamemode_display)
-                if not remove_result.get("status") in (200, 204):
-                    errors.append(f"{gamemode_display}: failed to remove retired rank ({remove_result.get('status')})")
+                # Remove the retired entry first
+                try:
+                    remove_result = await api_remove_player(username=name, gamemode=gamemode_display)
+                    if not remove_result.get("status") in (200, 204):
+                        errors.append(f"{gamemode_display}: failed to remove retired rank ({remove_result.get('status')})")
+                        continue
+                except Exception as e:
+                    errors.append(f"{gamemode_display}: remove error {e}")
                     continue
-            except Exception as e:
-                errors.append(f"{gamemode_display}: remove error {e}")
-                continue
 
-            # Add back the original rank
-            post_url = f"{WEBSITE_URL}/api/tests"
-            payload = {
-                "username": name,
-                "gamemode": gamemode_display,
-                "rank": original_rank,
-                "points": POINTS.get(original_rank, 0)
-            }
+                # Add back the original rank
+                post_url = f"{WEBSITE_URL}/api/tests"
+                payload = {
+                    "username": name,
+                    "gamemode": gamemode_display,
+                    "rank": original_rank,
+                    "points": POINTS.get(original_rank, 0)
+                }
 
-            try:
-                async with http_session.post(post_url, json=payload, headers=_auth_headers(), timeout=timeout) as post_resp:
-                    if post_resp.status == 200:
-                        unretired_modes.append(f"{gamemode_display} (R{original_rank} → {original_rank})")
-                    else:
-                        errors.append(f"{gamemode_display}: {post_resp.status}")
-            except Exception as e:
-                errors.append(f"{gamemode_display}: {e}")
+                try:
+                    async with http_session.post(post_url, json=payload, headers=_auth_headers(), timeout=timeout) as post_resp:
+                        if post_resp.status == 200:
+                            TESTS_REPLICA.apply_test(name, gamemode_display, POINTS.get(original_rank, 0), original_rank)
+                            unretired_modes.append(f"{gamemode_display} (R{original_rank} → {original_rank})")
+                        else:
+                            errors.append(f"{gamemode_display}: {post_resp.status}")
+                except Exception as e:
+                    errors.append(f"{gamemode_display}: {e}")
 
-        # Build response
-        msg_parts = [f"✅ **{name}** visszahozatala teljes nyugdíjból:"]
-        if unretired_modes:
-            msg_parts.append(f"**Visszahozott módok:**\n" + "\n".join(f"• {mode}" for mode in unretired_modes))
-        if errors:
-            msg_parts.append(f"**Hibák:**\n" + "\n".join(f"• {err}" for err in errors))
+            # Build response
+            msg_parts = [f"✅ **{name}** visszahozatala teljes nyugdíjból:"]
+            if unretired_modes:
+                msg_parts.append(f"**Visszahozott módok:**\n" + "\n".join(f"• {mode}" for mode in unretired_modes))
+            if errors:
+                msg_parts.append(f"**Hibák:**\n" + "\n".join(f"• {err}" for err in errors))
 
-        await interaction.followup.send("\n\n".join(msg_parts), ephemeral=True)
+            await interaction.followup.send("\n\n".join(msg_parts), ephemeral=True)
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout.", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="tierlistban", description="Játékos kitiltása a tesztelésből (admin csak).")
@@ -4457,6 +7070,7 @@ async def fullunretire(interaction: discord.Interaction, name: str):
     days="Kitiltás időtartama napokban (0 = örök ban)",
     reason="Kitiltás oka (opcionális)"
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def tierlistban(interaction: discord.Interaction, name: str, days: int, reason: str = ""):
     await interaction.response.defer(ephemeral=True)
 
@@ -4469,22 +7083,21 @@ async def tierlistban(interaction: discord.Interaction, name: str, days: int, re
             return
 
         # Check if already banned
-        if is_player_banned(name):
-            ban_info = get_ban_info(name)
-            if ban_info:
-                expires_at = ban_info.get("expires_at", 0)
-                if expires_at == 0:
-                    await interaction.followup.send(
-                        f"❌ **{name}** már örökkitiltás alatt áll.",
-                        ephemeral=True
-                    )
-                else:
-                    from datetime import datetime
-                    exp_date = datetime.fromtimestamp(expires_at)
-                    await interaction.followup.send(
-                        f"❌ **{name}** már kitiltva. Lejárat: {exp_date.strftime('%Y-%m-%d %H:%M')}",
-                        ephemeral=True
-                    )
+        ban_info = get_ban_info(name)
+        if ban_info:
+            expires_at = ban_info.get("expires_at", 0)
+            if expires_at == 0:
+                await interaction.followup.send(
+                    f"❌ **{name}** már örökkitiltás alatt áll.",
+                    ephemeral=True
+                )
+            else:
+                from datetime import datetime
+                exp_date = datetime.fromtimestamp(expires_at)
+                await interaction.followup.send(
+                    f"❌ **{name}** már kitiltva. Lejárat: {exp_date.strftime('%Y-%m-%d %H:%M')}",
+                    ephemeral=True
+                )
             return
 
         # Ban the player in bot
@@ -4624,94 +7237,96 @@ class ConfirmRemoveView(discord.ui.View):
 @app_commands.describe(
     name="A játékos neve a tierlistán (Minecraft név)"
 )
+@app_commands.autocomplete(name=autocomplete_player_name)
 async def removetierlist(interaction: discord.Interaction, name: str):
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        if not interaction.guild or not isinstance(interaction.user, discord.Member):
-            await interaction.followup.send("Hiba.", ephemeral=True)
-            return
-        if not is_staff_member(interaction.user):
-            await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
-            return
-
-        if not WEBSITE_URL:
-            await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
-            return
-
-        # First, check if the player exists in the tierlist (case-sensitive)
-        url = f"{WEBSITE_URL}/api/tests?username={name}"
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                data = {}
+    async with PLAYER_LOCKS.hold(name.lower()):
+        try:
+            if not interaction.guild or not isinstance(interaction.user, discord.Member):
+                await interaction.followup.send("Hiba.", ephemeral=True)
+                return
+            if not is_staff_member(interaction.user):
+                await interaction.followup.send("Nincs jogosultságod ehhez a parancshoz.", ephemeral=True)
+                return
 
-            if resp.status != 200:
-                await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+            if not WEBSITE_URL:
+                await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
                 return
 
-            tests = data.get("tests", [])
+            # First, check if the player exists in the tierlist (case-sensitive)
+            url = f"{WEBSITE_URL}/api/tests?username={name}"
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
+                try:
+                    data = await resp.json()
+                except Exception:
+                    data = {}
 
-            # Filter for exact case-sensitive match
-            exact_match_tests = [t for t in tests if t.get("username", "") == name]
+                if resp.status != 200:
+                    await interaction.followup.send(f"⚠️ Hiba a weboldal lekérésekor: {resp.status}", ephemeral=True)
+                    return
 
-            # If no exact match, check if there's a similar name with different case
-            if not exact_match_tests:
-                similar = [t for t in tests if t.get("username", "").lower() == name.lower()]
-                if similar:
-                    similar_names = ", ".join([f"`{t.get('username')}`" for t in similar])
-                    await interaction.followup.send(
-                        f"❌ **{name}** nincs a tierlistán.\n\n"
-                        f"Hasonló név(ek) talált: {similar_names}\n"
-                        f"Kérlek írd be a pontos nevet (a nagybetűk számítanak)!",
-                        ephemeral=True
-                    )
-                else:
-                    await interaction.followup.send(
-                        f"❌ **{name}** nincs a tierlistán.",
-                        ephemeral=True
-                    )
-                return
+                tests = data.get("tests", [])
+
+                # Filter for exact case-sensitive match
+                exact_match_tests = [t for t in tests if t.get("username", "") == name]
+
+                # If no exact match, check if there's a similar name with different case
+                if not exact_match_tests:
+                    similar = [t for t in tests if t.get("username", "").lower() == name.lower()]
+                    if similar:
+                        similar_names = ", ".join([f"`{t.get('username')}`" for t in similar])
+                        await interaction.followup.send(
+                            f"❌ **{name}** nincs a tierlistán.\n\n"
+                            f"Hasonló név(ek) talált: {similar_names}\n"
+                            f"Kérlek írd be a pontos nevet (a nagybetűk számítanak)!",
+                            ephemeral=True
+                        )
+                    else:
+                        await interaction.followup.send(
+                            f"❌ **{name}** nincs a tierlistán.",
+                            ephemeral=True
+                        )
+                    return
 
-            # Use exact match
-            tests = exact_match_tests
-            actual_username = tests[0].get("username", "")
+                # Use exact match
+                tests = exact_match_tests
+                actual_username = tests[0].get("username", "")
 
-            # Show info about the player (limit to 1500 chars to avoid embed limits)
-            modes_info = "\n".join([f"• **{t.get('gamemode', '?')}**: {t.get('rank', '?')} ({t.get('points', 0)}pt)" for t in tests])
-            if len(modes_info) > 1500:
-                modes_info = modes_info[:1500] + "\n... (több is van)"
+                # Show info about the player (limit to 1500 chars to avoid embed limits)
+                modes_info = "\n".join([f"• **{t.get('gamemode', '?')}**: {t.get('rank', '?')} ({t.get('points', 0)}pt)" for t in tests])
+                if len(modes_info) > 1500:
+                    modes_info = modes_info[:1500] + "\n... (több is van)"
 
-        # Create confirmation embed
-        embed = discord.Embed(
-            title="⚠️ FIGYELMEZTETÉS - Törlés előtt!",
-            description=f"Biztosan eltávolítod **{name}**-t a tierlistáról?\n\n"
-                       f"**Jelenlegi tierlist bejegyzések:**\n{modes_info}\n\n"
-                       f"❗ **EZ EGY VÉGÉGES MŰVELET!** A játékos minden gamemód-beli eredménye törlésre kerül.",
-            color=discord.Color.red()
-        )
-        embed.set_footer(text=f"Kéri: {interaction.user.display_name}")
+            # Create confirmation embed
+            embed = discord.Embed(
+                title="⚠️ FIGYELMEZTETÉS - Törlés előtt!",
+                description=f"Biztosan eltávolítod **{name}**-t a tierlistáról?\n\n"
+                           f"**Jelenlegi tierlist bejegyzések:**\n{modes_info}\n\n"
+                           f"❗ **EZ EGY VÉGÉGES MŰVELET!** A játékos minden gamemód-beli eredménye törlésre kerül.",
+                color=discord.Color.red()
+            )
+            embed.set_footer(text=f"Kéri: {interaction.user.display_name}")
 
-        # Send confirmation view
-        view = ConfirmRemoveView(username=name, actual_username=name, moderator=interaction.user)
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+            # Send confirmation view
+            view = ConfirmRemoveView(username=name, actual_username=name, moderator=interaction.user)
+            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
-    except aiohttp.ClientError as e:
-        await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
-    except asyncio.TimeoutError:
-        await interaction.followup.send("⚠️ Web timeout (nem válaszolt 10 mp-en belül).", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except aiohttp.ClientError as e:
+            await interaction.followup.send(f"⚠️ Web hiba: {type(e).__name__}: {e}", ephemeral=True)
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⚠️ Web timeout (nem válaszolt 10 mp-en belül).", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Hiba: {type(e).__name__}: {e}", ephemeral=True)
 
 
 @app_commands.command(name="bulkimport", description="Bulk import test results from file (admin only)")
 @app_commands.describe(
-    file="Text file with test results (one per line: username mode rank)"
+    file="Text file with test results (one per line: username mode rank, or username mode status tier)"
 )
 async def bulkimport(interaction: discord.Interaction, file: discord.Attachment):
-    """Bulk import test results from a text file - format: username mode rank (one per line)"""
+    """Bulk import test results from a text file - format: username mode rank, or restore.txt's username mode status tier (one per line)"""
     await interaction.response.defer(ephemeral=True)
 
     # Check if admin
@@ -4719,7 +7334,7 @@ async def bulkimport(interaction: discord.Interaction, file: discord.Attachment)
         await interaction.followup.send("Nincs jogosultságod ehhez.", ephemeral=True)
         return
 
-    if not WEBSITE_URL:
+    if not WEBSITE_URL and db_pool is None and not USE_SUPABASE_API:
         await interaction.followup.send("⚠️ WEBSITE_URL nincs beállítva.", ephemeral=True)
         return
 
@@ -4731,50 +7346,47 @@ async def bulkimport(interaction: discord.Interaction, file: discord.Attachment)
         await interaction.followup.send(f"❌ Hiba a fájl olvasásakor: {e}", ephemeral=True)
         return
 
-    lines = data.strip().split('\n')
-    success_count = 0
-    error_count = 0
     errors = []
-
-    for line in lines:
+    # Later lines win for the same (username, gamemode), and one upsert can't touch a row twice
+    rows_by_key: Dict[tuple, Dict[str, Any]] = {}
+    for line in data.strip().split('\n'):
         line = line.strip()
         if not line:
             continue
-
-        parts = line.split()
-        if len(parts) < 3:
-            error_count += 1
-            errors.append(f"Invalid format: {line}")
+        row, error = parse_bulk_import_line(line)
+        if error:
+            errors.append(error)
             continue
-
-        username = parts[0]
-        mode = parts[1].lower()
-        rank = parts[2].upper()
-
-        # Get proper display name for mode
-        mode_display = get_gamemode_display_name(mode)
-
-        # Get tester (use bot as tester)
-        tester = interaction.user
-
+        rows_by_key[(row["username"], row["gamemode"])] = row
+
+    rows = list(rows_by_key.values())
+    total = len(rows)
+    progress = await interaction.followup.send(f"⏳ Import folyamatban: 0/{total}", ephemeral=True, wait=True)
+
+    failed = 0
+    for start in range(0, total, BULK_IMPORT_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_IMPORT_CHUNK_SIZE]
+        chunk_errors = await bulk_upsert_tests(chunk, interaction.user)
+        failed += len(chunk_errors)
+        errors.extend(chunk_errors)
+        done = min(start + BULK_IMPORT_CHUNK_SIZE, total)
         try:
-            save = await api_post_test(username=username, mode=mode_display, rank=rank, tester=tester)
-            if save.get("status") in [200, 201]:
-                success_count += 1
-            else:
-                error_count += 1
-                errors.append(f"Failed: {username} {mode} {rank}")
-        except Exception as e:
-            error_count += 1
-            errors.append(f"Error: {username} - {str(e)[:50]}")
+            await progress.edit(content=f"⏳ Import folyamatban: {done}/{total} (hibás: {len(errors)})")
+        except discord.HTTPException:
+            pass
 
+    success_count = total - failed
+    error_count = len(errors)
     result_msg = f"✅ Sikeres import: {success_count}\n❌ Sikertelen: {error_count}"
     if errors:
         result_msg += "\n\nHibák:\n" + "\n".join(errors[:10])
         if len(errors) > 10:
             result_msg += f"\n... és még {len(errors) - 10} hiba"
 
-    await interaction.followup.send(result_msg, ephemeral=True)
+    try:
+        await progress.edit(content=truncate_message(result_msg))
+    except discord.HTTPException:
+        await interaction.followup.send(truncate_message(result_msg), ephemeral=True)
 
 
 @app_commands.command(name="cooldown", description="Megnézed a cooldownidat egy játékmódban, vagy egy másik játékos cooldownját (staff).")
@@ -4828,30 +7440,28 @@ async def cooldown(interaction: discord.Interaction, user: discord.User = None):
                 pass  # If ban check fails, continue
 
         # Check local ban (bot-side)
-        if is_player_banned(target_member.display_name):
-            ban_info = get_ban_info(target_member.display_name)
-            if ban_info:
-                expires_at = ban_info.get("expires_at", 0)
-                if expires_at == 0:
-                    await interaction.followup.send(
-                        f"❌ **{target_member.display_name}** örökre ki van tiltva a tesztelésből!\n"
-                        f"**Ok:** {ban_info.get('reason', 'Nincs megadva')}",
-                        ephemeral=True
-                    )
-                else:
-                    from datetime import datetime
-                    exp_date = datetime.fromtimestamp(expires_at)
-                    await interaction.followup.send(
-                        f"❌ **{target_member.display_name}** ki van tiltva!\n"
-                        f"**Lejárat:** {exp_date.strftime('%Y-%m-%d %H:%M')}\n"
-                        f"**Ok:** {ban_info.get('reason', 'Nincs megadva')}",
-                        ephemeral=True
-                    )
-                return
+        ban_info = get_ban_info(target_member.display_name)
+        if ban_info:
+            expires_at = ban_info.get("expires_at", 0)
+            if expires_at == 0:
+                await interaction.followup.send(
+                    f"❌ **{target_member.display_name}** örökre ki van tiltva a tesztelésből!\n"
+                    f"**Ok:** {ban_info.get('reason', 'Nincs megadva')}",
+                    ephemeral=True
+                )
+            else:
+                from datetime import datetime
+                exp_date = datetime.fromtimestamp(expires_at)
+                await interaction.followup.send(
+                    f"❌ **{target_member.display_name}** ki van tiltva!\n"
+                    f"**Lejárat:** {exp_date.strftime('%Y-%m-%d %H:%M')}\n"
+                    f"**Ok:** {ban_info.get('reason', 'Nincs megadva')}",
+                    ephemeral=True
+                )
+            return
 
         # Build cooldown info for all modes
-        data = _load_data()
-        cooldowns = data.get("cooldowns", {}).get(str(target_member.id), {})
+        cooldowns = STATE_STORE.get("cooldowns", str(target_member.id), default={})
 
         embed = discord.Embed(
             title=f"⏳ Cooldown info - {target_member.display_name}",
@@ -4881,7 +7491,7 @@ async def cooldown(interaction: discord.Interaction, user: discord.User = None):
                     mode_cooldowns.append(f"⏳ **{label}**: {time_str}")
 
         # Add global cooldown info
-        global_last = data.get("cooldowns", {}).get(str(target_member.id), {}).get("_global", 0)
+        global_last = cooldowns.get("_global", 0)
         if global_last > 0:
             left = int((global_last + COOLDOWN_SECONDS) - time.time())
             if left > 0:
@@ -4916,9 +7526,8 @@ async def resetcooldown(interaction: discord.Interaction, user: discord.User, ga
         return
 
     try:
-        data = _load_data()
         user_id_str = str(user.id)
-        cooldowns = data.get("cooldowns", {})
+        cooldowns = STATE_STORE.get("cooldowns", default={})
 
         if gamemode:
             # Normalize gamemode
@@ -4930,8 +7539,7 @@ async def resetcooldown(interaction: discord.Interaction, user: discord.User, ga
                 return
 
             if user_id_str in cooldowns and gamemode_key in cooldowns.get(user_id_str, {}):
-                del cooldowns[user_id_str][gamemode_key]
-                _save_data(data)
+                STATE_STORE.delete(["cooldowns", user_id_str, gamemode_key])
                 mode_display = get_gamemode_display_name(gamemode_key)
                 await interaction.followup.send(f"✅ **{user.display_name}** cooldownja törölve a **{mode_display}** játékmódban!", ephemeral=True)
             else:
@@ -4939,8 +7547,7 @@ async def resetcooldown(interaction: discord.Interaction, user: discord.User, ga
         else:
             # Reset all cooldowns for user
             if user_id_str in cooldowns:
-                del cooldowns[user_id_str]
-                _save_data(data)
+                STATE_STORE.delete(["cooldowns", user_id_str])
                 await interaction.followup.send(f"✅ **{user.display_name}** összes cooldownja törölve!", ephemeral=True)
             else:
                 await interaction.followup.send(f"ℹ️ **{user.display_name}** nem rendelkezik cooldownnal.", ephemeral=True)
@@ -4954,6 +7561,7 @@ async def resetcooldown(interaction: discord.Interaction, user: discord.User, ga
     player="Játékos Minecraft neve akinek törölni kell a cooldownját",
     gamemode="Játékmód (opcionális, ha üres akkor minden játékmódban törlődik)"
 )
+@app_commands.autocomplete(player=autocomplete_player_name)
 async def resetcooldownplayer(interaction: discord.Interaction, player: str, gamemode: str = None):
     await interaction.response.defer(ephemeral=True)
 
@@ -4967,63 +7575,17 @@ async def resetcooldownplayer(interaction: discord.Interaction, player: str, gam
         return
 
     try:
-        data = _load_data()
-        cooldowns = data.get("cooldowns", {})
+        cooldowns = STATE_STORE.get("cooldowns", default={})
 
-        # Find Discord ID by Minecraft name (check linked accounts and all cooldowns)
+        # Find Discord ID by Minecraft name (in-memory link index, backend on a miss)
         target_discord_id = None
-        
-        # Try linked accounts first
-        for discord_id_str, mc_name in _load_link_data().items():
-            if mc_name.lower() == player.lower():
-                target_discord_id = discord_id_str
-                break
-        
-        # If not found in linked accounts, search in cooldowns (for unlinked players)
-        if not target_discord_id:
-            for discord_id_str, user_cooldowns in cooldowns.items():
-                # We can't easily map discord_id back to Minecraft name without looking up each one
-                # Just check if this discord_id has cooldowns and try to match
-                pass
-        
-        # Also check website linked accounts via API if available
-        if not target_discord_id and WEBSITE_URL:
-            # Try to find Discord ID from Minecraft name via website
-            try:
-                url = f"{WEBSITE_URL}/api/tests?username={player}"
-                timeout = aiohttp.ClientTimeout(total=5)
-                async with http_session.get(url, headers=_auth_headers(), timeout=timeout) as resp:
-                    if resp.status == 200:
-                        data_resp = await resp.json()
-                        tests = data_resp.get("tests", [])
-                        if tests:
-                            # We have test data but still need Discord ID
-                            # For now, we'll just try to find the discord_id in our local cooldowns
-                            pass
-            except Exception:
-                pass
-        
-        # Fallback: search through cooldowns and try to resolve each discord_id to a linked MC name
-        if not target_discord_id:
-            for discord_id_str, user_cooldowns in cooldowns.items():
-                try:
-                    discord_id_int = int(discord_id_str)
-                    linked_name = get_linked_minecraft_name(discord_id_int)
-                    if linked_name and linked_name.lower() == player.lower():
-                        target_discord_id = discord_id_str
-                        break
-                except (ValueError, TypeError):
-                    continue
-        
-        # If still not found, try direct database lookup
-        if not target_discord_id:
-            try:
-                discord_id_int = await get_discord_by_minecraft_async(player)
-                if discord_id_int:
-                    target_discord_id = str(discord_id_int)
-            except Exception:
-                pass
-        
+        try:
+            discord_id_int = await get_discord_by_minecraft_async(player)
+            if discord_id_int:
+                target_discord_id = str(discord_id_int)
+        except Exception:
+            pass
+
         # If the player name itself might be a Discord ID (some servers use this)
         if not target_discord_id:
             try:
@@ -5046,8 +7608,7 @@ async def resetcooldownplayer(interaction: discord.Interaction, player: str, gam
                 return
 
             if user_id_str and user_id_str in cooldowns and gamemode_key in cooldowns.get(user_id_str, {}):
-                del cooldowns[user_id_str][gamemode_key]
-                _save_data(data)
+                STATE_STORE.delete(["cooldowns", user_id_str, gamemode_key])
                 mode_display = get_gamemode_display_name(gamemode_key)
                 await interaction.followup.send(f"✅ **{player}** cooldownja törölve a **{mode_display}** játékmódban!", ephemeral=True)
             else:
@@ -5055,8 +7616,7 @@ async def resetcooldownplayer(interaction: discord.Interaction, player: str, gam
         else:
             # Reset all cooldowns for user
             if user_id_str and user_id_str in cooldowns:
-                del cooldowns[user_id_str]
-                _save_data(data)
+                STATE_STORE.delete(["cooldowns", user_id_str])
                 await interaction.followup.send(f"✅ **{player}** összes cooldownja törölve!", ephemeral=True)
             else:
                 await interaction.followup.send(f"ℹ️ **{player}** nem rendelkezik cooldownnal.", ephemeral=True)
@@ -5080,7 +7640,7 @@ async def link(interaction: discord.Interaction, code: str = None):
     if code is None or code == "" or not code_valid:
         try:
             # Check if user is already linked (try async first, then sync fallback)
-            existing_link = get_linked_minecraft_name(interaction.user.id)
+            existing_link = await get_linked_minecraft_name_async(interaction.user.id)
             if existing_link:
                 description = f"**Minecraft:** `{existing_link}`\n**Discord:** {interaction.user.mention}\n\nA kettős fiók már össze van kapcsolva!"
 
@@ -5157,7 +7717,7 @@ async def link(interaction: discord.Interaction, code: str = None):
 
     # If code IS provided and valid - show success!
     if code_valid:
-        linked_name = get_linked_minecraft_name(interaction.user.id)
+        linked_name = await get_linked_minecraft_name_async(interaction.user.id)
         embed = discord.Embed(
             title="✅ Fiók összekapcsolva!",
             description=f"**Minecraft:** `{linked_name}`\n"
@@ -5182,7 +7742,7 @@ async def unlink(interaction: discord.Interaction):
 
     try:
         # Check if linked
-        existing = get_linked_minecraft_name(interaction.user.id)
+        existing = await get_linked_minecraft_name_async(interaction.user.id)
         if not existing:
             await interaction.followup.send(
                 "❌ Nincs összekapcsolva Minecraft fiók!\n"
@@ -5192,7 +7752,7 @@ async def unlink(interaction: discord.Interaction):
             return
 
         # Unlink
-        unlink_minecraft_account(interaction.user.id)
+        await unlink_minecraft_account_async(interaction.user.id)
 
         embed = discord.Embed(
             title="✅ Sikeres leválasztás!",
@@ -5211,7 +7771,7 @@ async def mylink(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
 
     try:
-        linked = get_linked_minecraft_name(interaction.user.id)
+        linked = await get_linked_minecraft_name_async(interaction.user.id)
 
         if not linked:
             await interaction.followup.send(
@@ -5262,6 +7822,13 @@ async def wipe_global_commands_once():
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user} (id={bot.user.id})")
+    ready_started = time.perf_counter()
+    phases = []
+
+    def phase(name: str, since: float) -> float:
+        now = time.perf_counter()
+        phases.append(f"{name} {(now - since) * 1000:.0f} ms")
+        return now
 
     # Register persistent views only once (avoid duplicates on reconnect)
     if not hasattr(bot, '_persistent_views_added'):
@@ -5275,8 +7842,7 @@ async def on_ready():
     # Load persisted queue panel message ID
     global QUEUE_PANEL_MESSAGE
     try:
-        data = _load_data()
-        panel_data = data.get("queue_panel_message")
+        panel_data = STATE_STORE.get("queue_panel_message")
         if panel_data and isinstance(panel_data, list) and len(panel_data) == 2:
             QUEUE_PANEL_MESSAGE = (panel_data[0], panel_data[1])
     except Exception as e:
@@ -5285,8 +7851,7 @@ async def on_ready():
     # Load persisted queue message IDs
     global QUEUE_MESSAGE_IDS
     try:
-        data = _load_data()
-        raw_ids = data.get("queue_message_ids", [])
+        raw_ids = STATE_STORE.get("queue_message_ids", default=[])
         loaded = {}
         for entry in raw_ids:
             if isinstance(entry, list) and len(entry) == 2:
@@ -5299,14 +7864,26 @@ async def on_ready():
         QUEUE_MESSAGE_IDS = loaded
     except Exception as e:
         print(f"Error loading queue message IDs: {e}")
+    t = phase("load state", ready_started)
 
     # Rebuild queue message ID mapping after restart (in case persisted data is stale)
     if GUILD_ID:
         guild = bot.get_guild(GUILD_ID)
         if guild:
             await rebuild_queue_message_ids(guild)
-            # After rebuilding, persist the fresh mapping
-            _persist_queue_message_ids()
+            dropped = TICKETS.prune(guild)
+            if dropped:
+                print(f"[Tickets] Dropped {dropped} ticket(s) whose channel is gone")
+    t = phase("queue message ids", t)
+
+    # Bring back queues that were open before the restart
+    try:
+        restored = restore_active_queues()
+        if restored:
+            print(f"[QueueRestore] Restored {restored} queue(s)")
+    except Exception as e:
+        print(f"Error restoring queues: {e}")
+    t = phase("restore queues", t)
 
     guild = discord.Object(id=GUILD_ID) if GUILD_ID else None
 
@@ -5325,6 +7902,9 @@ async def on_ready():
         import traceback
         print("Sync failed:", e)
         traceback.print_exc()
+    phase("command sync", t)
+
+    print(f"[Ready] {(time.perf_counter() - ready_started) * 1000:.0f} ms total: {', '.join(phases)}")
 
 
 async def main():
@@ -5341,9 +7921,18 @@ async def main():
     # Initialize database
     await init_db()
 
+    print("Loading bot state...")
+    STATE_STORE.load()
+    STATE_STORE.start()
+    COOLDOWN_INDEX.rebuild(STATE_STORE.get("cooldowns", default={}))
+    TICKETS.rebuild()
+
     print("Initializing HTTP session...")
-    # Initialize http_session BEFORE starting health server
-    http_session = aiohttp.ClientSession()
+    # Initialize http_session BEFORE starting health server; every REST helper shares its pool
+    http_session = create_http_session()
+
+    print("Loading linked accounts...")
+    await warm_link_index()
 
     # health server - only start on Railway (not needed on Render)
     if os.getenv('RAILWAY_ENVIRONMENT'):
@@ -5359,6 +7948,20 @@ async def main():
     # bot notifications poll task
     asyncio.create_task(send_bot_notifications_task())
 
+    # tests replica sync (feeds the tierlist index)
+    asyncio.create_task(tests_sync_task())
+
+    # expired cooldown cleanup
+    asyncio.create_task(cooldown_sweeper_task())
+
+    # ban expiry + batched bans.json writes
+    BAN_REGISTRY.load()
+    asyncio.create_task(ban_maintenance_task())
+
+    # link code expiry + pending_codes purge
+    LINK_CODES.load()
+    asyncio.create_task(link_code_janitor_task())
+
     # register commands
     if GUILD_ID:
         g = discord.Object(id=GUILD_ID)
@@ -5421,33 +8024,145 @@ async def main():
         print("Shutting down...")
         if http_session:
             await http_session.close()
+        for store in WRITE_BEHIND_FILES:
+            await store.flush()
+        await STATE_STORE.close()
         await close_db()
 
 
 async def db_upsert_test(username: str, mode: str, rank: str, tester_id: str, tester_name: str, ts: int) -> bool:
     """Upsert test using direct PostgreSQL connection (fallback when Supabase unavailable)"""
     global db_pool
-    if not db_pool:
+    if not db_pool or not POSTGRES_BREAKER.allow():
         return False
+    row = _test_row(username, mode, rank)
+
+    async def write(conn):
+        if not TESTS_KEYED_UPSERT["postgres"]:
+            return await _db_update_or_insert_test(conn, row)
+        query = """
+        INSERT INTO tests (username, gamemode, rank, points, created_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (username_lower, gamemode) DO UPDATE SET
+            username = EXCLUDED.username,
+            rank = EXCLUDED.rank,
+            points = EXCLUDED.points,
+            created_at = EXCLUDED.created_at
+        """
+        await conn.execute(query, row["username"], row["gamemode"], rank, row["points"])
+
     try:
-        async with db_pool.acquire() as conn:
-            gamemode = get_gamemode_display_name(mode)
-            points = POINTS.get(rank, 0)
-            query = """
-            INSERT INTO tests (username, gamemode, rank, points, created_at)
-            VALUES ($1, $2, $3, $4, NOW())
-            ON CONFLICT (username, gamemode) DO UPDATE SET
-                rank = EXCLUDED.rank,
-                points = EXCLUDED.points,
-                created_at = EXCLUDED.created_at
-            """
-            await conn.execute(query, username, gamemode, rank, points)
-            return True
+        await pg_call(write)
+        return True
     except Exception as e:
         print(f"DB upsert error: {e}")
         return False
 
 
+BULK_IMPORT_CHUNK_SIZE = 250  # rows per bulk write
+
+
+async def _db_update_or_insert_test(conn, row: Dict[str, Any]) -> None:
+    """Write one tests row without the unique key: update the case-insensitive match, else insert."""
+    async with conn.transaction():
+        status = await conn.execute(
+            "UPDATE tests SET username = $1, rank = $3, points = $4, created_at = NOW() "
+            "WHERE LOWER(username) = LOWER($1) AND gamemode = $2",
+            row["username"], row["gamemode"], row["rank"], row["points"]
+        )
+        if status == "UPDATE 0":
+            await conn.execute(
+                "INSERT INTO tests (username, gamemode, rank, points, created_at) VALUES ($1, $2, $3, $4, NOW())",
+                row["username"], row["gamemode"], row["rank"], row["points"]
+            )
+
+
+async def db_bulk_upsert_tests(rows: List[Dict[str, Any]]) -> None:
+    """
+    COPY rows into a temp table and merge them into tests in one statement, or row by row
+    while the table lacks its (username_lower, gamemode) key. Raises on failure.
+    """
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            if not TESTS_KEYED_UPSERT["postgres"]:
+                for row in rows:
+                    await _db_update_or_insert_test(conn, row)
+                return
+            await conn.execute("""
+                CREATE TEMP TABLE bulk_tests (
+                    username TEXT, gamemode TEXT, rank TEXT, points INTEGER
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "bulk_tests",
+                records=[(r["username"], r["gamemode"], r["rank"], r["points"]) for r in rows],
+                columns=["username", "gamemode", "rank", "points"]
+            )
+            await conn.execute("""
+                INSERT INTO tests (username, gamemode, rank, points, created_at)
+                SELECT username, gamemode, rank, points, NOW() FROM bulk_tests
+                ON CONFLICT (username_lower, gamemode) DO UPDATE SET
+                    username = EXCLUDED.username,
+                    rank = EXCLUDED.rank,
+                    points = EXCLUDED.points,
+                    created_at = EXCLUDED.created_at
+            """)
+
+
+async def bulk_upsert_tests(rows: List[Dict[str, Any]], tester: discord.Member) -> List[str]:
+    """
+    Upsert many tests rows (built by _test_row). A chunk is written with one COPY + merge
+    on Postgres or one array upsert on Supabase; if that fails its rows are retried one by
+    one so a bad row only fails itself. Returns one error string per failed row.
+    """
+    errors = []
+
+    if db_pool is not None:
+        try:
+            await db_bulk_upsert_tests(rows)
+            for row in rows:
+                TESTS_REPLICA.apply_test(row["username"], row["gamemode"], row["points"], row["rank"])
+            return errors
+        except Exception as e:
+            print(f"[BulkImport] DB chunk of {len(rows)} failed, retrying per row: {e}")
+    elif USE_SUPABASE_API:
+        if await supabase_upsert_tests(rows):
+            for row in rows:
+                TESTS_REPLICA.apply_test(row["username"], row["gamemode"], row["points"], row["rank"])
+            return errors
+        print(f"[BulkImport] Supabase chunk of {len(rows)} failed, retrying per row")
+
+    for row in rows:
+        try:
+            save = await api_post_test(username=row["username"], mode=row["gamemode"], rank=row["rank"], tester=tester)
+            if save.get("status") not in (200, 201):
+                errors.append(f"Failed: {row['username']} {row['gamemode']} {row['rank']}")
+        except Exception as e:
+            errors.append(f"Error: {row['username']} - {str(e)[:50]}")
+    return errors
+
+
+def parse_bulk_import_line(line: str) -> tuple:
+    """
+    Parse "username mode rank" or restore.txt's "username mode status tier".
+    Returns (row, None) or (None, error).
+    """
+    parts = line.split()
+    if len(parts) == 3:
+        username, mode, rank = parts
+    elif len(parts) == 4:
+        username, mode, _status, rank = parts
+    else:
+        return None, f"Invalid format: {line}"
+
+    rank = rank.upper()
+    if rank == "UNRANKED":
+        rank = "Unranked"
+    if rank not in POINTS:
+        return None, f"Invalid rank: {line}"
+    return _test_row(username, mode.lower(), rank), None
+
+
 async def db_delete_test(test_id: str) -> bool:
     """Delete test by ID using direct PostgreSQL connection"""
     global db_pool
@@ -5478,36 +8193,27 @@ class JoinAsChoiceView(discord.ui.View):
         if not queue:
             await interaction.response.send_message('A queue már nem létezik.', ephemeral=True)
             return
-        if any(p.discord_id == self.member.id for p in queue['players']):
+        role = queue.role_of(self.member.id)
+        if role == 'player':
             await interaction.response.send_message('Már benne vagy a queue-ban játékosként!', ephemeral=True)
             self.stop()
             return
-        if any(t.discord_id == self.member.id for t in queue.get('testers', [])):
+        if role == 'tester':
             await interaction.response.send_message('Már benna van a queue-ban teszterként!', ephemeral=True)
             self.stop()
             return
-        cd_left = cooldown_left(self.member.id, self.gamemode)
-        if cd_left > 0:
-            days = cd_left // (24 * 60 * 60)
-            hours = (cd_left % (24 * 60 * 60)) // (60 * 60)
-            await interaction.response.send_message(
-                f'❌ Még **{days} nap {hours} óra** cooldown van hátra a **{get_gamemode_display_name(self.gamemode)}** módban. '
-                f'Várj a cooldown lejártáig, mielőtt újra queue-hoz csatlakozol.',
-                ephemeral=True
-            )
+        result = await evaluate_eligibility(self.member, self.gamemode, QUEUE_PLAYER_CHECKS)
+        if not result.ok:
+            await interaction.response.send_message(queue_denial_message(result, self.gamemode), ephemeral=True)
             return
-        player_rank = await get_player_rank_for_mode(self.linked_mc, self.gamemode)
-        if not can_join_queue(player_rank):
-            await interaction.response.send_message(
-                f'❌ Csak **LT5-HT4** közöttiek csatlakozhatnak a queue-hoz. '
-                f'Rangod: **{player_rank}** (minimum: LT5, maximum: HT4).',
-                ephemeral=True
-            )
+        if not queue.add_player(QueuePlayer(self.member.id, self.linked_mc)):
+            await interaction.response.send_message('Már benne vagy a queue-ban!', ephemeral=True)
+            self.stop()
             return
-        queue['players'].append(QueuePlayer(self.member.id, self.linked_mc))
         await update_queue_message(self.gamemode)
         await interaction.response.send_message(
-            f'✅ Beléptél a **{get_gamemode_display_name(self.gamemode)}** queue-ba játékosként!',
+            f'✅ Beléptél a **{get_gamemode_display_name(self.gamemode)}** queue-ba játékosként! '
+            f'Helyed: **#{queue.position(self.member.id)}**{other_queues_note(self.member.id, self.gamemode)}',
             ephemeral=True
         )
         self.stop()
@@ -5521,18 +8227,22 @@ class JoinAsChoiceView(discord.ui.View):
         if not queue:
             await interaction.response.send_message('A queue már nem létezik.', ephemeral=True)
             return
-        if any(p.discord_id == self.member.id for p in queue['players']):
+        role = queue.role_of(self.member.id)
+        if role == 'player':
             await interaction.response.send_message('Már benne vagy a queue-ban játékosként!', ephemeral=True)
             self.stop()
             return
-        if any(t.discord_id == self.member.id for t in queue.get('testers', [])):
+        if role == 'tester':
             await interaction.response.send_message('Már benna van a queue-ban teszterként!', ephemeral=True)
             self.stop()
             return
-        queue['testers'].append(QueuePlayer(self.member.id, self.linked_mc))
+        if not queue.add_tester(QueuePlayer(self.member.id, self.linked_mc)):
+            await interaction.response.send_message('Már benne vagy a queue-ban!', ephemeral=True)
+            self.stop()
+            return
         await update_queue_message(self.gamemode)
         await interaction.response.send_message(
-            f'✅ Beléptél teszterként a **{get_gamemode_display_name(self.gamemode)}** queue-ba!',
+            f'✅ Beléptél teszterként a **{get_gamemode_display_name(self.gamemode)}** queue-ba!{other_queues_note(self.member.id, self.gamemode)}',
             ephemeral=True
         )
         self.stop()
@@ -0,0 +1,21 @@
+-- Case-insensitive unique key for the tests table.
+--
+-- The bot upserts test results on (username_lower, gamemode), so "Steve" and
+-- "steve" are one player while the username column keeps the display case the
+-- website, /profile and /spin show.
+--
+-- init_db applies this file on DATABASE_URL at every startup (it is idempotent).
+-- On a Supabase-only deployment run it once in the SQL editor; until then the
+-- bot writes tests rows with a lookup followed by an update or insert.
+
+-- 1. Case-folded copy of username, maintained by Postgres (the website's writes get it too)
+ALTER TABLE tests ADD COLUMN IF NOT EXISTS username_lower TEXT GENERATED ALWAYS AS (lower(username)) STORED;
+
+-- 2. Drop case duplicates, keeping the newest row per (username_lower, gamemode)
+DELETE FROM tests a USING tests b
+WHERE a.username_lower = b.username_lower AND a.gamemode = b.gamemode
+  AND (COALESCE(a.created_at, '-infinity'), a.id) < (COALESCE(b.created_at, '-infinity'), b.id);
+
+-- 3. Conflict target for the upserts (PostgREST: on_conflict=username_lower,gamemode)
+DROP INDEX IF EXISTS idx_tests_username_lower_gamemode;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tests_username_key ON tests (username_lower, gamemode);